@@ -1,17 +1,41 @@
-import json
-from flask import Flask, request, jsonify, Response, stream_with_context
+from flask import Flask, request, jsonify, Response, stream_with_context, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 from enum import Enum
+import functools
 import os
+import threading
+import time
+import uuid
 try:
     from .prototyper import Prototyper
     from .debugger import debug_with_scrapybara
+    from .scheduler import run_tickets
+    from .llm import response_cache, gateway
+    from .progress import sse_stream
+    from .sessions import SessionRegistry, DEFAULT_PROJECT, session_slug
+    from .batch import BatchRun, BATCH_ROOT, BATCH_CONCURRENCY
+    from .jobs import JobManager, Job, QueueFull
+    from .vm_pool import get_pool
+    from .bundler import build, build_dir
+    from .workspace import Workspace
+    from .router import token_budget
+    from . import telemetry
 except:
     from prototyper import Prototyper
     from debugger import debug_with_scrapybara
+    from scheduler import run_tickets
+    from llm import response_cache, gateway
+    from progress import sse_stream
+    from sessions import SessionRegistry, DEFAULT_PROJECT, session_slug
+    from batch import BatchRun, BATCH_ROOT, BATCH_CONCURRENCY
+    from jobs import JobManager, Job, QueueFull
+    from vm_pool import get_pool
+    from bundler import build, build_dir
+    from workspace import Workspace
+    from router import token_budget
+    import telemetry
     
-import scrapybara
 
 load_dotenv(dotenv_path="../.env")
 
@@ -24,170 +48,504 @@ SCRAPYBARA_API_KEY = os.getenv("SCRAPYBARA_API_KEY")
 app = Flask(__name__)
 
 CORS(app, resources={r"/*": {"origins": "*"}})
-prototyper = None
-progress_messages = []
+sessions = SessionRegistry()
+jobs = JobManager()
+batches = {}
 
 class MessageTypes(Enum):
     SETTING_UP = "setting_up"
     NEW_TICKET = "new_ticket"
+    TICKET_PROGRESS = "ticket_progress"
+    FILE_UPDATED = "file_updated"
     TICKET_COMPLETED = "ticket_completed"
     ERROR = "error"
     DEBUG = "debug"
     ITERATE = "iterate"
     COMPLETED = "completed"
 
-@app.route('/prototype/create', methods=['POST'])
-def prototype():
-    global prototyper
-    global progress_messages
-    try:
-        scrapybara_client = scrapybara.Scrapybara()
-        scrapybara_instance = scrapybara_client.start_ubuntu(timeout_hours=0.2)
-
-        data = request.get_json()
-        user_prompt = data.get("user_prompt")
-        project_name = data.get("project_name")
-        
-        if not user_prompt:
-            return jsonify({"error": "Missing 'user_prompt' in request"}), 400
-            
-        progress_messages.clear()
-
-        prototyper = Prototyper(user_prompt, scrapybara_client, scrapybara_instance, name=project_name)
-        
-        progress_messages.append({
-            "type": MessageTypes.SETTING_UP.value,
-            "message": "I am setting up the repository..."
-        })
-        prototyper.setup_repo()
+TEXT_FLUSH_INTERVAL = 0.25
+# audit -> optimization tickets rounds after the feature tickets
+PERF_AUDIT_ROUNDS = int(os.getenv("PERF_AUDIT_ROUNDS", "1"))
+
+
+def stream_callbacks(progress_messages):
+    """Relays a ticket's streamed output to the progress feed.
+
+    Returns (on_text, on_file, flush) for run_tickets. Text fragments are batched
+    so a ticket adds at most one progress message per TEXT_FLUSH_INTERVAL.
+    """
+    pending_text = {}
+    last_flush = {}
+
+    def flush(ticket):
+        text = pending_text.pop(ticket.id, "")
+        if text:
+            progress_messages.append({
+                "type": MessageTypes.TICKET_PROGRESS.value,
+                "ticket": ticket.id,
+                "message": text,
+            })
+        last_flush[ticket.id] = time.time()
+
+    def on_text(ticket, fragment):
+        pending_text[ticket.id] = pending_text.get(ticket.id, "") + fragment
+        if time.time() - last_flush.get(ticket.id, 0) >= TEXT_FLUSH_INTERVAL:
+            flush(ticket)
+
+    def on_file(ticket, file_path):
+        flush(ticket)
         progress_messages.append({
-            "type": MessageTypes.SETTING_UP.value,
-            "message": "I have finished setting up the initial repository!"
+            "type": MessageTypes.FILE_UPDATED.value,
+            "ticket": ticket.id,
+            "message": f"Generated changes to {os.path.basename(file_path)} for ticket: {ticket.summary}",
         })
-        prototyper.repo_summary = "a 3D interactive scene using Three.js, featuring a large green ground plane, a sky-blue background, and a perspective camera positioned at human eye level. Users can navigate using WASD and arrow keys for movement and OrbitControls for mouse-based rotation. The scene includes ambient and directional lighting to enhance realism. "
-        
+
+    return on_text, on_file, flush
+
+
+def optimize_performance(job, prototyper, progress_messages, **callbacks):
+    """Audits the rendered scene and runs optimization tickets for the budgets it
+    misses, through the same callbacks as the feature tickets."""
+    for _ in range(PERF_AUDIT_ROUNDS):
+        job.check_cancelled()
+        tickets = prototyper.audit_performance()
+        if not tickets:
+            return
         progress_messages.append({
-            "type": MessageTypes.SETTING_UP.value,
-            "message": "I am creating the tickets for this project..."
+            "type": MessageTypes.DEBUG.value,
+            "message": f"The scene misses {len(prototyper.perf_report['violations'])} performance budgets, I am optimizing it with {len(tickets)} tickets."
         })
-        prototyper.create_tickets()
+        run_tickets(tickets, prototyper.workspace, prototyper.repo_summary, **callbacks)
+
+
+def session_budget(pipeline):
+    """Charges the LLM calls of pipeline(job, session, ...) to the session's token budget."""
+    @functools.wraps(pipeline)
+    def wrapper(job, session, *args):
+        with token_budget(session.token_budget):
+            return pipeline(job, session, *args)
+    return wrapper
+
+
+def create_pipeline(job, session, user_prompt, use_cache):
+    # a warm instance is leased for the whole run and goes back to the pool after
+    with get_pool().lease() as (scrapybara_client, scrapybara_instance):
+        try:
+            return build_prototype(job, session, user_prompt, use_cache, scrapybara_client, scrapybara_instance)
+        finally:
+            if session.prototyper:
+                # later debugging leases its own instance
+                session.prototyper.scrapybara_instance = None
+
+
+@session_budget
+def build_prototype(job, session, user_prompt, use_cache, scrapybara_client, scrapybara_instance):
+    progress_messages = session.progress
+    job.check_cancelled()
+
+    prototyper = Prototyper(user_prompt, scrapybara_client, scrapybara_instance, name=session.name, use_cache=use_cache, repo_path=session.repo_path)
+    session.prototyper = prototyper
+    
+    progress_messages.append({
+        "type": MessageTypes.SETTING_UP.value,
+        "message": "I am setting up the repository..."
+    })
+    prototyper.setup_repo()
+    progress_messages.append({
+        "type": MessageTypes.SETTING_UP.value,
+        "message": "I have finished setting up the initial repository!"
+    })
+    prototyper.repo_summary = "a 3D interactive scene using Three.js, featuring a large green ground plane, a sky-blue background, and a perspective camera positioned at human eye level. Users can navigate using WASD and arrow keys for movement and OrbitControls for mouse-based rotation. The scene includes ambient and directional lighting to enhance realism. "
+    
+    progress_messages.append({
+        "type": MessageTypes.SETTING_UP.value,
+        "message": "I am creating the tickets for this project..."
+    })
+    job.check_cancelled()
+    prototyper.create_tickets()
+    progress_messages.append({
+        "type": MessageTypes.SETTING_UP.value,
+        "message": f"I have created {len(prototyper.tickets)} tickets for this project."
+    })
+    
+    # Store all ticket data
+    ticket_responses = []
+    on_text, on_file, flush = stream_callbacks(progress_messages)
+
+    def on_start(ticket):
+        job.check_cancelled()
+        # send initial data for the ticket to frontend
         progress_messages.append({
-            "type": MessageTypes.SETTING_UP.value,
-            "message": f"I have created {len(prototyper.tickets)} tickets for this project."
+            "type": MessageTypes.NEW_TICKET.value,
+            "message": f"Working on ticket: {ticket.description}"
         })
-        
-        # Store all ticket data
-        ticket_responses = []
-        
-        for ticket in prototyper.tickets:
-            # send initial data for the ticket to frontend
+
+    def on_complete(ticket, response):
+        flush(ticket)
+        job.check_cancelled()
+        accepted = {}
+        failure = debug_with_scrapybara(
+            prototyper.repo_path, ticket.description, prototyper.scrapybara_client, prototyper.scrapybara_instance,
+            workspace=prototyper.workspace,
+            accepted_render=prototyper.accepted_render(),
+            on_accepted=lambda render: accepted.update(render=render),
+        )
+        if failure:
+            # leave the repo as it was after the last accepted ticket
+            prototyper.rollback()
             progress_messages.append({
-                "type": MessageTypes.NEW_TICKET.value,
-                "message": f"Working on ticket: {ticket.description}"
+                "type": MessageTypes.DEBUG.value,
+                "message": f"Unable to debug output for {ticket.description}... rolled back to the last working version and aborting process right now",
             })
-            
-            response = ticket.complete(prototyper.repo_path, prototyper.repo_summary)
-
-            failure = debug_with_scrapybara(prototyper.repo_path, ticket.description, prototyper.scrapybara_client, prototyper.scrapybara_instance)
-            if failure:
-                progress_messages.append({
-                    "type": MessageTypes.DEBUG.value,
-                    "message": f"Unable to debug output for {ticket.description}... aborting process right now",
-                })
-                raise Exception("Debugging failed")
-            else:
-                ticket_responses.append({
-                    "ticket": f"Completed ticket: {ticket.description}",
-                    "internal_dialogue": response,
-                })
-                progress_messages.append({
-                    "type": MessageTypes.TICKET_COMPLETED.value,
-                    "message": f"Finished ticket: {ticket.description}",
-                    "details": response
-                })
-        
-        progress_messages.append({
-            "type": MessageTypes.COMPLETED.value,
-            "message": "All tickets completed!"
+            raise Exception("Debugging failed")
+        else:
+            prototyper.checkpoint(f"ticket {ticket.id}: {ticket.summary}", render=accepted.get("render"))
+            prototyper.bundle()
+            ticket_responses.append({
+                "ticket": f"Completed ticket: {ticket.description}",
+                "internal_dialogue": response,
+            })
+            progress_messages.append({
+                "type": MessageTypes.TICKET_COMPLETED.value,
+                "message": f"Finished ticket: {ticket.description}",
+                "details": response
+            })
+
+    run_tickets(prototyper.tickets, prototyper.workspace, prototyper.repo_summary, on_start=on_start, on_complete=on_complete, on_text=on_text, on_file=on_file)
+    optimize_performance(job, prototyper, progress_messages, on_start=on_start, on_complete=on_complete, on_text=on_text, on_file=on_file)
+    
+    progress_messages.append({
+        "type": MessageTypes.COMPLETED.value,
+        "message": "All tickets completed!"
+    })
+
+    if not os.path.exists(prototyper.repo_path):
+        raise Exception("Generated repository not found")
+
+    return {
+        "success": "Created repo",
+        "repo_path": prototyper.repo_path,
+        "ticket_responses": ticket_responses
+    }
+
+
+@session_budget
+def iterate_pipeline(job, session, user_prompt):
+    prototyper = session.prototyper
+    progress_messages = session.progress
+    prototyper.user_prompt = user_prompt
+    # the repo may have been edited in the dev console since the last run
+    prototyper.workspace.refresh()
+    prototyper.checkpoint("before iteration")
+
+    prototyper.summarize_repo()
+    job.check_cancelled()
+    prototyper.create_tickets()
+    
+    # Store all ticket data
+    ticket_responses = []
+    on_text, on_file, flush = stream_callbacks(progress_messages)
+    
+    def on_start(ticket):
+        job.check_cancelled()
+
+    def on_complete(ticket, response):
+        flush(ticket)
+        prototyper.checkpoint(f"ticket {ticket.id}: {ticket.summary}")
+        prototyper.bundle()
+        ticket_responses.append({
+            "ticket": f"Completed ticket: {ticket.description}",
+            "internal_dialogue": response,
         })
 
-        if os.path.exists(prototyper.repo_path):
-            return jsonify({
-                "success": "Created repo",
-                "repo_path": prototyper.repo_path,
-                "ticket_responses": ticket_responses
-            }), 200
-        else:
-            return jsonify({"error": "Generated repository not found"}), 500
-            
-    except Exception as e:
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+    run_tickets(prototyper.tickets, prototyper.workspace, prototyper.repo_summary, on_start=on_start, on_complete=on_complete, on_text=on_text, on_file=on_file)
+    optimize_performance(job, prototyper, progress_messages, on_start=on_start, on_complete=on_complete, on_text=on_text, on_file=on_file)
+    
+    if not os.path.exists(prototyper.repo_path):
+        raise Exception("Generated repository not found")
+
+    return {
+        "success": "Updated repo",
+        "repo_path": prototyper.repo_path,
+        "ticket_responses": ticket_responses
+    }
+
+
+def submit_job(kind, session, pipeline, *args):
+    """Runs pipeline in the background while holding the session lock.
+
+    The caller has already acquired session.lock; it is released once the job
+    ends, as is the session's progress channel.
+    """
+    def on_finish(job):
+        if job.status == Job.FAILED:
+            session.progress.append({
+                "type": MessageTypes.ERROR.value,
+                "message": f"An error occurred: {job.error}"
+            })
+        elif job.status == Job.CANCELLED:
+            session.progress.append({
+                "type": MessageTypes.ERROR.value,
+                "message": "The request was cancelled."
+            })
+        session.progress.close()
+        session.lock.release()
+
+    session.progress.reset()
+    try:
+        job = jobs.submit(kind, session.name, pipeline, session, *args, on_finish=on_finish)
+    except QueueFull as e:
+        session.progress.close()
+        session.lock.release()
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({"job_id": job.id, "status": job.status}), 202
+
+
+@app.route('/prototype/create', methods=['POST'])
+def prototype():
+    data = request.get_json(silent=True) or {}
+    user_prompt = data.get("user_prompt")
+    project_name = data.get("project_name")
+
+    if not user_prompt:
+        return jsonify({"error": "Missing 'user_prompt' in request"}), 400
+
+    session = sessions.open(project_name or DEFAULT_PROJECT)
+    if not session.lock.acquire(blocking=False):
+        return jsonify({"error": f"Project '{session.name}' is already being generated"}), 409
+
+    return submit_job("create", session, create_pipeline, user_prompt, data.get("use_cache", True))
     
 
 @app.route('/prototype/iterate', methods=['POST'])
 def iterate():
-    global prototyper
+    data = request.get_json(silent=True) or {}
+    user_prompt = data.get("user_prompt")
+
+    if not user_prompt:
+        return jsonify({"error": "Missing 'user_prompt' in request"}), 400
+
+    session = sessions.get(data.get("project_name") or DEFAULT_PROJECT)
+    if not session or not session.prototyper:
+        return jsonify({"error": "No prototype found for this project, create one first"}), 404
+    if not session.lock.acquire(blocking=False):
+        return jsonify({"error": f"Project '{session.name}' is already being generated"}), 409
+
+    return submit_job("iterate", session, iterate_pipeline, user_prompt)
+
+
+@app.route('/prototype/checkpoints', methods=['GET'])
+def prototype_checkpoints():
+    session = sessions.get(request.args.get("project") or DEFAULT_PROJECT)
+    if not session or not session.prototyper:
+        return jsonify({"error": "No prototype found for this project"}), 404
+    return jsonify({"checkpoints": session.prototyper.checkpoints}), 200
+
+
+@app.route('/prototype/rollback', methods=['POST'])
+def prototype_rollback():
+    data = request.get_json() or {}
+    session = sessions.get(data.get("project_name") or DEFAULT_PROJECT)
+    if not session or not session.prototyper:
+        return jsonify({"error": "No prototype found for this project"}), 404
+    if not session.lock.acquire(blocking=False):
+        return jsonify({"error": f"Project '{session.name}' is being generated"}), 409
     try:
-        data = request.get_json()
-        user_prompt = data.get("user_prompt")
-        
-        if not user_prompt:
-            return jsonify({"error": "Missing 'user_prompt' in request"}), 400
-        
-        prototyper.summarize_repo()
-        prototyper.create_tickets()
-        
-        # Store all ticket data
-        ticket_responses = []
-        
-        for ticket in prototyper.tickets:
-            # send initial data for the ticket to frontend
-            initial_data = {
-                "type": MessageTypes.NEW_TICKET.value,
-                "message": f"I am working on completing the following ticket: {ticket.description}",
-            }
-            
-            response = ticket.complete(prototyper.repo_path, prototyper.repo_summary)
-            
-            final_data = {
-                "type": MessageTypes.TICKET_COMPLETED.value,
-                "message": response
-            }
-            
-            ticket_responses.append({
-                "ticket": f"Completed ticket: {ticket.description}",
-                "internal_dialogue": response,
-            })
-        
-        if os.path.exists(prototyper.repo_path):
-            return jsonify({
-                "success": "Updated repo",
-                "repo_path": prototyper.repo_path,
-                "ticket_responses": ticket_responses
-            }), 200
+        if not session.prototyper.rollback(data.get("checkpoint")):
+            return jsonify({"error": "Rollback failed"}), 500
+        session.prototyper.bundle()
+    finally:
+        session.lock.release()
+    return jsonify({"success": "Rolled back", "repo_path": session.repo_path}), 200
+
+
+@app.route('/prototype/performance', methods=['GET'])
+def prototype_performance():
+    session = sessions.get(request.args.get("project") or DEFAULT_PROJECT)
+    if not session or not session.prototyper:
+        return jsonify({"error": "No prototype found for this project"}), 404
+    if session.prototyper.perf_report is None:
+        return jsonify({"error": "The prototype hasn't been audited yet"}), 404
+    return jsonify(session.prototyper.perf_report), 200
+
+
+@app.route('/prototype/build', methods=['GET'])
+def prototype_build():
+    session = sessions.get(request.args.get("project") or DEFAULT_PROJECT)
+    if not session or not session.prototyper:
+        return jsonify({"error": "No prototype found for this project"}), 404
+    manifest = session.prototyper.build_manifest or session.prototyper.bundle()
+    if manifest is None:
+        return jsonify({"error": "The prototype has no page to build"}), 404
+    return jsonify(manifest), 200
+
+
+@app.route('/prototype/preview/<project>/', defaults={"filename": "index.html"}, methods=['GET'])
+@app.route('/prototype/preview/<project>/<path:filename>', methods=['GET'])
+def prototype_preview(project, filename):
+    """Serves the bundled prototype. The project is part of the path so the page's
+    relative asset URLs stay within it; hashed assets may be cached for good,
+    the page itself is revalidated."""
+    session = sessions.get(project)
+    if not session:
+        return jsonify({"error": "No prototype found for this project"}), 404
+    if filename == "index.html" and not session.busy():
+        # picks up edits saved from the dev console; a no-op when nothing changed
+        if session.prototyper:
+            session.prototyper.workspace.refresh()
+            session.prototyper.bundle()
         else:
-            return jsonify({"error": "Generated repository not found"}), 500
-            
-    except Exception as e:
-        return jsonify({"error": f"An error occurred: {str(e)}"}), 500
+            workspace = Workspace(session.repo_path)
+            workspace.refresh()
+            try:
+                build(workspace)
+            except Exception as e:
+                print(f"[WARNING] Failed to bundle '{session.repo_path}': {e}")
+    response = send_from_directory(os.path.abspath(build_dir(session.repo_path)), filename)
+    if filename == "index.html":
+        response.headers["Cache-Control"] = "no-cache"
+    else:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@app.route('/batch', methods=['POST'])
+def batch_create():
+    """Starts (or, given the id of an earlier batch, resumes) a batch of prototypes."""
+    data = request.get_json() or {}
+    prompts = data.get("prompts") or []
+    if not prompts:
+        return jsonify({"error": "Missing 'prompts' in request"}), 400
+
+    batch_id = session_slug(data.get("batch_id") or str(uuid.uuid4()))
+    if batch_id in batches and not batches[batch_id].summary()["done"]:
+        return jsonify({"error": f"Batch '{batch_id}' is still running"}), 409
+
+    try:
+        concurrency = int(data.get("concurrency", BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'concurrency' must be an integer"}), 400
+    # a request can lower the concurrency but not raise it past the server's limit
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY))
+
+    items = [entry if isinstance(entry, dict) else {"prompt": entry} for entry in prompts]
+    run = BatchRun(items, os.path.join(BATCH_ROOT, batch_id), create_pipeline, concurrency, data.get("use_cache", True))
+    batches[batch_id] = run
+    threading.Thread(target=run.run, daemon=True).start()
+    return jsonify({"batch_id": batch_id, "prompts": len(run.items), "duplicates": len(run.duplicates)}), 202
+
+
+@app.route('/batch/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    run = batches.get(batch_id)
+    if run is None:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(run.summary()), 200
+
+
+@app.route('/jobs', methods=['GET'])
+def jobs_stats():
+    return jsonify(jobs.stats()), 200
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status == Job.SUCCEEDED:
+        return jsonify(job.result), 200
+    if job.status == Job.FAILED:
+        return jsonify({"error": f"An error occurred: {job.error}"}), 500
+    if job.status == Job.CANCELLED:
+        return jsonify({"error": "The request was cancelled"}), 409
+    return jsonify(job.to_dict()), 202
+
+
+@app.route('/jobs/<job_id>/trace', methods=['GET'])
+def job_trace(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.trace.to_dict()), 200
+
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
 
 
 @app.route('/prototype/progress', methods=['GET'])
 def prototype_progress():
-    def event_stream():
-        last_index = 0
-        while True:
-            while last_index < len(progress_messages):
-                msg = progress_messages[last_index]
-                last_index += 1
+    project_name = request.args.get("project") or DEFAULT_PROJECT
+    session = sessions.get(project_name)
+    if not session:
+        # a channel is only created with its session, so it is closed and released with it
+        return jsonify({"error": f"No project named '{project_name}'"}), 404
+    channel = session.progress
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id") or 0
+    try:
+        last_seq = int(last_event_id)
+    except ValueError:
+        last_seq = 0
+
+    return Response(
+        stream_with_context(sse_stream(channel, last_seq)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    snapshot = telemetry.metrics.snapshot()
+    snapshot["jobs"] = jobs.stats()
+    snapshot["llm_gateway"] = gateway.stats()
+    snapshot["llm_cache"] = response_cache.stats()
+    return jsonify(snapshot), 200
+
+
+@app.route('/sessions', methods=['GET'])
+def sessions_stats():
+    sessions.evict_idle()
+    return jsonify(sessions.stats()), 200
+
+
+@app.route('/vm/pool', methods=['GET'])
+def vm_pool_stats():
+    return jsonify(get_pool().stats()), 200
+
+
+@app.route('/llm/cache', methods=['GET'])
+def llm_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+
+@app.route('/llm/gateway', methods=['GET'])
+def llm_gateway_stats():
+    return jsonify(gateway.stats()), 200
 
-                yield f"data: {json.dumps(msg)}\n\n"
-                print(f"[INFO] yield {last_index-1}th progress message: {msg}")
-            import time
-            time.sleep(0.5)
 
-    return Response(stream_with_context(event_stream()), mimetype='text/event-stream')
+@app.route('/llm/cache', methods=['DELETE'])
+def llm_cache_clear():
+    response_cache.clear()
+    return jsonify({"success": "Cleared LLM response cache"}), 200
 
 
 if __name__ == '__main__':
+    # pre-warm instances in the serving process (not the debug reloader's parent)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_pool()
     app.run(debug=True, host='0.0.0.0', port=5001)
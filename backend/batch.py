@@ -0,0 +1,207 @@
+"""Generates one prototype per prompt of a JSONL file.
+
+Each line is {"prompt": "...", "name": "optional"} (or just a JSON string).
+Every prototype gets its own directory under the output directory, next to a
+results.jsonl log and a summary.json report:
+
+    python batch.py prompts.jsonl --output-dir ../batches/demo --concurrency 4
+
+Running the same command again resumes: prompts that already succeeded are
+skipped. Identical prompts (ignoring case and whitespace) are generated once.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+try:
+    from .jobs import JobManager, Job
+    from .sessions import Session, session_slug
+    from .progress import release
+except:
+    from jobs import JobManager, Job
+    from sessions import Session, session_slug
+    from progress import release
+
+# prototypes generated at once; LLM calls and VMs are further limited by the
+# gateway (OPENAI_MAX_IN_FLIGHT) and the instance pool (VM_POOL_MAX_SIZE)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_ROOT = os.getenv("BATCH_ROOT", "../batches")
+
+
+def prompt_key(prompt):
+    normalized = re.sub(r"\s+", " ", prompt).strip().lower()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def load_prompts(path):
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            items.append(entry if isinstance(entry, dict) else {"prompt": entry})
+    return items
+
+
+class BatchRun:
+    """Runs pipeline(job, session, prompt, use_cache) once per distinct prompt.
+
+    Results are appended to results.jsonl as each prototype finishes, so a
+    crashed run can be resumed by running it again over the same output_dir.
+    """
+
+    def __init__(self, items, output_dir, pipeline, concurrency=BATCH_CONCURRENCY, use_cache=True):
+        self.output_dir = output_dir
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.use_cache = use_cache
+        self.results_path = os.path.join(output_dir, "results.jsonl")
+        self.items = []
+        self.duplicates = []
+        self.results = {}
+        self.jobs = {}
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+        seen = {}
+        for entry in items:
+            prompt = (entry.get("prompt") or "").strip()
+            if not prompt:
+                continue
+            key = prompt_key(prompt)
+            if key in seen:
+                self.duplicates.append({"prompt": prompt, "duplicate_of": seen[key]["name"]})
+                continue
+            name = f"{session_slug(entry.get('name') or ' '.join(prompt.split()[:6]))[:48]}-{key[:8]}"
+            seen[key] = {"key": key, "name": name, "prompt": prompt}
+            self.items.append(seen[key])
+
+    def load_results(self):
+        """Latest recorded result per prompt key."""
+        results = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a line cut short by a crash
+                        continue
+                    results[result["key"]] = result
+        return results
+
+    def _record(self, result):
+        with self._lock:
+            self.results[result["key"]] = result
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(result) + "\n")
+
+    def _run_item(self, job, item):
+        session = Session(f"batch-{item['name']}", os.path.join(self.output_dir, item["name"]))
+        try:
+            return self.pipeline(job, session, item["prompt"], self.use_cache)
+        finally:
+            session.progress.close()
+            release(session.progress)
+
+    def _on_finish(self, item, job):
+        root = next((span for span in job.trace.spans if span.parent_id is None), None)
+        counters = root.counters if root else {}
+        self._record({
+            "key": item["key"],
+            "name": item["name"],
+            "prompt": item["prompt"],
+            "status": job.status,
+            "error": job.error,
+            "repo_path": os.path.join(self.output_dir, item["name"], "product"),
+            "wall_seconds": (job.finished_at or time.time()) - (job.started_at or job.created_at),
+            "prompt_tokens": counters.get("prompt_tokens", 0),
+            "completion_tokens": counters.get("completion_tokens", 0),
+            "cached_tokens": counters.get("cached_tokens", 0),
+        })
+        try:
+            job.trace.save(os.path.join(self.output_dir, item["name"]))
+        except Exception as e:
+            print(f"[WARNING] Failed to save trace for '{item['name']}': {e}")
+        print(f"[INFO] {job.status}: {item['name']}")
+
+    def run(self):
+        """Generates every prompt without a successful result and returns the summary."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started_at = time.time()
+        self.results = self.load_results()
+        pending = [item for item in self.items if self.results.get(item["key"], {}).get("status") != Job.SUCCEEDED]
+        print(f"[INFO] {len(self.items)} prompts ({len(self.duplicates)} duplicates dropped), {len(self.items) - len(pending)} already done.")
+
+        manager = JobManager(max_workers=self.concurrency, max_queued=max(len(pending), 1))
+        for item in pending:
+            job = manager.submit("batch", item["name"], self._run_item, item, on_finish=lambda job, item=item: self._on_finish(item, job))
+            self.jobs[item["key"]] = job
+        for job in self.jobs.values():
+            job.future.result()
+
+        self.finished_at = time.time()
+        summary = self.summary()
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+    def summary(self):
+        with self._lock:
+            results = [self.results[item["key"]] for item in self.items if item["key"] in self.results]
+        counts = {}
+        for result in results:
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+        running = sum(1 for job in self.jobs.values() if not job.finished())
+        return {
+            "output_dir": self.output_dir,
+            "prompts": len(self.items),
+            "duplicates": self.duplicates,
+            "counts": counts,
+            "running": running,
+            "done": self.finished_at is not None,
+            "wall_seconds": ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0,
+            "prompt_tokens": sum(result["prompt_tokens"] for result in results),
+            "completion_tokens": sum(result["completion_tokens"] for result in results),
+            "cached_tokens": sum(result.get("cached_tokens", 0) for result in results),
+            "results": results,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a prototype for every prompt in a JSONL file.")
+    parser.add_argument("prompts", help="JSONL file with one prompt per line")
+    parser.add_argument("--output-dir", help=f"defaults to {BATCH_ROOT}/<prompts file name>")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--no-cache", action="store_true", help="don't serve LLM responses from the cache")
+    args = parser.parse_args(argv)
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    prompts_path = os.path.abspath(args.prompts)
+    if args.output_dir:
+        output_dir = os.path.abspath(args.output_dir)
+    else:
+        output_dir = os.path.join(backend_dir, BATCH_ROOT, os.path.splitext(os.path.basename(prompts_path))[0])
+    # the pipeline resolves the template relative to the backend
+    os.chdir(backend_dir)
+    try:
+        from .app import create_pipeline
+    except:
+        from app import create_pipeline
+
+    run = BatchRun(load_prompts(prompts_path), output_dir, create_pipeline, args.concurrency, use_cache=not args.no_cache)
+    summary = run.run()
+    print(f"[INFO] {summary['counts']} in {summary['wall_seconds']:.1f}s, "
+          f"{summary['prompt_tokens']} prompt / {summary['completion_tokens']} completion tokens. "
+          f"Report: {os.path.join(output_dir, 'summary.json')}")
+    return 0 if summary["counts"].get(Job.SUCCEEDED, 0) == summary["prompts"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,550 @@
+"""Offline benchmark of the create and iterate pipelines.
+
+Runs every prompt in the corpus through the real pipeline (Prototyper, tickets,
+scheduler, debugger) with the OpenAI API and Scrapybara replaced by local
+stand-ins that replay recorded responses with injected latencies. Requests
+without a recording get a synthetic response of the right shape, so the suite
+runs on a machine without network access or recordings.
+
+    python benchmark.py                                   # print the report
+    python benchmark.py --output benchmarks/baseline.json # save a baseline
+    python benchmark.py --baseline benchmarks/baseline.json --tolerance 0.2
+    python benchmark.py --record                          # record fixtures against the real APIs
+    python benchmark.py --record-synthetic                # save the synthetic responses as fixtures
+
+With --baseline the exit status is 1 when wall time, tokens or peak memory of
+a flow grew by more than the tolerance. CI runs the corpus with --strict
+against the committed fixtures and baseline, so a change to a prompt needs
+its fixtures recorded again and a new baseline.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(BACKEND_DIR, "benchmarks")
+CORPUS_PATH = os.path.join(BENCHMARK_DIR, "prompts.jsonl")
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+# a fixed path: prompts name files by their full path, and fixtures are keyed by the prompt
+WORKSPACE_DIR = os.path.join(tempfile.gettempdir(), "prototyp3d_benchmark")
+# characters per streamed chunk, about what the API sends
+CHUNK_CHARS = 16
+
+# replays never reach the API, but the client is still built at import
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+try:
+    from . import llm
+    from .llm_gateway import LLMGateway
+    from .vm_pool import FakeScrapybara, InstancePool
+    from .sessions import Session
+    from .jobs import JobManager, Job
+    from .app import build_prototype, iterate_pipeline
+except:
+    import llm
+    from llm_gateway import LLMGateway
+    from vm_pool import FakeScrapybara, InstancePool
+    from sessions import Session
+    from jobs import JobManager, Job
+    from app import build_prototype, iterate_pipeline
+
+
+def fixture_key(model, messages, params=None):
+    # streaming doesn't change the content, so streamed and plain requests share fixtures
+    params = {k: v for k, v in (params or {}).items() if k not in ("stream", "stream_options")}
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FixtureStore:
+    """Recorded responses, one <key>.json file per request."""
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+        self._fixtures = {}
+        self._lock = threading.Lock()
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                        self._fixtures[name[:-5]] = json.load(f)
+
+    def __len__(self):
+        return len(self._fixtures)
+
+    def get(self, key):
+        return self._fixtures.get(key)
+
+    def save(self, key, fixture):
+        with self._lock:
+            self._fixtures[key] = fixture
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{key}.json"), "w", encoding="utf-8") as f:
+                json.dump(fixture, f, indent=2)
+
+
+def _usage(prompt_tokens, completion_tokens, cached_tokens=0):
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+    )
+
+
+class PrefixCache:
+    """Emulates the API's prompt cache: the longest prefix a prompt shares with an
+    earlier one counts as cached, from 1024 tokens on and in steps of 128."""
+
+    MIN_TOKENS = 1024
+    STEP_TOKENS = 128
+
+    def __init__(self):
+        self._prompts = []
+        self._lock = threading.Lock()
+
+    def cached_tokens(self, model, messages):
+        prompt = model + "\n" + "\n".join(m["content"] for m in messages)
+        with self._lock:
+            shared = max((len(os.path.commonprefix([prompt, seen])) for seen in self._prompts), default=0)
+            self._prompts.append(prompt)
+        tokens = shared // 4
+        return tokens - tokens % self.STEP_TOKENS if tokens >= self.MIN_TOKENS else 0
+
+
+class ReplayClient:
+    """Stands in for openai.OpenAI, answering chat completions from a FixtureStore.
+
+    Each request waits first_token_latency, then produces its output at
+    tokens_per_second (0 for instant). With record_synthetic, synthesized
+    responses are saved as fixtures.
+    """
+
+    def __init__(self, fixtures, first_token_latency=0.0, tokens_per_second=0.0, synthesize=True, record_synthetic=False):
+        self.fixtures = fixtures
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.synthesize = synthesize
+        self.record_synthetic = record_synthetic
+        self.replayed = 0
+        self.synthesized = 0
+        self.prefix_cache = PrefixCache()
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream=False, **params):
+        key = fixture_key(model, messages, params)
+        fixture = self.fixtures.get(key)
+        cached = self.prefix_cache.cached_tokens(model, messages)
+        with self._lock:
+            if fixture is not None:
+                self.replayed += 1
+            elif self.synthesize:
+                self.synthesized += 1
+            else:
+                raise KeyError(f"No recorded response for this {model} request")
+        if fixture is None:
+            content = synthesize_response(messages)
+            fixture = {
+                "content": content,
+                "usage": {
+                    "prompt_tokens": sum(len(m["content"]) for m in messages) // 4,
+                    "completion_tokens": len(content) // 4,
+                },
+            }
+            if self.record_synthetic:
+                self.fixtures.save(key, fixture)
+
+        content = fixture["content"]
+        usage = _usage(fixture["usage"]["prompt_tokens"], fixture["usage"]["completion_tokens"], min(cached, fixture["usage"]["prompt_tokens"]))
+        time.sleep(self.first_token_latency)
+        if stream:
+            return self._stream(content, usage)
+        self._generate(content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+    def _generate(self, text):
+        if self.tokens_per_second:
+            time.sleep(len(text) / 4 / self.tokens_per_second)
+
+    def _stream(self, content, usage):
+        for start in range(0, len(content), CHUNK_CHARS):
+            piece = content[start:start + CHUNK_CHARS]
+            self._generate(piece)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece), finish_reason=None)], usage=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+class RecordingClient:
+    """Wraps a real openai.OpenAI and saves every response to a FixtureStore."""
+
+    def __init__(self, client, fixtures):
+        self.client = client
+        self.fixtures = fixtures
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream=False, **params):
+        key = fixture_key(model, messages, params)
+        if not stream:
+            response = self.client.chat.completions.create(model=model, messages=messages, **params)
+            usage = response.usage
+            self.fixtures.save(key, {
+                "content": response.choices[0].message.content or "",
+                "usage": {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens},
+            })
+            return response
+        return self._record_stream(key, self.client.chat.completions.create(model=model, messages=messages, stream=True, **params))
+
+    def _record_stream(self, key, response):
+        content = ""
+        usage = None
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content += chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                usage = chunk.usage
+            yield chunk
+        self.fixtures.save(key, {
+            "content": content,
+            "usage": {
+                "prompt_tokens": usage.prompt_tokens if usage else 0,
+                "completion_tokens": usage.completion_tokens if usage else len(content) // 4,
+            },
+        })
+
+
+class ReplayScrapybara(FakeScrapybara):
+    """FakeScrapybara whose act() replays recorded agent replies, falling back to act_text."""
+
+    def __init__(self, fixtures, record_synthetic=False, **kwargs):
+        super().__init__(**kwargs)
+        self.fixtures = fixtures
+        self.record_synthetic = record_synthetic
+
+    def act(self, **kwargs):
+        key = fixture_key("scrapybara", [{"role": "user", "content": kwargs.get("prompt", "")}])
+        fixture = self.fixtures.get(key)
+        if fixture is None and self.record_synthetic:
+            fixture = {"content": self.act_text}
+            self.fixtures.save(key, fixture)
+        time.sleep(self.act_latency)
+        return FakeScrapybara._Response(fixture["content"] if fixture else self.act_text)
+
+
+class RecordingScrapybara:
+    """Wraps a real Scrapybara client and saves the reply of every act() call."""
+
+    def __init__(self, client, fixtures):
+        self.client = client
+        self.fixtures = fixtures
+
+    def start_ubuntu(self, **kwargs):
+        return self.client.start_ubuntu(**kwargs)
+
+    def act(self, **kwargs):
+        response = self.client.act(**kwargs)
+        key = fixture_key("scrapybara", [{"role": "user", "content": kwargs.get("prompt", "")}])
+        self.fixtures.save(key, {"content": response.text})
+        return response
+
+
+# --- synthetic responses, shaped like what each prompt asks for ---
+
+FILE_BLOCK = re.compile(r"\*\*FILE PATH:\*\* (\S+)( \(excerpts\))?\n\*\*CONTENT START\*\*\n(.*?)\n\*\*CONTENT END\*\*", re.DOTALL)
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9]+", "_", text).strip("_").lower()[:40] or "feature"
+
+
+def _feature_code(summary):
+    name = _slug(summary)
+    return f"""
+// {summary}
+function add_{name}(scene) {{
+  const group = new THREE.Group();
+  const material = new THREE.MeshStandardMaterial({{ color: 0x8899aa }});
+  for (let i = 0; i < 12; i++) {{
+    const mesh = new THREE.Mesh(new THREE.BoxGeometry(1, 1 + (i % 4), 1), material);
+    mesh.position.set((i % 4) * 3 - 4.5, (1 + (i % 4)) / 2, Math.floor(i / 4) * 3 - 3);
+    group.add(mesh);
+  }}
+  scene.add(group);
+  return group;
+}}
+add_{name}(scene);
+"""
+
+
+def _json_block(payload):
+    return "```json\n" + json.dumps(payload, indent=2) + "\n```"
+
+
+def _synthesize_tickets(prompt):
+    request = re.search(r"\*\*\*USER INPUT STARTS\*\*\*\s*(.*?)\s*\*\*\*USER INPUT ENDS\*\*\*", prompt, re.DOTALL)
+    words = (request.group(1) if request else "the scene").split()
+    parts = [" ".join(words[i:i + 6]) for i in range(0, min(len(words), 18), 6)] or ["the scene"]
+    return _json_block({
+        "project": "Benchmark",
+        "tickets": [
+            {
+                "summary": f"Add {part}",
+                "description": f"Extend the Three.js scene in script.js so that it shows {part}. Keep the existing camera and controls working.",
+                "files": ["script.js"],
+                "depends_on": [0] if index == 2 else [],
+            }
+            for index, part in enumerate(parts)
+        ],
+    })
+
+
+def _synthesize_ticket(prompt):
+    summary = re.search(r"- Ticket Summary: (.*)", prompt)
+    summary = summary.group(1).strip() if summary else "Feature"
+    code = _feature_code(summary)
+    blocks = [(path, bool(excerpt), content) for path, excerpt, content in FILE_BLOCK.findall(prompt)]
+    scripts = [block for block in blocks if block[0].endswith(".js")] or blocks
+    dialogue = f"Added {summary.lower()} as a separate group added to the scene."
+    if not scripts:
+        return _json_block({"internal_dialogue": dialogue})
+    path, excerpt, content = scripts[0]
+
+    if '"edits"' not in prompt:
+        if excerpt:
+            return _json_block({"internal_dialogue": dialogue})
+        return _json_block({"internal_dialogue": dialogue, "updated_files": [{"file_path": path, "content": content + code}]})
+
+    # anchor the edit on the last line that is unique in what the prompt shows
+    lines = [line for line in content.split("\n") if line.strip() and not line.startswith("**LINES")]
+    anchor = next((line for line in reversed(lines) if content.count(line) == 1), None)
+    if anchor is None:
+        return _json_block({"internal_dialogue": dialogue, "new_files": [{"file_path": os.path.join(os.path.dirname(path), f"{_slug(summary)}.js"), "content": code}]})
+    return _json_block({"internal_dialogue": dialogue, "edits": [{"file_path": path, "search": anchor, "replace": anchor + "\n" + code}]})
+
+
+def _synthesize_fix(prompt):
+    # hands the code back unchanged, in the format get_fix_suggestions parses;
+    # the code comes after the format example, so the last match is the code
+    sections = []
+    for tag in ("HTML", "JS", "CSS"):
+        matches = re.findall(rf"\*\*\*{tag} STARTS\*\*\*\n(.*?)\n\s*\*\*\*{tag} ENDS\*\*\*", prompt, re.DOTALL)
+        sections.append(f"***{tag} STARTS***\n{matches[-1] if matches else ''}\n***{tag} ENDS***")
+    return "The scene looks correct, no changes needed.\n" + "\n".join(sections)
+
+
+def synthesize_response(messages):
+    prompt = messages[-1]["content"]
+    if '"tickets"' in prompt:
+        return _synthesize_tickets(prompt)
+    if "***HTML STARTS***" in prompt:
+        return _synthesize_fix(prompt)
+    if "summarizing code" in prompt:
+        paths = re.findall(r"^\s*File: (.+)$", prompt, re.MULTILINE)
+        return _json_block({"files": [{"file_path": path.strip(), "summary": f"Part of the Three.js scene ({path.strip()})."} for path in paths]})
+    if "**FILE PATH:**" in prompt:
+        return _synthesize_ticket(prompt)
+    return "{}"
+
+
+# --- running the corpus ---
+
+def load_corpus(path=CORPUS_PATH, limit=None):
+    with open(path, "r", encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    return corpus[:limit] if limit else corpus
+
+
+def create_flow(job, session, user_prompt, pool):
+    # same as app.create_pipeline, with the benchmark's pool instead of the global one
+    with pool.lease() as (scrapybara_client, scrapybara_instance):
+        try:
+            return build_prototype(job, session, user_prompt, False, scrapybara_client, scrapybara_instance)
+        finally:
+            if session.prototyper:
+                session.prototyper.scrapybara_instance = None
+
+
+def run_flow(kind, session, pipeline, *args):
+    """Runs one pipeline as a job and returns its measurements."""
+    manager = JobManager(max_workers=1, max_queued=1)
+    tracemalloc.start()
+    started = time.perf_counter()
+    job = manager.submit(kind, session.name, pipeline, session, *args)
+    job.future.result()
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    trace = job.trace.to_dict()
+    stages = {}
+    counters = {}
+    for span in trace["spans"]:
+        stage = stages.setdefault(span["name"], {"count": 0, "total_ms": 0.0})
+        stage["count"] += 1
+        stage["total_ms"] += span["duration_ms"]
+        if span["parent_id"] is None:
+            counters = span["counters"]
+
+    return {
+        "status": job.status,
+        "error": job.error,
+        "wall_seconds": wall,
+        "peak_memory_bytes": peak,
+        "prompt_tokens": counters.get("prompt_tokens", 0),
+        "completion_tokens": counters.get("completion_tokens", 0),
+        "cached_tokens": counters.get("cached_tokens", 0),
+        "llm_retries": counters.get("llm_retries", 0),
+        "workspace": session.prototyper.workspace.stats() if session.prototyper else None,
+        "stages": stages,
+    }
+
+
+def run_prompt(entry, workspace, pool, repeat):
+    """Runs create (and iterate, when the entry has an iterate prompt) `repeat` times; keeps the median run."""
+    runs = {"create": [], "iterate": []}
+    for attempt in range(repeat):
+        # every attempt works in the same, emptied directory, so they send the same prompts
+        directory = os.path.join(workspace, _slug(entry["name"]))
+        shutil.rmtree(directory, ignore_errors=True)
+        session = Session(f"{_slug(entry['name'])}_{attempt}", directory)
+        create = run_flow("create", session, create_flow, entry["prompt"], pool)
+        runs["create"].append(create)
+        if entry.get("iterate") and create["status"] == Job.SUCCEEDED:
+            runs["iterate"].append(run_flow("iterate", session, iterate_pipeline, entry["iterate"]))
+
+    results = {}
+    for kind, flow_runs in runs.items():
+        if flow_runs:
+            flow_runs.sort(key=lambda run: run["wall_seconds"])
+            results[kind] = flow_runs[len(flow_runs) // 2]
+    return results
+
+
+def totals(results):
+    """Sums each flow over the corpus."""
+    summed = {}
+    for prompt_results in results.values():
+        for kind, run in prompt_results.items():
+            total = summed.setdefault(kind, {"runs": 0, "failed": 0, "wall_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "peak_memory_bytes": 0, "stages": {}})
+            total["runs"] += 1
+            total["failed"] += run["status"] != Job.SUCCEEDED
+            total["wall_seconds"] += run["wall_seconds"]
+            total["prompt_tokens"] += run["prompt_tokens"]
+            total["completion_tokens"] += run["completion_tokens"]
+            total["cached_tokens"] += run.get("cached_tokens", 0)
+            total["peak_memory_bytes"] = max(total["peak_memory_bytes"], run["peak_memory_bytes"])
+            for name, stage in run["stages"].items():
+                summed_stage = total["stages"].setdefault(name, {"count": 0, "total_ms": 0.0})
+                summed_stage["count"] += stage["count"]
+                summed_stage["total_ms"] += stage["total_ms"]
+    return summed
+
+
+COMPARED_METRICS = ("wall_seconds", "prompt_tokens", "completion_tokens", "peak_memory_bytes")
+
+
+def find_regressions(current, baseline, tolerance, wall_tolerance=None):
+    """wall_tolerance, if given, replaces tolerance for wall time, which varies
+    more from run to run and machine to machine than tokens and memory."""
+    regressions = []
+    for kind, total in current.items():
+        base = baseline.get(kind)
+        if not base:
+            continue
+        if total["failed"] > base.get("failed", 0):
+            regressions.append(f"{kind}: {total['failed']} failed runs (baseline {base.get('failed', 0)})")
+        for metric in COMPARED_METRICS:
+            allowed = wall_tolerance if metric == "wall_seconds" and wall_tolerance is not None else tolerance
+            if base.get(metric) and total[metric] > base[metric] * (1 + allowed):
+                regressions.append(f"{kind}: {metric} {total[metric]:.2f} vs baseline {base[metric]:.2f} (+{total[metric] / base[metric] - 1:.0%})")
+    return regressions
+
+
+def print_report(summed, replay):
+    for kind, total in summed.items():
+        print(f"\n{kind}: {total['runs']} runs ({total['failed']} failed), {total['wall_seconds']:.2f}s wall, "
+              f"{total['prompt_tokens']} prompt ({total['cached_tokens']} cached) / {total['completion_tokens']} completion tokens, "
+              f"peak memory {total['peak_memory_bytes'] / 1e6:.1f} MB")
+        for name, stage in sorted(total["stages"].items(), key=lambda item: -item[1]["total_ms"]):
+            print(f"  {name:<28} {stage['count']:>5}x {stage['total_ms'] / 1000:>9.2f}s")
+    if replay is not None:
+        print(f"\nLLM responses: {replay.replayed} replayed, {replay.synthesized} synthesized")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the create and iterate pipelines.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--limit", type=int, help="only run the first N prompts")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per prompt; the median is reported")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds to the first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0, help="output speed, 0 for instant")
+    parser.add_argument("--vm-start-latency", type=float, default=0.0)
+    parser.add_argument("--vm-command-latency", type=float, default=0.0)
+    parser.add_argument("--act-latency", type=float, default=0.0)
+    parser.add_argument("--strict", action="store_true", help="fail requests without a recorded response instead of synthesizing one")
+    parser.add_argument("--record", action="store_true", help="call the real APIs and save their responses as fixtures")
+    parser.add_argument("--record-synthetic", action="store_true", help="save the responses synthesized for requests without a fixture")
+    parser.add_argument("--output", help="write the results as JSON (usable as a --baseline)")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative growth before a metric counts as a regression")
+    parser.add_argument("--wall-tolerance", type=float, help="allowed relative growth of wall time, if it differs from --tolerance")
+    args = parser.parse_args(argv)
+
+    # the pipeline resolves the template and its outputs relative to the backend
+    os.chdir(BACKEND_DIR)
+    fixtures = FixtureStore(args.fixtures)
+    replay = None
+    if args.record:
+        import openai
+        import scrapybara
+        llm.gateway = LLMGateway(client=RecordingClient(openai.OpenAI(), fixtures))
+        vm_client = RecordingScrapybara(scrapybara.Scrapybara(), fixtures)
+    else:
+        replay = ReplayClient(fixtures, args.llm_latency, args.llm_tokens_per_second, synthesize=not args.strict, record_synthetic=args.record_synthetic)
+        llm.gateway = LLMGateway(client=replay)
+        vm_client = ReplayScrapybara(fixtures, record_synthetic=args.record_synthetic, start_latency=args.vm_start_latency, command_latency=args.vm_command_latency, act_latency=args.act_latency)
+    print(f"[INFO] Loaded {len(fixtures)} fixtures.")
+
+    # size 0: each create starts its instance inside the run, so VM start time is measured
+    pool = InstancePool(vm_client, size=0, max_size=1)
+    results = {}
+    shutil.rmtree(WORKSPACE_DIR, ignore_errors=True)
+    try:
+        for entry in load_corpus(args.corpus, args.limit):
+            print(f"[INFO] Running '{entry['name']}'...")
+            results[entry["name"]] = run_prompt(entry, WORKSPACE_DIR, pool, args.repeat)
+    finally:
+        pool.shutdown()
+        shutil.rmtree(WORKSPACE_DIR, ignore_errors=True)
+
+    summed = totals(results)
+    print_report(summed, replay)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"totals": summed, "prompts": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["totals"]
+        regressions = find_regressions(summed, baseline, args.tolerance, args.wall_tolerance)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
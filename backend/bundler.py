@@ -0,0 +1,372 @@
+"""Builds a cacheable copy of a generated product.
+
+The product is edited as plain index.html / script.js / styles.css, with
+Three.js pulled from a CDN. build() writes a sibling directory (e.g.
+static/product_build for static/product) in which:
+
+- CDN scripts are vendored (downloaded once into VENDOR_DIR) and concatenated
+  with the other scripts they were loaded next to, in document order;
+- vendored and local code go to separate bundles, so the large vendor bundle
+  keeps its hash while the scene code changes;
+- bundles and stylesheets are minified, with esbuild when it is installed and
+  a conservative whitespace/comment stripper otherwise;
+- bundles up to INLINE_LIMIT_BYTES are inlined into index.html, larger ones
+  are written as <name>.<content hash>.js/.css so they can be cached forever.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+try:
+    from .patching import write_files_atomically
+    from . import telemetry
+except:
+    from patching import write_files_atomically
+    import telemetry
+
+VENDOR_DIR = os.getenv("BUNDLE_VENDOR_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".vendor"))
+INLINE_LIMIT_BYTES = int(os.getenv("BUNDLE_INLINE_LIMIT_BYTES", "4096"))
+VENDOR_TIMEOUT_SECONDS = float(os.getenv("BUNDLE_VENDOR_TIMEOUT_SECONDS", "15"))
+# a CDN that couldn't be reached isn't asked again for this long
+VENDOR_RETRY_SECONDS = 300
+ESBUILD_TIMEOUT_SECONDS = 30
+MANIFEST_NAME = "manifest.json"
+
+SCRIPT_TAG = re.compile(r"<script\b([^>]*)>\s*</script>", re.IGNORECASE)
+LINK_TAG = re.compile(r"<link\b([^>]*)/?>", re.IGNORECASE)
+SRC_ATTR = re.compile(r"""\bsrc\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+HREF_ATTR = re.compile(r"""\bhref\s*=\s*["']([^"']+)["']""", re.IGNORECASE)
+STYLESHEET_ATTR = re.compile(r"""\brel\s*=\s*["']stylesheet["']""", re.IGNORECASE)
+# scripts whose loading order or scope would change if they were merged
+UNBUNDLED_SCRIPT_ATTR = re.compile(r"""\b(type\s*=\s*["']module["']|async|defer|integrity)\b""", re.IGNORECASE)
+# what may sit between two tags for them to still count as adjacent
+GAP = re.compile(r"(\s|<!--.*?-->)*", re.DOTALL)
+
+_vendor_lock = threading.Lock()
+_vendor_failures = {}
+
+
+def build_dir(repo_path):
+    repo_path = os.path.normpath(repo_path)
+    return os.path.join(os.path.dirname(repo_path), f"{os.path.basename(repo_path)}_build")
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def esbuild_path():
+    frontend_bin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend", "node_modules", ".bin", "esbuild")
+    return os.getenv("ESBUILD_PATH") or shutil.which("esbuild") or (frontend_bin if os.path.exists(frontend_bin) else None)
+
+
+def fetch_vendor(url):
+    """Contents of a remote script, downloaded once and kept in VENDOR_DIR. None if it can't be fetched."""
+    path = os.path.join(VENDOR_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest()[:24])
+    with _vendor_lock:
+        if not os.path.exists(path):
+            if time.time() - _vendor_failures.get(url, 0) < VENDOR_RETRY_SECONDS:
+                return None
+            try:
+                response = requests.get(url, timeout=VENDOR_TIMEOUT_SECONDS)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                _vendor_failures[url] = time.time()
+                print(f"[WARNING] Could not vendor {url}, leaving it on the CDN: {e}")
+                return None
+            os.makedirs(VENDOR_DIR, exist_ok=True)
+            write_files_atomically({path: response.text})
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _esbuild(code, loader):
+    executable = esbuild_path()
+    if not executable:
+        return None
+    try:
+        result = subprocess.run(
+            [executable, f"--loader={loader}", "--minify", "--log-level=error"],
+            input=code, capture_output=True, text=True, timeout=ESBUILD_TIMEOUT_SECONDS,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"[WARNING] esbuild failed, falling back to the built-in minifier: {e}")
+        return None
+    if result.returncode != 0:
+        print(f"[WARNING] esbuild failed, falling back to the built-in minifier: {result.stderr.strip()}")
+        return None
+    return result.stdout
+
+
+# a "/" after one of these starts a regular expression rather than a division
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of", "void", "yield", "await")
+
+
+def _regex_allowed(out):
+    text = "".join(out[-16:]).rstrip()
+    if not text:
+        return True
+    if text[-1] in _REGEX_PRECEDERS:
+        return True
+    return re.search(r"(^|[^\w$])(" + "|".join(_REGEX_KEYWORDS) + r")$", text) is not None
+
+
+def _whitespace(out, line_break):
+    """Appends a run of whitespace as a single space or line break."""
+    if line_break:
+        if out and out[-1] == " ":
+            out.pop()
+        if out and out[-1] != "\n":
+            out.append("\n")
+    elif out and out[-1] not in (" ", "\n"):
+        out.append(" ")
+
+
+def strip_js(code):
+    """Drops comments and collapses whitespace, keeping line breaks so automatic
+    semicolon insertion behaves as before. Strings, template literals and
+    regular expressions are copied unchanged."""
+    out = []
+    i = 0
+    n = len(code)
+    while i < n:
+        c = code[i]
+        if c in "'\"`":
+            j = i + 1
+            while j < n and code[j] != c:
+                j += 2 if code[j] == "\\" else 1
+            out.append(code[i:j + 1])
+            i = j + 1
+        elif code.startswith("//", i):
+            j = code.find("\n", i)
+            i = n if j == -1 else j
+        elif code.startswith("/*", i):
+            j = code.find("*/", i + 2)
+            j = n if j == -1 else j + 2
+            _whitespace(out, "\n" in code[i:j])
+            i = j
+        elif c == "/" and _regex_allowed(out):
+            j = i + 1
+            in_class = False
+            while j < n and code[j] != "\n" and (in_class or code[j] != "/"):
+                if code[j] == "\\":
+                    j += 1
+                elif code[j] == "[":
+                    in_class = True
+                elif code[j] == "]":
+                    in_class = False
+                j += 1
+            out.append(code[i:j + 1])
+            i = j + 1
+        elif c.isspace():
+            j = i
+            while j < n and code[j].isspace():
+                j += 1
+            _whitespace(out, "\n" in code[i:j])
+            i = j
+        else:
+            out.append(c)
+            i += 1
+    return "".join(out).strip()
+
+
+CSS_TOKEN = re.compile(r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|/\*.*?\*/)""", re.DOTALL)
+
+
+def strip_css(code):
+    """Drops comments and collapses whitespace; strings are copied unchanged."""
+    # comments separate tokens like whitespace; strings are at the odd indices
+    parts = [""]
+    for i, token in enumerate(CSS_TOKEN.split(code)):
+        if i % 2 and not token.startswith("/*"):
+            parts += [token, ""]
+        else:
+            parts[-1] += " " if i % 2 else token
+    for i, part in enumerate(parts):
+        if i % 2:
+            continue
+        part = re.sub(r"\s+", " ", part)
+        part = re.sub(r"\s*([{};,>])\s*", r"\1", part)
+        parts[i] = part.replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def minify(code, loader):
+    minified = _esbuild(code, loader)
+    if minified is None:
+        minified = strip_js(code) if loader == "js" else strip_css(code)
+    return minified.strip()
+
+
+def strip_html(html):
+    """Drops comments and the whitespace between tags, outside of scripts and styles."""
+    parts = re.split(r"(<script\b.*?</script>|<style\b.*?</style>)", html, flags=re.DOTALL | re.IGNORECASE)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"<!--(?!\[if).*?-->", "", parts[i], flags=re.DOTALL)
+        # the whitespace around a script or style is between two tags as well
+        parts[i] = re.sub(r">\s+<", "><", parts[i]).strip()
+    return "".join(parts).strip()
+
+
+def _resolve_local(html_dir, reference, repo_path):
+    """Path of a repo-relative reference, or None for remote or out-of-repo ones."""
+    parsed = urlparse(reference)
+    if parsed.scheme or parsed.netloc or reference.startswith("/"):
+        return None
+    path = os.path.normpath(os.path.join(html_dir, parsed.path))
+    if os.path.relpath(path, repo_path).startswith(".."):
+        return None
+    return path
+
+
+def _runs(html, tags):
+    """Groups (start, end, ...) tags into runs of adjacent ones."""
+    runs = []
+    for tag in tags:
+        if runs and runs[-1][-1][1] <= tag[0] and GAP.fullmatch(html, runs[-1][-1][1], tag[0]):
+            runs[-1].append(tag)
+        else:
+            runs.append([tag])
+    return runs
+
+
+class Build:
+    def __init__(self):
+        self.assets = {}
+        self.inlined = 0
+        self.source_bytes = 0
+
+    def emit(self, name, extension, code):
+        """The tag that loads code, either inline or as a hashed file."""
+        if extension == "js":
+            if len(code.encode("utf-8")) <= INLINE_LIMIT_BYTES:
+                self.inlined += 1
+                return "<script>" + code.replace("</script", "<\\/script") + "</script>"
+            file_name = f"{name}.{content_hash(code)[:10]}.js"
+            self.assets[file_name] = code
+            return f'<script src="{file_name}"></script>'
+        if len(code.encode("utf-8")) <= INLINE_LIMIT_BYTES:
+            self.inlined += 1
+            return "<style>" + code.replace("</style", "<\\/style") + "</style>"
+        file_name = f"{name}.{content_hash(code)[:10]}.css"
+        self.assets[file_name] = code
+        return f'<link rel="stylesheet" href="{file_name}">'
+
+
+def _bundle_scripts(html, html_dir, workspace, build):
+    tags = []
+    for match in SCRIPT_TAG.finditer(html):
+        attrs = match.group(1)
+        src = SRC_ATTR.search(attrs)
+        if not src or UNBUNDLED_SCRIPT_ATTR.search(attrs):
+            continue
+        path = _resolve_local(html_dir, src.group(1), workspace.repo_path)
+        if path is not None:
+            code, vendored = workspace.read(path), False
+        elif urlparse(src.group(1)).scheme in ("http", "https"):
+            code, vendored = fetch_vendor(src.group(1)), True
+        else:
+            code = None
+        if code is not None:
+            build.source_bytes += len(code.encode("utf-8"))
+            tags.append((match.start(), match.end(), code, vendored, src.group(1)))
+
+    replacements = []
+    for run in _runs(html, tags):
+        # vendored and local code are bundled apart so each keeps its own hash
+        groups = []
+        for tag in run:
+            if groups and groups[-1][0][3] == tag[3]:
+                groups[-1].append(tag)
+            else:
+                groups.append([tag])
+        parts = []
+        for group in groups:
+            code = "\n;\n".join(
+                # vendored files that are already minified are left alone
+                tag[2] if tag[3] and ".min." in tag[4] else minify(tag[2], "js")
+                for tag in group
+            )
+            parts.append(build.emit("vendor" if group[0][3] else "bundle", "js", code))
+        replacements.append((run[0][0], run[-1][1], "\n".join(parts)))
+    return replacements
+
+
+def _bundle_styles(html, html_dir, workspace, build):
+    tags = []
+    for match in LINK_TAG.finditer(html):
+        attrs = match.group(1)
+        href = HREF_ATTR.search(attrs)
+        if not href or not STYLESHEET_ATTR.search(attrs):
+            continue
+        path = _resolve_local(html_dir, href.group(1), workspace.repo_path)
+        code = workspace.read(path) if path else None
+        if code is not None:
+            build.source_bytes += len(code.encode("utf-8"))
+            tags.append((match.start(), match.end(), code))
+
+    return [
+        (run[0][0], run[-1][1], build.emit("styles", "css", minify("\n".join(tag[2] for tag in run), "css")))
+        for run in _runs(html, tags)
+    ]
+
+
+def build(workspace, output_dir=None, force=False):
+    """Builds the product held by workspace into output_dir (build_dir() by default).
+
+    Nothing is rebuilt when the sources are unchanged since the last build.
+    Returns the build manifest, or None when the workspace has no HTML page.
+    """
+    output_dir = output_dir or build_dir(workspace.repo_path)
+    html_path = workspace.path("index.html")
+    if workspace.read(html_path) is None:
+        html_path = workspace.find(".html")
+    if html_path is None:
+        return None
+
+    sources = workspace.files()
+    inputs = content_hash(json.dumps({workspace.relative(path): content_hash(content) for path, content in sources.items()}, sort_keys=True))
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not force and os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("inputs") == inputs:
+            return manifest
+
+    with telemetry.span("bundle.build"):
+        html = strip_html(sources[html_path])
+        html_dir = os.path.dirname(html_path)
+        result = Build()
+        replacements = _bundle_scripts(html, html_dir, workspace, result) + _bundle_styles(html, html_dir, workspace, result)
+        for start, end, tag in sorted(replacements, reverse=True):
+            html = html[:start] + tag + html[end:]
+
+        manifest = {
+            "inputs": inputs,
+            "page": "index.html",
+            "assets": sorted(result.assets),
+            "inlined": result.inlined,
+            "source_bytes": result.source_bytes + len(sources[html_path].encode("utf-8")),
+            "output_bytes": len(html.encode("utf-8")) + sum(len(code.encode("utf-8")) for code in result.assets.values()),
+            "minifier": "esbuild" if esbuild_path() else "builtin",
+        }
+        os.makedirs(output_dir, exist_ok=True)
+        # assets first, so a served index.html never points at a file that isn't there yet
+        write_files_atomically({os.path.join(output_dir, name): code for name, code in result.assets.items()})
+        write_files_atomically({
+            os.path.join(output_dir, "index.html"): html,
+            manifest_path: json.dumps(manifest, indent=2),
+        })
+        keep = set(result.assets) | {"index.html", MANIFEST_NAME}
+        for name in os.listdir(output_dir):
+            if name not in keep and os.path.isfile(os.path.join(output_dir, name)):
+                os.remove(os.path.join(output_dir, name))
+    return manifest
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".llm_cache"))
+CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")
+# entries are written as {"created": ..., "response": ...}, so the timestamp is in the first bytes
+CREATED = re.compile(rb'^\{"created": ([0-9.eE+-]+)')
+
+
+class ResponseCache:
+    """On-disk cache of LLM responses, content-addressed by the request.
+
+    Entries written more than ttl_seconds ago are dropped, and once the cache
+    grows past max_bytes the least recently used entries are evicted. The
+    write time is stored in the entry; the file's mtime is the last use.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl_seconds=CACHE_TTL_SECONDS, max_bytes=CACHE_MAX_BYTES, bypass=CACHE_BYPASS):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model, system_prompt, user_prompt, params=None):
+        payload = json.dumps(
+            {"model": model, "system": system_prompt, "user": user_prompt, "params": params or {}},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        if self.bypass:
+            return None
+
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+                self.evictions += 1
+            return None
+
+        # bump the mtime so eviction is least-recently-used
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            # evicted since it was read, the response is still good
+            pass
+        with self._lock:
+            self.hits += 1
+        return entry["response"]
+
+    def set(self, key, response):
+        if self.bypass or not response:
+            return
+
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            # an entry is never used before it is written, so an old mtime means an old entry
+            if now - stat.st_mtime > self.ttl_seconds or now - self._created(path, stat) > self.ttl_seconds:
+                self._remove(path)
+                with self._lock:
+                    self.evictions += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        while total > self.max_bytes and entries:
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    @staticmethod
+    def _created(path, stat):
+        try:
+            with open(path, "rb") as f:
+                match = CREATED.match(f.read(64))
+        except FileNotFoundError:
+            match = None
+        return float(match.group(1)) if match else stat.st_mtime
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            self._remove(os.path.join(self.cache_dir, name))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "bypass": self.bypass,
+            }
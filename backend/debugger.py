@@ -1,17 +1,38 @@
 try:
     from .ticket import Ticket
+    from .llm import chatcompletion_text, LLMUnavailable
+    from .vm_pool import get_pool
+    from .vm_sync import sync, mark_stale, REMOTE_WORKSPACE
+    from .prevalidate import prevalidate, format_report
+    from . import visual
+    from . import telemetry
+    from .workspace import Workspace
+    from .prompts import PromptBuilder
+    from .router import BudgetExceeded
+    from .bundler import build, build_dir
 except:
     from ticket import Ticket
-import openai
-import requests
+    from llm import chatcompletion_text, LLMUnavailable
+    from vm_pool import get_pool
+    from vm_sync import sync, mark_stale, REMOTE_WORKSPACE
+    from prevalidate import prevalidate, format_report
+    import visual
+    import telemetry
+    from workspace import Workspace
+    from prompts import PromptBuilder
+    from router import BudgetExceeded
+    from bundler import build, build_dir
 from scrapybara import Scrapybara
 
 import os
+import shutil
+import tempfile
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from scrapybara.anthropic import Anthropic
 from scrapybara.tools import BashTool, ComputerTool, EditTool
 from scrapybara.prompts import UBUNTU_SYSTEM_PROMPT
-from playwright.sync_api import sync_playwright
 import re
 
 logging.basicConfig(
@@ -20,44 +41,45 @@ logging.basicConfig(
     format="%(asctime)s %(levelname)s: %(message)s",
 )
 
-def get_fix_suggestions(html_code: str, js_code: str, css_code: str, error_info: str, model_name: str = "o3-mini") -> str:
-    """Uses OpenAI API to suggest fixes for ESLint or image similarity issues."""
+# number of fixes requested per debug round; above 1 they are pre-validated and the best one is kept
+FIX_CANDIDATES = int(os.getenv("FIX_CANDIDATES", "1"))
+FIX_REASONING_EFFORTS = os.getenv("FIX_REASONING_EFFORTS", "high,medium,low").split(",")
+
+FIX_INSTRUCTIONS = """Provide debugging suggestions and code fixes for the issue given after the code, based on the current html, js, and css.
+
+Return the revised code in the following format:
+***HTML STARTS***
+html code
+***HTML ENDS***
+***JS STARTS***
+js code
+***JS ENDS***
+***CSS STARTS***
+css code
+***CSS ENDS***"""
+
+
+def get_fix_suggestions(html_code: str, js_code: str, css_code: str, error_info: str, model_name: str = None, use_cache: bool = True, reasoning_effort: str = None) -> str:
+    """Uses OpenAI API to suggest fixes for ESLint or image similarity issues.
+
+    The model and reasoning effort are routed by prompt size unless given.
+    """
     try:
-        response = openai.chat.completions.create(
+        prompt = (
+            PromptBuilder(FIX_INSTRUCTIONS)
+            .add_context("HTML", html_code)
+            .add_context("JS", js_code)
+            .add_context("CSS", css_code)
+            .add_task("ISSUE", error_info)
+            .build()
+        )
+        response_text = chatcompletion_text(
+            prompt,
             model=model_name,
-            reasoning_effort='high',
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""
-                    Provide debugging suggestions and code fixes for the following issue:
-                    {error_info} based on the current html, js, and css.
-
-                    ***HTML STARTS***
-                    {html_code}
-                    ***HTML ENDS***
-                    ***JS STARTS***
-                    {js_code}
-                    ***JS ENDS***
-                    ***CSS STARTS***
-                    {css_code}
-                    ***CSS ENDS***
-
-                    Return the revised code in the following format:
-                    ***HTML STARTS***
-                    html code
-                    ***HTML ENDS***
-                    ***JS STARTS***
-                    js code
-                    ***JS ENDS***
-                    ***CSS STARTS***
-                    css code
-                    ***CSS ENDS***
-                    """,
-                }
-            ],
+            use_cache=use_cache,
+            task="fix",
+            **({"reasoning_effort": reasoning_effort} if reasoning_effort else {}),
         )
-        response_text = response.choices[0].message.content
 
         # Extract HTML code between ***HTML STARTS*** and ***HTML ENDS***
         html_match = re.search(r'\*\*\*HTML STARTS\*\*\*\s*(.*?)\s*\*\*\*HTML ENDS\*\*\*', response_text, re.DOTALL)
@@ -72,91 +94,228 @@ def get_fix_suggestions(html_code: str, js_code: str, css_code: str, error_info:
         css_code = css_match.group(1).strip() if css_match else css_code
 
         return html_code, js_code, css_code
+    except (BudgetExceeded, LLMUnavailable):
+        raise
     except Exception as e:
         logging.error(f"OpenAI API error in get_fix_suggestions(): {e}")
         return "","",""
 
 
-def update_code(html_path: str, html_code: str, js_path: str, js_code: str, css_path: str, css_code: str) -> None:
-    """Writes the updated code to the HTML file."""
+def get_fix_candidates(html_code, js_code, css_code, error_info, count=FIX_CANDIDATES, model_name=None, use_cache=True):
+    """Requests `count` fixes concurrently, cycling through FIX_REASONING_EFFORTS.
+
+    Failed requests and duplicate fixes are dropped; LLMUnavailable is raised
+    only if every request failed.
+    """
+    efforts = [FIX_REASONING_EFFORTS[i % len(FIX_REASONING_EFFORTS)] for i in range(count)]
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        # repeats of an effort skip the cache, otherwise they'd return the same fix
+        futures = [
+            executor.submit(telemetry.propagate(get_fix_suggestions), html_code, js_code, css_code, error_info, model_name, use_cache and i < len(FIX_REASONING_EFFORTS), effort)
+            for i, effort in enumerate(efforts)
+        ]
+        results, errors = [], []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except LLMUnavailable as e:
+                errors.append(e)
+    if errors and not results:
+        raise errors[0]
+
+    candidates = []
+    for candidate in results:
+        if any(candidate) and candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def candidate_score(report):
+    """Orders pre-validation reports: clean loads first (smoother frames better), then inconclusive, then failures with fewer errors."""
+    if report["skipped"]:
+        return (1, 0)
+    if not report["ok"]:
+        return (0, -(len(report["page_errors"]) + len(report["console_errors"]) + len(report["failed_requests"])))
+    return (2, -report["frame_times"].get("p95_ms", 0))
+
+
+def prevalidate_candidate(repo_path, file_paths, candidate):
+    """Pre-validates a candidate fix in a scratch copy of the repo."""
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = os.path.join(scratch, os.path.basename(os.path.normpath(repo_path)))
+        shutil.copytree(repo_path, copy)
+        for path, code in zip(file_paths, candidate):
+            with open(os.path.join(copy, os.path.relpath(path, repo_path)), "w", encoding="utf-8") as f:
+                f.write(code)
+        return prevalidate(copy)
+
+
+@telemetry.traced("debug.fix")
+def best_fix(repo_path, file_paths, codes, error_info, count=FIX_CANDIDATES):
+    """Returns the fixed (html, js, css) for error_info.
+
+    With count > 1, the candidates are requested and pre-validated concurrently
+    and the one that loads best is returned, so a single agent evaluation covers
+    several attempts. The code is returned unchanged if every request failed.
+    """
+    if count <= 1:
+        return get_fix_suggestions(*codes, error_info)
+
+    candidates = get_fix_candidates(*codes, error_info, count=count)
+    if not candidates:
+        logging.error("No fix candidates received.")
+        return codes
+
+    with ThreadPoolExecutor(max_workers=len(candidates)) as executor:
+        screen = telemetry.propagate(lambda candidate: prevalidate_candidate(repo_path, file_paths, candidate))
+        reports = list(executor.map(screen, candidates))
+    # ties keep the request order, i.e. the higher reasoning effort
+    ranked = sorted(range(len(candidates)), key=lambda i: candidate_score(reports[i]), reverse=True)
+    for i in ranked:
+        logging.info(f"Fix candidate {i} ({FIX_REASONING_EFFORTS[i % len(FIX_REASONING_EFFORTS)]} effort): score {candidate_score(reports[i])}")
+    return candidates[ranked[0]]
+
+
+def build_workspace(workspace):
+    """A Workspace of the product's build, the minified and vendored page the preview
+    serves, so the agent tests what users load. The sources if it can't be built."""
+    try:
+        if build(workspace) is not None:
+            built = Workspace(build_dir(workspace.repo_path))
+            built.refresh()
+            return built
+    except Exception as e:
+        logging.error(f"Failed to build the product, testing its sources: {e}")
+    return workspace
+
+
+def act_step_recorder():
+    """on_step callback for scrapybara act() that prints each step and records how long it took."""
+    last_step = [time.time()]
+
+    def on_step(step):
+        print(step.text)
+        now = time.time()
+        telemetry.record("scrapybara.act_step", now - last_step[0], text=(step.text or "")[:200])
+        last_step[0] = now
+
+    return on_step
+
+
+def update_code(workspace: Workspace, html_path: str, html_code: str, js_path: str, js_code: str, css_path: str, css_code: str) -> None:
+    """Writes the updated code to the workspace and flushes it to disk."""
     try:
-        with open(html_path, "w") as f:
-            f.write(html_code)
-        with open(js_path, "w") as f:
-            f.write(js_code)
-        with open(css_path, "w") as f:
-            f.write(css_code)
+        workspace.write_many({html_path: html_code, js_path: js_code, css_path: css_code})
+        workspace.flush()
         logging.info("Code updated successfully.")
     except Exception as e:
         logging.error(f"Failed to update code: {e}")
 
 
-def rollback_to_last_version() -> None:
-    """Attempts to roll back to the last working JavaScript version."""
+def rollback_to_last_version(store, snapshot_id: str, repo_path: str) -> bool:
+    """Restores repo_path to a snapshot in store, rewriting only the files that differ."""
     try:
-        response = requests.get("/last-working-version")
-        js_code = response.text
-        exec(js_code)
-        logging.info("Rolled back to the last working version.")
+        written, removed = store.checkout(snapshot_id, repo_path)
+        logging.info(f"Rolled back to snapshot {snapshot_id[:12]} ({written} files written, {removed} removed).")
+        return True
     except Exception as e:
         logging.error(f"Rollback failed: {e}")
+        return False
 
-def debug_with_scrapybara(repo_path, ticket_description, scrapybara_client, instance, max_iterations = 2):
-    html_file = None
-    js_file = None
-    css_file = None
-
-    # Walk through the directory
-    for root, repo_path, files in os.walk(repo_path):
-        for file_name in files:
-            ext = os.path.splitext(file_name)[1].lower()
-            full_path = os.path.join(root, file_name)
-
-            if ext == ".html" and html_file is None:
-                html_file = full_path
-            elif ext == ".js" and js_file is None:
-                js_file = full_path
-            elif ext == ".css" and css_file is None:
-                css_file = full_path
-
-            if html_file and js_file and css_file:
-                break
-    
+def debug_with_scrapybara(repo_path, ticket_description, scrapybara_client=None, instance=None, max_iterations = 2, fix_candidates=FIX_CANDIDATES, workspace=None, accepted_render=None, on_accepted=None):
+    """Tests the repo against a ticket and fixes it; returns None once it passes.
+
+    accepted_render is the fingerprint of the state before the ticket, which
+    renders are checked against for regressions; on_accepted(render) gets the
+    fingerprint of the state that passed.
+    """
+    if instance is None:
+        # no instance from the caller, lease a warm one for this run
+        with get_pool().lease() as (scrapybara_client, instance):
+            return debug_with_scrapybara(repo_path, ticket_description, scrapybara_client, instance, max_iterations, fix_candidates, workspace, accepted_render, on_accepted)
+
+    if workspace is None:
+        workspace = Workspace(repo_path)
+        workspace.refresh()
+
+    html_file = workspace.find(".html")
+    js_file = workspace.find(".js")
+    css_file = workspace.find(".css")
+    file_paths = (html_file, js_file, css_file)
     iterations = 0
+    # fingerprint of the render the agent last rated
+    last_rated = None
 
     while iterations < max_iterations:
+        iteration_span = telemetry.start_span("debug.iteration", iteration=iterations)
         try:
-            with open(html_file, "r", encoding="utf-8") as file:
-                html_code = file.read()
-            with open(js_file, "r", encoding="utf-8") as file:
-                js_code = file.read()
-            with open(css_file, "r", encoding="utf-8") as file:
-                css_code = file.read()
-        
+            html_code, js_code, css_code = (workspace.read(path) if path else None for path in file_paths)
+            if None in (html_code, js_code, css_code):
+                raise FileNotFoundError
 
-            instance_paths = [("index.html",html_code), ("script.js",js_code), ("styling.css", css_code)]
-            for instance_path,code in instance_paths:
-                instance.file.write(
-                        path = instance_path,
-                        content=code
-                    )
-            #find files and run server
-            path = instance.bash(command="find ~ -type f -name \"index.html\"")
-            directory = os.path.dirname(path["output"])
-            instance.bash(command=f'cd {directory}')
+            # catch load-time breakage locally before paying for an agent session
+            with telemetry.span("debug.prevalidate"):
+                report = prevalidate(repo_path, on_loaded=visual.capture_viewpoints if visual.available() else None)
+            if report["skipped"]:
+                logging.info(f"Skipped local pre-validation: {report['skipped']}")
+            elif not report["ok"]:
+                error_info = format_report(report)
+                logging.info(f"Local pre-validation failed:\n{error_info}")
+                html_code, js_code, css_code = best_fix(repo_path, file_paths, (html_code, js_code, css_code), error_info, fix_candidates)
+                update_code(workspace, html_file, html_code, js_file, js_code, css_file, css_code)
+                iterations += 1
+                continue
+            else:
+                logging.info(f"Local pre-validation passed, frame times: {report['frame_times']}")
 
+            render = visual.fingerprint(report["loaded"])
+            visual_note = ""
+            if render and accepted_render:
+                comparison = visual.compare(render, accepted_render)
+                if comparison["regression"]:
+                    logging.info(f"Visual regression against the last accepted render: {comparison['regression']}")
+                    html_code, js_code, css_code = best_fix(repo_path, file_paths, (html_code, js_code, css_code), f"After the latest change {comparison['regression']}. Make sure the scene still renders.", fix_candidates)
+                    update_code(workspace, html_file, html_code, js_file, js_code, css_file, css_code)
+                    iterations += 1
+                    continue
+                if comparison["drastic"]:
+                    # may be exactly what the ticket asked for, so the agent decides
+                    logging.info(f"Large visual change against the last accepted render: {comparison['drastic']}")
+                    visual_note = f" Compared with the scene before this change, {comparison['drastic']}; check whether the requirements call for that and lower the rating if they don't."
+
+            if render and last_rated and visual.compare(render, last_rated["render"])["unchanged"]:
+                # the fix didn't change what is on screen, so the agent would see the same scene
+                logging.info("Render is unchanged since the last agent evaluation, reusing its rating.")
+                if last_rated["rating"] < 6:
+                    html_code, js_code, css_code = best_fix(repo_path, file_paths, (html_code, js_code, css_code), last_rated["feedback"], fix_candidates)
+                    update_code(workspace, html_file, html_code, js_file, js_code, css_file, css_code)
+                    iterations += 1
+                    continue
+                if on_accepted:
+                    on_accepted(render)
+                return None
         
-            response = scrapybara_client.act(
-                model= Anthropic(),
-                tools=[
-                    BashTool(instance),
-                    ComputerTool(instance),
-                    EditTool(instance),
-                ],
-                system=UBUNTU_SYSTEM_PROMPT,
-                prompt=f'an app contained by index.html, script.js, and styling.css are in the directory {directory}. This is an app that should fulfill these requirements: {ticket_description} \n Please run this app on a local host. Check that the features are working as requested by taking screenshots and validating that they match the description. Check that the functionality such as buttons actually work on press. Rate how closely the app aligns with the requirements based on your interactions with it from 1 to 10. Return a short summary of any missing requirements or errors and return the rating in the format ***RATING START*** x/10 ***RATING END***.',
-                on_step=lambda step: print(step.text),
-            )
+
+            # only what changed since the last upload to this instance is sent
+            remote_files = build_workspace(workspace)
+            sync_stats = sync(instance, remote_files)
+            logging.info(f"Synced the product to {REMOTE_WORKSPACE}: {sync_stats}")
+            file_list = ", ".join(remote_files.relative(path) for path in remote_files.paths())
+            # the agent can edit files on the instance
+            mark_stale(instance)
+
+            with telemetry.span("scrapybara.act"):
+                response = scrapybara_client.act(
+                    model= Anthropic(),
+                    tools=[
+                        BashTool(instance),
+                        ComputerTool(instance),
+                        EditTool(instance),
+                    ],
+                    system=UBUNTU_SYSTEM_PROMPT,
+                    prompt=f'an app contained by {file_list} is in the directory {REMOTE_WORKSPACE}. This is an app that should fulfill these requirements: {ticket_description} \n Please run this app on a local host. Check that the features are working as requested by taking screenshots and validating that they match the description. Check that the functionality such as buttons actually work on press. Rate how closely the app aligns with the requirements based on your interactions with it from 1 to 10. Return a short summary of any missing requirements or errors and return the rating in the format ***RATING START*** x/10 ***RATING END***.' + visual_note,
+                    on_step=act_step_recorder(),
+                )
         
             logging.info(response.text)
             logging.info("Tested successfully using Scrapybara.")
@@ -165,22 +324,29 @@ def debug_with_scrapybara(repo_path, ticket_description, scrapybara_client, inst
             match = re.search(r'\*\*\*RATING START\*\*\*\s*(\d+)/10\s*\*\*\*RATING END\*\*\*', response.text)
             if match:
                 rating = int(match.group(1))
+            last_rated = {"render": render, "rating": rating, "feedback": response.text}
 
             if rating < 6:
-                html_code, js_code, css_code= get_fix_suggestions(html_code, js_code, css_code, response.text)
-                update_code(html_file, html_code, js_file, js_code, css_file, css_code)
+                html_code, js_code, css_code = best_fix(repo_path, file_paths, (html_code, js_code, css_code), response.text, fix_candidates)
+                update_code(workspace, html_file, html_code, js_file, js_code, css_file, css_code)
                 iterations+=1  
             else:
+                if on_accepted and render:
+                    on_accepted(render)
                 logging.error("No fix suggestions received from image debug loop.")
                 print("No fix suggestions received from image debug loop.")
                 return None
         except FileNotFoundError:
             print("Error: The file was not found.")
             raise FileNotFoundError
+        except (BudgetExceeded, LLMUnavailable):
+            raise
         except Exception as e:
             logging.error(f"Error reading file or responding: {e}")
             print(f"Error reading file or responding: {e}")
             return "Failed"
+        finally:
+            telemetry.end_span(iteration_span)
 
 # if __name__ == "__main__":
 #     html_file = "prototype.html"
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from .telemetry import Trace, tracing, span
+except:
+    from telemetry import Trace, tracing, span
+
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "4"))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "16"))
+# finished jobs kept around so clients can still fetch their result
+MAX_FINISHED_JOBS = int(os.getenv("MAX_FINISHED_JOBS", "200"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, kind, project):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.project = project
+        self.status = Job.QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.trace = Trace(self.id, kind=kind, project=project)
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Called by the pipeline between stages; a cancelled job stops at the next one."""
+        if self.cancelled:
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def finished(self):
+        return self.status in (Job.SUCCEEDED, Job.FAILED, Job.CANCELLED)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "project": self.project,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs pipeline jobs on a bounded pool of worker threads.
+
+    At most max_workers jobs run at once and at most max_queued wait for a
+    worker; submitting beyond that raises QueueFull.
+    """
+
+    def __init__(self, max_workers=MAX_CONCURRENT_JOBS, max_queued=MAX_QUEUED_JOBS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def submit(self, kind, project, fn, *args, on_finish=None):
+        """Queues fn(job, *args). on_finish(job) runs once the job ends, whatever the outcome."""
+        with self._lock:
+            if self._count(Job.QUEUED) >= self.max_queued:
+                raise QueueFull(f"Too many queued jobs ({self.max_queued})")
+            job = Job(kind, project)
+            self._jobs[job.id] = job
+            self._trim()
+
+        job.future = self._executor.submit(self._run, job, fn, args, on_finish)
+        return job
+
+    def _run(self, job, fn, args, on_finish):
+        try:
+            if job.cancelled:
+                raise JobCancelled(f"Job {job.id} was cancelled")
+            job.status = Job.RUNNING
+            job.started_at = time.time()
+            with tracing(job.trace), span(f"job.{job.kind}", project=job.project):
+                job.result = fn(job, *args)
+            job.status = Job.SUCCEEDED
+        except JobCancelled:
+            job.status = Job.CANCELLED
+        except Exception as e:
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if job.status == Job.SUCCEEDED:
+                    self.completed += 1
+                elif job.status == Job.FAILED:
+                    self.failed += 1
+                else:
+                    self.cancelled += 1
+            try:
+                job.trace.save()
+            except Exception as e:
+                print(f"[WARNING] Failed to save trace for job {job.id}: {e}")
+            if on_finish:
+                on_finish(job)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.finished():
+            return job
+        job._cancel_event.set()
+        return job
+
+    def _count(self, status):
+        return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished()]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._count(Job.QUEUED),
+                "running": self._count(Job.RUNNING),
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+            }
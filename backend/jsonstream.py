@@ -0,0 +1,186 @@
+import json
+import re
+
+FILE_PATH_KEY = re.compile(r'"file_path"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+class StreamingJSONParser:
+    """Incrementally parses a streamed JSON object as text arrives.
+
+    Text before the first "{" (e.g. a ```json fence) and after the top-level object
+    closes is ignored. Two kinds of events are reported:
+
+    - on_entry(section, key, value) once an entry of one of the `sections` is
+      complete, e.g. ("updated_files", "script.js", "<content>") as soon as the
+      closing quote of that file's content arrives. A section is either an object
+      keyed by file path or, as in schemas.py, an array of objects with a
+      "file_path", which is then the key.
+    - on_text(key, fragment) with newly decoded text of the top-level string values
+      named in `text_keys` (e.g. "internal_dialogue") while they are still streaming.
+
+    The complete entries are kept in `entries` ({section: {key: value}} or
+    {section: [value, ...]}), so what arrived before a response was cut off can
+    still be used; incomplete_files() names the files whose entry was cut.
+    """
+
+    def __init__(self, sections=("updated_files", "new_files", "edits", "patches"), text_keys=("internal_dialogue",), on_entry=None, on_text=None):
+        self.sections = set(sections)
+        self.text_keys = set(text_keys)
+        self.on_entry = on_entry
+        self.on_text = on_text
+        self.entries = {}
+
+        self.text = ""
+        self.pos = 0
+        self.started = False
+        self.done = False
+        # one frame per open container: {"type": "object"|"array", "key": last key, "expect_key": bool}
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.string_is_key = False
+        self.value_start = None
+        self.streamed_chars = 0
+        # where the last complete entry ended
+        self.last_entry_end = 0
+
+    def feed(self, fragment):
+        if self.done:
+            return
+        self.text += fragment
+
+        while self.pos < len(self.text) and not self.done:
+            char = self.text[self.pos]
+
+            if not self.started:
+                if char == "{":
+                    self.started = True
+                    self.stack.append({"type": "object", "key": None, "expect_key": True})
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    self._close_string()
+                self.pos += 1
+                continue
+
+            frame = self.stack[-1]
+            if char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+                self.string_is_key = frame["type"] == "object" and frame["expect_key"]
+                self._start_value()
+            elif char in "{[":
+                self._start_value()
+                self.stack.append({"type": "object" if char == "{" else "array", "key": None, "expect_key": char == "{"})
+            elif char in "}]":
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                else:
+                    self._end_value(self.pos + 1)
+            elif char == ",":
+                if frame["type"] == "object":
+                    frame["expect_key"] = True
+            elif char == ":":
+                frame["expect_key"] = False
+            elif char not in " \t\r\n":
+                # numbers, true, false, null
+                self._start_value()
+                end = self.pos
+                while end < len(self.text) and self.text[end] not in ",}] \t\r\n":
+                    end += 1
+                if end == len(self.text):
+                    # literal continues in the next fragment
+                    break
+                self.pos = end
+                self._end_value(end)
+                continue
+            self.pos += 1
+
+        self._stream_text()
+
+    def _in_section(self):
+        return len(self.stack) == 2 and self.stack[0]["key"] in self.sections
+
+    def _start_value(self):
+        if self.string_is_key and self.in_string:
+            return
+        if self._in_section() and self.value_start is None:
+            self.value_start = self.pos
+
+    def _end_value(self, end):
+        if self.value_start is not None and self._in_section():
+            raw = self.text[self.value_start:end]
+            try:
+                value = json.loads(raw)
+            except json.JSONDecodeError:
+                value = None
+            self.value_start = None
+            section = self.stack[0]["key"]
+            if value is None:
+                return
+            if self.stack[1]["type"] == "array":
+                key = value.get("file_path") if isinstance(value, dict) else None
+                self.entries.setdefault(section, []).append(value)
+            else:
+                key = self.stack[1]["key"]
+                self.entries.setdefault(section, {})[key] = value
+            self.last_entry_end = end
+            if self.on_entry:
+                self.on_entry(section, key, value)
+
+    def incomplete_files(self):
+        """Files whose entry had started but not finished when the text ended."""
+        if self.done:
+            return []
+        files = []
+        for match in FILE_PATH_KEY.finditer(self.text, self.last_entry_end):
+            try:
+                files.append(json.loads(match.group(1)))
+            except json.JSONDecodeError:
+                continue
+        # an entry of a section keyed by path
+        if len(self.stack) >= 2 and self._in_section_path() and self.stack[1]["key"] not in files:
+            files.append(self.stack[1]["key"])
+        return [path for path in files if isinstance(path, str)]
+
+    def _in_section_path(self):
+        return self.stack[0]["key"] in self.sections and self.stack[1]["type"] == "object" and self.stack[1]["key"] is not None
+
+    def _close_string(self):
+        raw = self.text[self.string_start:self.pos + 1]
+        if self.string_is_key:
+            self.stack[-1]["key"] = json.loads(raw)
+            self.string_is_key = False
+            return
+        if len(self.stack) == 1 and self.stack[0]["key"] in self.text_keys:
+            self._stream_text(final=True)
+        self._end_value(self.pos + 1)
+
+    def _stream_text(self, final=False):
+        if not self.on_text or not (self.in_string or final) or self.string_is_key:
+            return
+        if len(self.stack) != 1 or self.stack[0]["key"] not in self.text_keys:
+            return
+
+        end = self.pos + 1 if final else self.pos
+        raw = self.text[self.string_start + 1:end - 1 if final else end]
+        # don't cut an escape sequence in half
+        backslash = raw.rfind("\\")
+        if not final and backslash >= len(raw) - 6:
+            raw = raw[:backslash]
+        try:
+            decoded = json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return
+        if len(decoded) > self.streamed_chars:
+            self.on_text(self.stack[0]["key"], decoded[self.streamed_chars:])
+        self.streamed_chars = 0 if final else len(decoded)
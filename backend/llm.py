@@ -1,63 +1,146 @@
-import openai
 import json
+import logging
+import os
 import re
+try:
+    from .cache import ResponseCache
+    from .llm_gateway import LLMGateway
+    from .schemas import response_format
+    from .router import route, BudgetExceeded
+except:
+    from cache import ResponseCache
+    from llm_gateway import LLMGateway
+    from schemas import response_format
+    from router import route, BudgetExceeded
 
-client = openai.Client()
+gateway = LLMGateway()
+response_cache = ResponseCache()
 
+# constrain JSON responses to their schema; turn off for models without structured outputs
+STRUCTURED_OUTPUTS = os.getenv("LLM_STRUCTURED_OUTPUTS", "1").lower() in ("1", "true", "yes")
 
-def chatcompletion(user_prompt, system_prompt=""):
+
+class LLMUnavailable(Exception):
+    """The API call failed for good, after the gateway's retries."""
+
+
+def _messages(user_prompt, system_prompt):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _with_schema(params, schema):
+    if schema and STRUCTURED_OUTPUTS:
+        params = dict(params, response_format=response_format(schema))
+    return params
+
+
+def parse_json(text):
+    """The JSON object in text: the whole text, a ```json block, or the object
+    starting at the first "{" (ignoring text after it). None if there is none."""
+    fenced = re.search(r"```(?:json)?\s*\n(.*?)```", text, re.DOTALL)
+    candidates = [text.strip()] + ([fenced.group(1).strip()] if fenced else [])
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(value, dict):
+            return value
+    start = text.find("{")
+    if start != -1:
+        try:
+            value, _ = json.JSONDecoder().raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def chatcompletion_text(user_prompt, system_prompt="", model=None, use_cache=True, schema=None, task="code", **params):
+    """Returns the raw text of a completion, served from the response cache when possible.
+
+    With a schema from schemas.py the response is constrained to it. The model
+    and reasoning effort come from the task's route unless given. Raises
+    BudgetExceeded if the call is over a token budget and LLMUnavailable if it
+    fails.
+    """
+    messages = _messages(user_prompt, system_prompt)
+    routed = route(task, messages, model, _with_schema(params, schema))
+    key = response_cache.key(routed.model, system_prompt, user_prompt, routed.params)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+
+    routed.preflight()
     try:
-        response = client.chat.completions.create(
-            model="o3-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        )
-
-        message_content = response.choices[0].message.content
-
-        json_match = re.search(r"\{.*\}", message_content, re.DOTALL)
-        if not json_match:
-            print("Error: No valid JSON found in response.")
-            return {}
-
-        message_content = json_match.group(0)
-        if "'" in message_content and '"' not in message_content:
-            message_content = message_content.replace("'", '"')
-
-        return json.loads(message_content)
-
-    except openai.RateLimitError as e:
-        print(f"RateLimitError: {e}")
-    except json.JSONDecodeError:
-        return {}
+        response = gateway.complete(routed.model, messages, **routed.params)
+        routed.charge(response.usage)
+        message_content = response.choices[0].message.content or ""
+        if use_cache:
+            response_cache.set(key, message_content)
+        return message_content
     except Exception as e:
-        print(f"Error: {e}")
+        logging.error(f"LLM {task} call failed: {type(e).__name__}: {e}")
+        raise LLMUnavailable(f"The {task} request to {routed.model} failed: {e}") from e
+
+
+def chatcompletion(user_prompt, system_prompt="", use_cache=True, schema=None, task="code"):
+    """Returns the JSON object of a completion, or {} if the response has none."""
+    message_content = chatcompletion_text(user_prompt, system_prompt, use_cache=use_cache, schema=schema, task=task)
+    parsed = parse_json(message_content)
+    if parsed is None:
+        logging.error(f"No valid JSON found in the {task} response.")
         return {}
-    return {}
+    return parsed
+
 
+def stream_chatcompletion(user_prompt, system_prompt="", use_cache=True, schema=None, task="code"):
+    """Yields the response text in deltas as they arrive from the API.
 
-def chatcompletion_stream(user_prompt, system_prompt=""):
+    A cached response is yielded as a single delta. Raises LLMUnavailable if
+    the call fails, also after some deltas were yielded.
+    """
+    messages = _messages(user_prompt, system_prompt)
+    routed = route(task, messages, params=_with_schema({}, schema))
+    # the stream flag doesn't change the content, so streamed and non-streamed
+    # calls share cache entries
+    key = response_cache.key(routed.model, system_prompt, user_prompt, routed.params)
+    if use_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    routed.preflight()
     try:
-        response = client.chat.completions.create(
-            model="o3-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            stream=True,
-        )
+        response = gateway.stream(routed.model, messages, **routed.params)
 
         accumulated_response = ""
+        finish_reason = None
 
         for chunk in response:
             if chunk.choices and chunk.choices[0].delta.content:
-                accumulated_response += chunk.choices[0].delta.content
-
-        return accumulated_response.strip()
+                delta = chunk.choices[0].delta.content
+                accumulated_response += delta
+                yield delta
+            if chunk.choices and chunk.choices[0].finish_reason:
+                finish_reason = chunk.choices[0].finish_reason
+            if chunk.usage is not None:
+                routed.charge(chunk.usage)
 
-    except openai.RateLimitError as e:
-        print(f"RateLimitError: {e}")
+        # a response cut off at the token limit isn't worth serving again
+        if use_cache and finish_reason != "length":
+            response_cache.set(key, accumulated_response)
     except Exception as e:
-        print(f"Error: {e}")
+        logging.error(f"LLM {task} stream failed: {type(e).__name__}: {e}")
+        raise LLMUnavailable(f"The {task} request to {routed.model} failed: {e}") from e
+
+
+def chatcompletion_stream(user_prompt, system_prompt="", use_cache=True, schema=None, task="code"):
+    response = "".join(stream_chatcompletion(user_prompt, system_prompt, use_cache=use_cache, schema=schema, task=task))
+    return response.strip() or None
@@ -0,0 +1,289 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+try:
+    from . import telemetry
+except:
+    import telemetry
+
+# quota of the OpenAI organisation; the limiter keeps us just under it
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_IN_FLIGHT = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "8"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "20"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "600"))
+# reserved per request for the completion until the real usage is known
+EXPECTED_OUTPUT_TOKENS = int(os.getenv("OPENAI_EXPECTED_OUTPUT_TOKENS", "4000"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+
+def estimate_tokens(messages):
+    return sum(len(message.get("content") or "") for message in messages) // 4
+
+
+def cached_tokens(usage):
+    """Prompt tokens the API served from its prompt cache, 0 if it doesn't say."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from retry-after-ms or retry-after, or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # HTTP date form
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    """Exponential backoff with full jitter, never shorter than the server's retry-after."""
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    requested = retry_after(error) if error is not None else None
+    if requested is not None:
+        delay = max(delay, requested)
+    return delay
+
+
+class TokenBucket:
+    """Refills at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until amount is available (0 if it is now). Call with the limiter's lock held."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        # may go negative when a request used more than was reserved
+        self.tokens -= min(amount, self.capacity)
+
+    def give(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Admits a request once the RPM and TPM buckets have room and an in-flight slot is free.
+
+    A 429 pauses every caller until its retry-after has passed, not only the one
+    that got it.
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_in_flight=OPENAI_MAX_IN_FLIGHT):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.waited_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, tokens):
+        started = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now),
+                )
+                if wait <= 0 and self.in_flight < self.max_in_flight:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    self.in_flight += 1
+                    self.waited_seconds += now - started
+                    return
+                # woken early when a slot frees up or usage is settled
+                self._condition.wait(wait if wait > 0 else None)
+
+    def release(self, reserved, used=None):
+        """Frees the in-flight slot and corrects the reservation with the real usage."""
+        with self._condition:
+            self.in_flight -= 1
+            if used is not None:
+                if used < reserved:
+                    self.tokens.give(reserved - used)
+                else:
+                    self.tokens.take(used - reserved)
+            self._condition.notify_all()
+
+    def pause(self, seconds):
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class LLMGateway:
+    """The single way to call the OpenAI API.
+
+    All requests share one HTTP connection pool and one RateLimiter. Retryable
+    failures (429, 5xx, connection errors) are retried with backoff_delay. A
+    stream is only retried if it fails before its first chunk, since the caller
+    has already consumed what came before.
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_in_flight=OPENAI_MAX_IN_FLIGHT, max_retries=OPENAI_MAX_RETRIES, max_connections=OPENAI_MAX_CONNECTIONS, client=None):
+        self.limiter = RateLimiter(rpm, tpm, max_in_flight)
+        self.max_retries = max_retries
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=OPENAI_TIMEOUT_SECONDS,
+        )
+        # retries are ours, so the SDK's own are turned off
+        self.client = client or openai.OpenAI(http_client=self.http_client, max_retries=0)
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _reservation(messages, params):
+        return estimate_tokens(messages) + params.get("max_completion_tokens", EXPECTED_OUTPUT_TOKENS)
+
+    def _record(self, usage):
+        if usage is None:
+            return None
+        cached = cached_tokens(usage)
+        with self._lock:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+            self.cached_tokens += cached
+        # adds up on the enclosing spans, e.g. the ticket and the job
+        telemetry.count(prompt_tokens=usage.prompt_tokens or 0, completion_tokens=usage.completion_tokens or 0, cached_tokens=cached)
+        return usage.total_tokens
+
+    def _should_retry(self, attempt, error):
+        with self._lock:
+            if attempt >= self.max_retries:
+                self.failures += 1
+                return False
+            self.retries += 1
+        telemetry.count(llm_retries=1)
+        delay = backoff_delay(attempt, error)
+        if isinstance(error, openai.RateLimitError):
+            self.limiter.pause(delay)
+        print(f"[WARNING] OpenAI request failed ({type(error).__name__}), retrying in {delay:.1f}s: {error}")
+        time.sleep(delay)
+        return True
+
+    def complete(self, model, messages, **params):
+        """Returns the chat completion response, retrying retryable failures."""
+        reserved = self._reservation(messages, params)
+        attempt = 0
+        while True:
+            self.limiter.acquire(reserved)
+            used = None
+            try:
+                with self._lock:
+                    self.requests += 1
+                with telemetry.span("llm.complete", model=model):
+                    response = self.client.chat.completions.create(model=model, messages=messages, **params)
+                    used = self._record(response.usage)
+                return response
+            except RETRYABLE_ERRORS as e:
+                error = e
+            finally:
+                self.limiter.release(reserved, used)
+            if not self._should_retry(attempt, error):
+                raise error
+            attempt += 1
+
+    def stream(self, model, messages, **params):
+        """Yields the chunks of a streamed chat completion, the last one carrying the usage."""
+        reserved = self._reservation(messages, params)
+        params.setdefault("stream_options", {"include_usage": True})
+        attempt = 0
+        while True:
+            self.limiter.acquire(reserved)
+            used = None
+            cached = None
+            started = False
+            first_chunk_ms = None
+            requested_at = time.time()
+            try:
+                with self._lock:
+                    self.requests += 1
+                for chunk in self.client.chat.completions.create(model=model, messages=messages, stream=True, **params):
+                    if not started:
+                        started = True
+                        first_chunk_ms = round((time.time() - requested_at) * 1000, 1)
+                    if chunk.usage is not None:
+                        used = self._record(chunk.usage)
+                        cached = cached_tokens(chunk.usage)
+                    yield chunk
+                # recorded after the fact, a span kept open across yields would leak into the caller
+                telemetry.record("llm.stream", time.time() - requested_at, model=model, time_to_first_chunk_ms=first_chunk_ms, cached_tokens=cached)
+                return
+            except RETRYABLE_ERRORS as e:
+                if started:
+                    raise
+                error = e
+            finally:
+                self.limiter.release(reserved, used)
+            if not self._should_retry(attempt, error):
+                raise error
+            attempt += 1
+
+    async def acomplete(self, model, messages, **params):
+        """complete() for asyncio callers; runs on a worker thread so the pool and limiter stay shared."""
+        return await asyncio.to_thread(self.complete, model, messages, **params)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+            }
+        with self.limiter._condition:
+            stats.update({
+                "in_flight": self.limiter.in_flight,
+                "max_in_flight": self.limiter.max_in_flight,
+                "limiter_wait_seconds": self.limiter.waited_seconds,
+            })
+        return stats
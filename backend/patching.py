@@ -0,0 +1,166 @@
+import os
+import re
+
+
+class PatchError(Exception):
+    pass
+
+
+def apply_edits(content, edits):
+    """Applies search/replace edit blocks in order.
+
+    Each block is {"search": <existing text>, "replace": <new text>}. The search
+    text has to match exactly one place in the file; if it doesn't match exactly,
+    a match that only differs in trailing whitespace per line is accepted.
+    """
+    for edit in edits:
+        if not isinstance(edit, dict) or "search" not in edit or "replace" not in edit:
+            raise PatchError(f"Malformed edit block: {edit!r}")
+
+        search, replace = edit["search"], edit["replace"]
+        if not search:
+            # an empty search block appends to the file
+            content = content + replace
+            continue
+
+        count = content.count(search)
+        if count == 1:
+            content = content.replace(search, replace, 1)
+            continue
+        if count > 1:
+            raise PatchError(f"Search block matches {count} places: {search[:80]!r}")
+
+        content = _replace_ignoring_trailing_whitespace(content, search, replace)
+
+    return content
+
+
+def _replace_ignoring_trailing_whitespace(content, search, replace):
+    lines = content.split("\n")
+    search_lines = [line.rstrip() for line in search.strip("\n").split("\n")]
+    stripped = [line.rstrip() for line in lines]
+
+    matches = [
+        i for i in range(len(lines) - len(search_lines) + 1)
+        if stripped[i:i + len(search_lines)] == search_lines
+    ]
+    if len(matches) != 1:
+        raise PatchError(f"Search block not found: {search[:80]!r}")
+
+    start = matches[0]
+    new_lines = replace.strip("\n").split("\n") if replace.strip("\n") else []
+    return "\n".join(lines[:start] + new_lines + lines[start + len(search_lines):])
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def apply_unified_diff(content, diff):
+    """Applies a unified diff to content. Hunks may be offset from the line
+    numbers in their header, but their context lines have to match."""
+    lines = content.split("\n")
+    hunks = []
+    hunk = None
+
+    for line in diff.split("\n"):
+        if line.startswith(("---", "+++")) and hunk is None:
+            continue
+        header = HUNK_HEADER.match(line)
+        if header:
+            hunk = {"start": int(header.group(1)), "old": [], "new": []}
+            hunks.append(hunk)
+            continue
+        if hunk is None or line.startswith("\\"):
+            continue
+        if line.startswith("-"):
+            hunk["old"].append(line[1:])
+        elif line.startswith("+"):
+            hunk["new"].append(line[1:])
+        else:
+            text = line[1:] if line.startswith(" ") else line
+            hunk["old"].append(text)
+            hunk["new"].append(text)
+
+    if not hunks:
+        raise PatchError("Diff contains no hunks")
+
+    offset = 0
+    for hunk in hunks:
+        old, new = hunk["old"], hunk["new"]
+        # trailing blank context lines are often dropped or added by the model
+        while old and new and old[-1] == "" and new[-1] == "":
+            old, new = old[:-1], new[:-1]
+
+        expected = max(hunk["start"] - 1 + offset, 0)
+        position = _find_block(lines, old, expected)
+        if position is None:
+            raise PatchError(f"Hunk at line {hunk['start']} does not apply")
+
+        lines[position:position + len(old)] = new
+        offset = position - (hunk["start"] - 1) + len(new) - len(old)
+
+    return "\n".join(lines)
+
+
+def _find_block(lines, block, expected):
+    if not block:
+        return min(expected, len(lines))
+
+    stripped_block = [line.rstrip() for line in block]
+    candidates = sorted(range(len(lines) - len(block) + 1), key=lambda i: abs(i - expected))
+    for i in candidates:
+        if [line.rstrip() for line in lines[i:i + len(block)]] == stripped_block:
+            return i
+    return None
+
+
+def apply_file_changes(base_files, edits=None, patches=None):
+    """Computes new file contents from edit blocks and unified diffs without
+    touching the disk.
+
+    Returns ({path: new content}, [paths whose changes did not apply]).
+    """
+    updated = {}
+    failed = []
+
+    for changes, apply in ((edits or {}, apply_edits), (patches or {}, apply_unified_diff)):
+        for file_path, change in changes.items():
+            file_path = os.path.normpath(file_path)
+            base = updated.get(file_path, base_files.get(file_path))
+            if base is None:
+                print(f"Warning: cannot patch unknown file '{file_path}'.")
+                failed.append(file_path)
+                continue
+            try:
+                updated[file_path] = apply(base, change)
+            except PatchError as e:
+                print(f"Warning: patch for '{file_path}' did not apply: {e}")
+                failed.append(file_path)
+
+    # a file with any failed change is left out entirely rather than half-applied
+    for file_path in failed:
+        updated.pop(file_path, None)
+
+    return updated, failed
+
+
+def write_files_atomically(files):
+    """Writes every file to a temporary sibling first and only then moves them
+    all into place, so a failed write never leaves the repo half-updated."""
+    tmp_paths = []
+    try:
+        for file_path, content in files.items():
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            tmp_paths.append((tmp_path, file_path))
+    except Exception:
+        for tmp_path, _ in tmp_paths:
+            os.remove(tmp_path)
+        raise
+
+    for tmp_path, file_path in tmp_paths:
+        os.replace(tmp_path, file_path)
@@ -0,0 +1,267 @@
+import os
+try:
+    from .prevalidate import prevalidate, frame_stats
+    from .ticket import Ticket
+except:
+    from prevalidate import prevalidate, frame_stats
+    from ticket import Ticket
+
+# budgets a scene must meet. prevalidate() runs Chromium with SwiftShader, which
+# renders on the CPU, so the FPS target is enforced on the JavaScript time of a
+# frame (the page's animation callbacks, including renderer.render() issuing its
+# draw calls), which doesn't depend on the GL backend. The wall-clock frame time
+# is only checked as well when a real GPU rendered the frames.
+PERF_TARGET_FPS = float(os.getenv("PERF_TARGET_FPS", "30"))
+# share of a frame at the target FPS the page's JavaScript may take; the rest is
+# left for compositing and the GPU
+PERF_SCRIPT_SHARE = float(os.getenv("PERF_SCRIPT_SHARE", "0.5"))
+PERF_MAX_DRAW_CALLS = int(os.getenv("PERF_MAX_DRAW_CALLS", "200"))
+PERF_MAX_TRIANGLES = int(os.getenv("PERF_MAX_TRIANGLES", "500000"))
+PERF_MAX_GEOMETRY_MB = float(os.getenv("PERF_MAX_GEOMETRY_MB", "64"))
+PERF_MAX_TEXTURE_MB = float(os.getenv("PERF_MAX_TEXTURE_MB", "128"))
+PERF_MAX_HEAP_GROWTH_MB_S = float(os.getenv("PERF_MAX_HEAP_GROWTH_MB_S", "1"))
+# meshes sharing one geometry before they should be an InstancedMesh
+PERF_INSTANCING_MIN_MESHES = int(os.getenv("PERF_INSTANCING_MIN_MESHES", "20"))
+PERF_MAX_TICKETS = int(os.getenv("PERF_MAX_TICKETS", "3"))
+PERF_SAMPLE_MS = int(os.getenv("PERF_SAMPLE_MS", "2000"))
+
+HEAP_JS = "() => performance.memory ? performance.memory.usedJSHeapSize : null"
+# samples frame intervals and the time spent in the page's requestAnimationFrame
+# callbacks per frame; the wrapper catches loops that re-register through
+# window.requestAnimationFrame every frame, as animate() and setAnimationLoop do
+FRAME_COST_JS = """(duration) => new Promise((resolve) => {
+    const original = window.requestAnimationFrame;
+    const scriptMs = new Map();
+    window.requestAnimationFrame = (callback) => original.call(window, (now) => {
+        const start = performance.now();
+        try {
+            return callback(now);
+        } finally {
+            scriptMs.set(now, (scriptMs.get(now) || 0) + performance.now() - start);
+        }
+    });
+    const frames = [];
+    let last = performance.now();
+    const end = last + duration;
+    function tick(now) {
+        frames.push(now - last);
+        last = now;
+        if (now < end) {
+            original.call(window, tick);
+        } else {
+            window.requestAnimationFrame = original;
+            resolve({frames, script: [...scriptMs.values()]});
+        }
+    }
+    original.call(window, tick);
+})"""
+# the WebGL renderer string, e.g. "ANGLE (Google, Vulkan 1.3.0 (SwiftShader Device ...))"
+GPU_JS = """() => {
+    const gl = typeof renderer !== 'undefined' && renderer.getContext
+        ? renderer.getContext()
+        : document.createElement('canvas').getContext('webgl');
+    if (!gl) return null;
+    const info = gl.getExtension('WEBGL_debug_renderer_info');
+    return gl.getParameter(info ? info.UNMASKED_RENDERER_WEBGL : gl.RENDERER);
+}"""
+SOFTWARE_RENDERERS = ("swiftshader", "llvmpipe", "software")
+
+# expects `renderer` (and `scene` for the breakdown) as globals, like visual.SET_VIEW_JS
+SCENE_STATS_JS = """() => {
+    if (typeof renderer === 'undefined' || !renderer.info) return null;
+    const info = renderer.info;
+    const stats = {
+        draw_calls: info.render.calls,
+        triangles: info.render.triangles,
+        geometries: info.memory.geometries,
+        textures: info.memory.textures,
+        programs: info.programs ? info.programs.length : null,
+    };
+    if (typeof scene === 'undefined' || !scene.traverse) return stats;
+
+    let meshes = 0, instanced = 0;
+    const geometryUsers = new Map(), materials = new Set(), textures = new Set();
+    scene.traverse((object) => {
+        if (!object.isMesh) return;
+        meshes += 1;
+        if (object.isInstancedMesh) instanced += 1;
+        if (object.geometry) geometryUsers.set(object.geometry, (geometryUsers.get(object.geometry) || 0) + 1);
+        for (const material of [].concat(object.material || [])) {
+            materials.add(material);
+            for (const key in material) {
+                if (material[key] && material[key].isTexture) textures.add(material[key]);
+            }
+        }
+    });
+
+    let geometryBytes = 0;
+    for (const geometry of geometryUsers.keys()) {
+        for (const name in geometry.attributes) geometryBytes += geometry.attributes[name].array.byteLength;
+        if (geometry.index) geometryBytes += geometry.index.array.byteLength;
+    }
+    let textureBytes = 0;
+    for (const texture of textures) {
+        const image = texture.image;
+        // RGBA, plus a third for the mipmaps
+        if (image && image.width && image.height) textureBytes += image.width * image.height * 4 * (texture.generateMipmaps ? 4 / 3 : 1);
+    }
+    return Object.assign(stats, {
+        meshes,
+        instanced_meshes: instanced,
+        unique_geometries: geometryUsers.size,
+        unique_materials: materials.size,
+        max_meshes_per_geometry: Math.max(0, ...geometryUsers.values()),
+        geometry_mb: geometryBytes / 1048576,
+        texture_mb: textureBytes / 1048576,
+    });
+}"""
+
+
+def collect_metrics(page, sample_ms=PERF_SAMPLE_MS):
+    """on_loaded hook for prevalidate(): frame and script times, JS heap growth and renderer.info of a loaded page."""
+    heap_before = page.evaluate(HEAP_JS)
+    sample = page.evaluate(FRAME_COST_JS, sample_ms)
+    heap_after = page.evaluate(HEAP_JS)
+    gpu = page.evaluate(GPU_JS)
+    metrics = {
+        "frame_times": frame_stats(sample["frames"]),
+        "script_times": frame_stats(sample["script"]),
+        "scene": page.evaluate(SCENE_STATS_JS),
+        "heap_growth_mb_s": None,
+        "gpu": gpu,
+        "software_rendering": gpu is None or any(name in gpu.lower() for name in SOFTWARE_RENDERERS),
+    }
+    if heap_before is not None and heap_after is not None:
+        # garbage collection can shrink the heap in between, which only underestimates
+        metrics["heap_growth_mb_s"] = max(heap_after - heap_before, 0) / 1048576 / (sample_ms / 1000)
+    return metrics
+
+
+def check_budgets(metrics):
+    """Returns the budgets the metrics miss as {"budget", "value", "limit"}, worst first.
+
+    The script time per frame is held to PERF_SCRIPT_SHARE of the target frame
+    time whatever renders the page; the wall-clock frame time is only checked
+    when a real GPU rendered the frames.
+    """
+    scene = metrics.get("scene") or {}
+    frames = metrics.get("frame_times") or {}
+    scripts = metrics.get("script_times") or {}
+    frame_budget_ms = 1000 / PERF_TARGET_FPS
+    checks = [("script_ms_per_frame", scripts.get("p95_ms"), frame_budget_ms * PERF_SCRIPT_SHARE)]
+    if not metrics.get("software_rendering", True):
+        checks.append(("frame_time_ms", frames.get("p95_ms"), frame_budget_ms))
+    checks += [
+        ("draw_calls", scene.get("draw_calls"), PERF_MAX_DRAW_CALLS),
+        ("triangles", scene.get("triangles"), PERF_MAX_TRIANGLES),
+        ("geometry_mb", scene.get("geometry_mb"), PERF_MAX_GEOMETRY_MB),
+        ("texture_mb", scene.get("texture_mb"), PERF_MAX_TEXTURE_MB),
+        ("heap_growth_mb_s", metrics.get("heap_growth_mb_s"), PERF_MAX_HEAP_GROWTH_MB_S),
+    ]
+    violations = [
+        {"budget": budget, "value": value, "limit": limit}
+        for budget, value, limit in checks
+        if value is not None and value > limit
+    ]
+    return sorted(violations, key=lambda violation: violation["value"] / violation["limit"], reverse=True)
+
+
+def audit(repo_path):
+    """Loads the product headlessly and checks it against the budgets.
+
+    Returns {"skipped", "metrics", "violations"}; nothing is checked when the
+    page can't be loaded or doesn't expose `renderer` as a global.
+    """
+    report = prevalidate(repo_path, on_loaded=collect_metrics)
+    result = {"skipped": report["skipped"], "metrics": report["loaded"], "violations": []}
+    if result["skipped"]:
+        return result
+    if not report["ok"] or not report["loaded"]:
+        result["skipped"] = "the page doesn't load cleanly"
+    elif report["loaded"]["scene"] is None:
+        result["skipped"] = "the scene doesn't expose `renderer` as a global"
+    else:
+        result["violations"] = check_budgets(report["loaded"])
+    return result
+
+
+def _describe(violations):
+    return "; ".join(f"{v['budget']} is {v['value']:.1f} (budget {v['limit']:.1f})" for v in violations)
+
+
+def optimization_tickets(result, files=None, use_cache=True):
+    """Turns the violations of an audit() into optimization Tickets, at most PERF_MAX_TICKETS.
+
+    Each ticket names the measurements it has to fix and the technique to use;
+    they run one after the other since they all edit the scene code.
+    """
+    violations = result["violations"]
+    if not violations:
+        return []
+    scene = result["metrics"].get("scene") or {}
+    by_budget = {violation["budget"]: violation for violation in violations}
+    frame_cost = [by_budget[b] for b in ("script_ms_per_frame", "frame_time_ms") if b in by_budget]
+    drawn = [by_budget[b] for b in ("draw_calls",) if b in by_budget] + frame_cost
+    tickets = []
+
+    def add(summary, description, measured):
+        depends_on = [tickets[-1].id] if tickets else []
+        tickets.append(Ticket(
+            summary,
+            f"{description} Measured in a headless browser: {_describe(measured)}. "
+            "Keep the scene looking and behaving the same.",
+            files=files, depends_on=depends_on, id=f"perf-{len(tickets)}", use_cache=use_cache,
+        ))
+
+    if drawn and scene.get("max_meshes_per_geometry", 0) >= PERF_INSTANCING_MIN_MESHES:
+        add(
+            "Instance repeated meshes",
+            f"Up to {scene['max_meshes_per_geometry']} meshes share one geometry, each drawn separately. "
+            "Replace groups of meshes that share a geometry and material with a single THREE.InstancedMesh, "
+            "setting each instance's transform with setMatrixAt.",
+            drawn,
+        )
+    elif drawn and scene.get("meshes", 0) >= PERF_INSTANCING_MIN_MESHES:
+        add(
+            "Merge static geometry and share materials",
+            f"The scene has {scene['meshes']} meshes using {scene.get('unique_materials')} materials. "
+            "Create one material per distinct look and reuse it, and merge static meshes that share a material "
+            "into one BufferGeometry (THREE.BufferGeometryUtils.mergeBufferGeometries from "
+            "examples/js/utils/BufferGeometryUtils.js).",
+            drawn,
+        )
+    elif frame_cost:
+        add(
+            "Reduce per-frame rendering cost",
+            "Frames take too long to render. Skip work in animate() that doesn't change between frames, "
+            "avoid traversing the whole scene every frame, cap the pixel ratio at 2 and only enable shadows "
+            "on the lights and meshes that need them.",
+            frame_cost,
+        )
+
+    heavy = [by_budget[b] for b in ("triangles", "geometry_mb") if b in by_budget]
+    if heavy:
+        add(
+            "Reduce geometry detail with LOD",
+            "The scene draws more triangles than it needs. Lower the segment counts of spheres, cylinders and "
+            "planes, and use THREE.LOD to swap distant detailed objects for simpler versions.",
+            heavy,
+        )
+
+    if "texture_mb" in by_budget:
+        add(
+            "Shrink textures",
+            "Textures use too much memory. Generate or load them at no more than 1024x1024 and reuse "
+            "textures between materials instead of creating copies.",
+            [by_budget["texture_mb"]],
+        )
+
+    if "heap_growth_mb_s" in by_budget:
+        add(
+            "Remove per-frame allocations from animate()",
+            "The page allocates memory on every frame. Create vectors, quaternions, matrices, colors, "
+            "geometries and materials once outside animate() and reuse them (e.g. with .set() and .copy()).",
+            [by_budget["heap_growth_mb_s"]],
+        )
+
+    return tickets[:PERF_MAX_TICKETS]
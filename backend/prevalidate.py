@@ -0,0 +1,144 @@
+import functools
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlparse
+
+PREVALIDATE_TIMEOUT_MS = int(os.getenv("PREVALIDATE_TIMEOUT_MS", "15000"))
+FRAME_SAMPLE_MS = int(os.getenv("PREVALIDATE_FRAME_SAMPLE_MS", "1000"))
+
+# precise memory info lets perf_audit measure per-frame allocations
+CHROMIUM_ARGS = ["--use-gl=swiftshader", "--enable-webgl", "--ignore-gpu-blocklist", "--enable-precise-memory-info"]
+
+SAMPLE_FRAMES_JS = """(duration) => new Promise((resolve) => {
+    const times = [];
+    let last = performance.now();
+    const end = last + duration;
+    function tick(now) {
+        times.push(now - last);
+        last = now;
+        if (now < end) requestAnimationFrame(tick); else resolve(times);
+    }
+    requestAnimationFrame(tick);
+})"""
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_directory(path):
+    """Serves path over HTTP on a free localhost port and yields the base URL."""
+    handler = functools.partial(_QuietHandler, directory=os.path.abspath(path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def frame_stats(times):
+    # the first sample is the wait for the first frame, not a frame time
+    times = sorted(times[1:])
+    if not times:
+        return {"frames": 0}
+    return {
+        "frames": len(times),
+        "avg_ms": sum(times) / len(times),
+        "p95_ms": times[min(int(len(times) * 0.95), len(times) - 1)],
+        "max_ms": times[-1],
+    }
+
+
+def prevalidate(repo_path, page="index.html", timeout_ms=PREVALIDATE_TIMEOUT_MS, sample_ms=FRAME_SAMPLE_MS, on_loaded=None):
+    """Loads the product in headless Chromium and collects obvious breakage.
+
+    Returns a dict with "ok", the console errors, uncaught exceptions, failed
+    local requests and a frame-time sample. "skipped" is set (and "ok" is True)
+    when the check can't say anything, e.g. Playwright isn't installed or a CDN
+    script couldn't be fetched, so the caller falls through to the full agent
+    evaluation. on_loaded(page) runs on the loaded page in the same browser
+    session and its return value is stored as "loaded".
+    """
+    report = {
+        "ok": True,
+        "skipped": None,
+        "console_errors": [],
+        "page_errors": [],
+        "failed_requests": [],
+        "has_canvas": None,
+        "frame_times": {"frames": 0},
+        "loaded": None,
+    }
+
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        report["skipped"] = "playwright is not installed"
+        return report
+
+    external_failures = []
+    try:
+        with serve_directory(repo_path) as base_url, sync_playwright() as playwright:
+            browser = playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+            try:
+                page_handle = browser.new_page()
+
+                def on_console(message):
+                    if message.type == "error":
+                        report["console_errors"].append(message.text)
+
+                page_handle.on("console", on_console)
+                page_handle.on("pageerror", lambda error: report["page_errors"].append(str(error)))
+
+                def on_request_failed(request):
+                    if urlparse(request.url).hostname == "127.0.0.1":
+                        report["failed_requests"].append(request.url)
+                    else:
+                        external_failures.append(request.url)
+
+                page_handle.on("requestfailed", on_request_failed)
+
+                page_handle.goto(base_url + page, wait_until="load", timeout=timeout_ms)
+                report["has_canvas"] = page_handle.evaluate("() => document.querySelector('canvas') !== null")
+                report["frame_times"] = frame_stats(page_handle.evaluate(SAMPLE_FRAMES_JS, sample_ms))
+                if on_loaded:
+                    report["loaded"] = on_loaded(page_handle)
+            finally:
+                browser.close()
+    except Exception as e:
+        # a missing browser binary or a hung page says nothing about the code
+        logging.warning(f"Pre-validation could not run: {e}")
+        report["skipped"] = f"pre-validation could not run: {e}"
+        return report
+
+    if external_failures:
+        report["skipped"] = f"external resources failed to load: {external_failures}"
+        return report
+
+    report["ok"] = not (report["page_errors"] or report["console_errors"] or report["failed_requests"] or report["has_canvas"] is False)
+    return report
+
+
+def format_report(report):
+    """Describes a failed pre-validation as the error_info for get_fix_suggestions."""
+    lines = ["The page fails to load cleanly in a headless browser."]
+    if report["page_errors"]:
+        lines.append("Uncaught exceptions:")
+        lines.extend(f"- {error}" for error in report["page_errors"])
+    if report["console_errors"]:
+        lines.append("Console errors:")
+        lines.extend(f"- {error}" for error in report["console_errors"])
+    if report["failed_requests"]:
+        lines.append("Files that failed to load:")
+        lines.extend(f"- {url}" for url in report["failed_requests"])
+    if report["has_canvas"] is False:
+        lines.append("No <canvas> element was created, so nothing is rendered.")
+    return "\n".join(lines)
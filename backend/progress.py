@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+from collections import deque
+
+BUFFER_SIZE = int(os.getenv("PROGRESS_BUFFER_SIZE", "1000"))
+HEARTBEAT_SECONDS = 15
+
+
+class ProgressChannel:
+    """Progress messages of one project, fanned out to any number of SSE clients.
+
+    Messages get increasing sequence numbers and the last BUFFER_SIZE of them are
+    kept, so a client reconnecting with Last-Event-ID only receives what it missed.
+    Subscribers block on a condition variable instead of polling.
+    """
+
+    def __init__(self, name, buffer_size=BUFFER_SIZE):
+        self.name = name
+        self.messages = deque(maxlen=buffer_size)
+        self.seq = 0
+        self.closed = False
+        self.subscribers = 0
+        self._condition = threading.Condition()
+
+    def publish(self, message):
+        with self._condition:
+            self.seq += 1
+            self.messages.append((self.seq, message))
+            self._condition.notify_all()
+        return self.seq
+
+    # the pipeline used to append to a plain list, keep that working
+    append = publish
+
+    def reset(self):
+        """Starts a new run: drops buffered messages but keeps sequence numbers increasing."""
+        with self._condition:
+            self.messages.clear()
+            self.closed = False
+
+    def close(self):
+        """Marks the run as finished; subscribers drain the buffer and disconnect."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def subscribe(self, last_seq=0, heartbeat=HEARTBEAT_SECONDS):
+        """Yields (seq, message) for every message after last_seq as it is published.
+
+        Yields None after `heartbeat` seconds without messages so the caller can
+        send a keep-alive, which is also how a disconnected client is noticed.
+        """
+        with self._condition:
+            self.subscribers += 1
+            if last_seq > self.seq:
+                # the id is from a channel that has since been released
+                last_seq = 0
+        # a client may connect to a finished channel right before the next run
+        # starts, so only a run that was open during the subscription ends it
+        seen_open = False
+        try:
+            while True:
+                with self._condition:
+                    seen_open = seen_open or not self.closed
+                    pending = [(seq, message) for seq, message in self.messages if seq > last_seq]
+                    if not pending:
+                        if self.closed and seen_open:
+                            return
+                        self._condition.wait(timeout=heartbeat)
+                        pending = [(seq, message) for seq, message in self.messages if seq > last_seq]
+
+                if not pending:
+                    yield None
+                    continue
+                for seq, message in pending:
+                    last_seq = seq
+                    yield seq, message
+        finally:
+            with self._condition:
+                self.subscribers -= 1
+            release(self)
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def get_channel(name):
+    with _channels_lock:
+        if name not in _channels:
+            _channels[name] = ProgressChannel(name)
+        return _channels[name]
+
+
+def release(channel):
+    """Forgets a finished channel once its last subscriber has gone."""
+    with _channels_lock:
+        if channel.closed and channel.subscribers == 0 and _channels.get(channel.name) is channel:
+            del _channels[channel.name]
+
+
+def sse_stream(channel, last_seq=0):
+    """Formats a channel subscription as server-sent events."""
+    for event in channel.subscribe(last_seq):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        seq, message = event
+        yield f"id: {seq}\ndata: {json.dumps(message)}\n\n"
@@ -0,0 +1,37 @@
+"""Builds prompts so that consecutive calls share the longest possible prefix.
+
+The API caches the prompt prefix of recent requests (from 1024 tokens on) and
+serves it faster and cheaper, but only up to the first character that differs.
+So prompts are laid out from the most to the least stable part:
+
+    instructions   the same for every call of a kind
+    context        the repo summary and files, in path order; the same until the repo changes
+    task           the ticket, user input or error of this one call
+"""
+
+
+def section(title, text):
+    return f"***{title} STARTS***\n{text.strip()}\n***{title} ENDS***"
+
+
+class PromptBuilder:
+    def __init__(self, instructions):
+        self.instructions = instructions.strip()
+        self.context = []
+        self.tasks = []
+
+    def add_context(self, title, text):
+        self.context.append(section(title, text))
+        return self
+
+    def add_files(self, title, blocks):
+        """Adds formatted file blocks (retrieval.format_file), sorted by path so
+        the order doesn't depend on how they were selected."""
+        return self.add_context(title, "\n".join(sorted(blocks)))
+
+    def add_task(self, title, text):
+        self.tasks.append(section(title, text))
+        return self
+
+    def build(self):
+        return "\n\n".join([self.instructions] + self.context + self.tasks) + "\n"
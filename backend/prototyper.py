@@ -1,31 +1,108 @@
-import shutil
 try:
     from .llm import chatcompletion
     from .ticket import Ticket
-    from .debugger import debug_with_scrapybara
+    from .debugger import debug_with_scrapybara, rollback_to_last_version
+    from .snapshots import SnapshotStore
+    from .workspace import Workspace
+    from .bundler import build
+    from .perf_audit import audit, optimization_tickets
+    from .visual import VisualStore
+    from .summary_index import SummaryIndex
+    from .telemetry import traced
+    from .prompts import PromptBuilder
+    from .schemas import SUMMARY_SCHEMA, TICKET_LIST_SCHEMA, files_by_path
 except:
     from llm import chatcompletion
     from ticket import Ticket
-    from debugger import debug_with_scrapybara
+    from debugger import debug_with_scrapybara, rollback_to_last_version
+    from snapshots import SnapshotStore
+    from workspace import Workspace
+    from bundler import build
+    from perf_audit import audit, optimization_tickets
+    from visual import VisualStore
+    from summary_index import SummaryIndex
+    from telemetry import traced
+    from prompts import PromptBuilder
+    from schemas import SUMMARY_SCHEMA, TICKET_LIST_SCHEMA, files_by_path
     
 import scrapybara
-import openai
 import os
+import time
 import uuid
 
+snapshot_store = SnapshotStore()
+
+TICKETS_INSTRUCTIONS = """You are an experienced software project manager and technical lead, specializing in breaking down complex user requirements into 5 detailed, structured Jira tickets based on the instructions below. Your expertise includes defining clear, actionable, modular tasks.
+
+***INSTRUCTION STARTS***
+From the current codebase, transform the user's natural language description of a virtual environment (given last, after the codebase) into a set of well-scoped Jira-style tickets to create a web-renderable 3d prototype. Each ticket must be actionable, detailed, and structured for clear execution. The number of tickets should be dependent on the complexity of the user goal.
+
+First, analyze the provided description to break it down into individual tasks or features.
+
+Then, generate a set of subsequent jira tickets. Each ticket should include:
+    - Summary: A concise title summarizing the task.
+    - Description: A detailed explanation of what needs to be done.
+    - Files: The codebase files (or new files) the ticket will create or modify.
+    - Depends on: The 0-based indices of earlier tickets this ticket builds on. Keep this empty when the ticket can be done independently, so tickets can be worked on in parallel.
+
+Return the tickets in structured JSON format following the template below.
+
+{
+"project": "<Project Name>",
+"tickets": [
+    {
+    "summary": "<Concise task title>",
+    "description": "<Detailed explanation of the task, including objectives and scope>",
+    "files": ["<file name, e.g. script.js>"],
+    "depends_on": [<index of an earlier ticket>]
+    }
+]
+}
+***INSTRUCTION ENDS***"""
+
+SUMMARY_INSTRUCTIONS = """You are an expert software engineer specializing in analyzing and summarizing code.
+Your task is to analyze the given files and provide a concise summary of the functionality of each file.
+
+###Instructions STARTS###
+- Provide a structured summary for every file that explains its purpose and functionality.
+- Use the file paths exactly as given.
+- Return your response in the following JSON format:
+
+```json
+{
+    "files": [
+        {"file_path": "<file path>", "summary": "<Concise summary of the file>"}
+    ]
+}
+```
+###Instructions ENDS###"""
+
 
 class Prototyper:
-    def __init__(self, user_prompt, scrapybara_client, instance, name=None):
+    def __init__(self, user_prompt, scrapybara_client, instance, name=None, use_cache=True, repo_path=None):
         self.name = name or str(uuid.uuid4())
         self.user_prompt = user_prompt
         self.tickets = []
         self.repo_summary = None
-        self.repo_path = os.path.join("../frontend/static/product")
-        self.llm_client = openai.Client()
+        self.repo_path = repo_path or os.path.join("../frontend/static/product")
+        # loaded by setup_repo() or refresh()
+        self.workspace = Workspace(self.repo_path)
         self.scrapybara_client = scrapybara_client
         self.scrapybara_instance = instance
-
-
+        self.use_cache = use_cache
+        # accepted states of the repo, oldest first: {"id", "label", "created_at"}
+        self.checkpoints = []
+        # snapshot id of the accepted state the repo was last checkpointed or rolled back to
+        self.head = None
+        # fingerprints of the accepted renders, by snapshot id
+        self.visual_store = VisualStore(self.repo_path)
+        # manifest of the last bundle() of the repo
+        self.build_manifest = None
+        # result of the last audit_performance()
+        self.perf_report = None
+
+
+    @traced("prototyper.setup_repo")
     def setup_repo(self):
         template_path = "../frontend/static/template"
 
@@ -33,111 +110,130 @@ class Prototyper:
             raise Exception(f"Template folder '{template_path}' not found. Aborting.")
 
         try:
-            destination = "../frontend/static/product"
-            if os.path.exists(destination):
-                shutil.rmtree(destination)
-            shutil.copytree(template_path, self.repo_path)
-            print(f"[SUCCESS] Created repository at '{self.repo_path}' from template.")
+            # only the files that differ from the template are rewritten
+            written, removed = snapshot_store.checkout(snapshot_store.snapshot(template_path), self.repo_path)
+            self.workspace.refresh()
+            self.checkpoints = []
+            # renders of the previous project are no baseline for this one
+            self.visual_store.clear()
+            self.checkpoint("template")
+            print(f"[SUCCESS] Created repository at '{self.repo_path}' from template ({written} files written, {removed} removed).")
 
         except Exception as e:
             raise Exception(f"Failed to create repository: {e}")
 
-    def create_tickets(self):
-        prompt = f"""You are an experienced software project manager and technical lead, specializing in breaking down complex user requirements into 5 detailed, structured Jira tickets based on the instructions below. Your expertise includes defining clear, actionable, modular tasks.
-
-    ***USER INPUT STARTS***
-    {self.user_prompt}
-    ***USER INPUT ENDS***
-
-    ***CODEBASE SUMMARY STARTS***
-    {self.repo_summary}
-    ***CODEBASE SUMMARY ENDS***
-
-    ***INSTRUCTION STARTS***
-    From the current codebase, transform the user's natural language description of a virtual environment into a set of well-scoped Jira-style tickets to create a web-renderable 3d prototype. Each ticket must be actionable, detailed, and structured for clear execution. The number of tickets should be dependent on the complexity of the user goal.
-
-    First, analyze the provided description to break it down into individual tasks or features.
-
-    Then, generate a set of subsequent jira tickets. Each ticket should include:
-        - Summary: A concise title summarizing the task.
-        - Description: A detailed explanation of what needs to be done.
-
-    Return the tickets in structured JSON format following the template below.
+    def checkpoint(self, label, render=None):
+        """Snapshots the repo as an accepted state, with the fingerprint of its
+        render if there is one, and returns the snapshot id."""
+        snapshot_id = snapshot_store.snapshot(self.repo_path)
+        self.checkpoints.append({"id": snapshot_id, "label": label, "created_at": time.time()})
+        if render:
+            self.visual_store.save(snapshot_id, render)
+        self.head = snapshot_id
+        return snapshot_id
+
+    def accepted_render(self):
+        """The render fingerprint of the last accepted state, if it was rendered."""
+        return self.visual_store.load(self.head) if self.head else None
+
+    def rollback(self, snapshot_id=None):
+        """Restores the repo to snapshot_id, by default the last checkpoint."""
+        if snapshot_id is None:
+            if not self.checkpoints:
+                return False
+            snapshot_id = self.checkpoints[-1]["id"]
+        rolled_back = rollback_to_last_version(snapshot_store, snapshot_id, self.repo_path)
+        self.workspace.refresh()
+        if rolled_back:
+            self.head = snapshot_id
+        return rolled_back
+
+    def bundle(self):
+        """Builds the minified, hashed copy of the repo that previews are served from."""
+        try:
+            self.build_manifest = build(self.workspace)
+        except Exception as e:
+            # the sources stay usable, only the preview falls back to them
+            print(f"[WARNING] Failed to bundle '{self.repo_path}': {e}")
+        return self.build_manifest
+
+    @traced("prototyper.audit_performance")
+    def audit_performance(self):
+        """Audits the rendered scene against the performance budgets and returns
+        optimization tickets for the ones it misses."""
+        self.perf_report = audit(self.repo_path)
+        if self.perf_report["skipped"]:
+            print(f"[INFO] Skipped the performance audit: {self.perf_report['skipped']}")
+            return []
+        js_file = self.workspace.find(".js")
+        tickets = optimization_tickets(self.perf_report, files=[self.workspace.relative(js_file)] if js_file else None, use_cache=self.use_cache)
+        print(f"[INFO] Performance audit: {len(self.perf_report['violations'])} budgets missed, {len(tickets)} optimization tickets.")
+        return tickets
 
-    {{
-    "project": "<Project Name>",
-    "tickets": [
-        {{
-        "summary": "<Concise task title>",
-        "description": "<Detailed explanation of the task, including objectives and scope>"
-        }}
-    ]
-    }}
-    ***TASK ENDS***"""
-        response = chatcompletion(prompt)
+    @traced("prototyper.create_tickets")
+    def create_tickets(self):
+        prompt = (
+            PromptBuilder(TICKETS_INSTRUCTIONS)
+            .add_context("CODEBASE SUMMARY", self.repo_summary or "")
+            .add_context("CODEBASE FILES", self.list_repo_files())
+            .add_task("USER INPUT", self.user_prompt)
+            .build()
+        )
+        response = chatcompletion(prompt, use_cache=self.use_cache, schema=TICKET_LIST_SCHEMA, task="tickets")
 
         if not response or "tickets" not in response:
             print("Error: No tickets were generated.")
             return []
 
         tickets = [
-            Ticket(ticket["summary"], ticket["description"])
-            for ticket in response["tickets"]
+            Ticket(
+                ticket["summary"],
+                ticket["description"],
+                files=ticket.get("files") or [],
+                depends_on=[d for d in ticket.get("depends_on") or [] if isinstance(d, int) and d < index],
+                id=index,
+                use_cache=self.use_cache,
+            )
+            for index, ticket in enumerate(response["tickets"])
         ]
         print(f"[INFO] Created {len(tickets)} tickets.")
         self.tickets = tickets[:5] #first 5 tickets only for now
 
+    def list_repo_files(self):
+        return "\n".join(self.workspace.relative(path) for path in self.workspace.paths())
+
+    @traced("prototyper.summarize_repo")
     def summarize_repo(self):
-        repo_code = []
-
-        for root, _, files in os.walk(self.repo_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-
-                if not file.endswith((".py", ".js", ".ts", ".java", ".cpp", ".cs", ".html", ".css")):
-                    continue
-                
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        code_content = f.read()
-
-                    formatted_code = f"""
-    File: {file_path}
-    Content:
-    -----------
-    {code_content}
-    -----------
-    """
-                    repo_code.append(formatted_code)
-
-                except Exception as e:
-                    print(f"Error reading {file_path}: {e}")
-
-        code_snippets = "\n".join(repo_code)
-
-        prompt = f"""
-    You are an expert software engineer specializing in analyzing and summarizing code.
-    Your task is to analyze the given codebase and provide a concise summary of its functionality.
-
-    ***CODE STARTS***
-    {code_snippets}
-    ***CODE ENDS***
-
-    ###Instructions STARTS###
-    - Provide a structured summary that explains the purpose and functionality of the codebase.
-    - Return your response in the following JSON format:
-
-    ```json
-    {{
-        "summary": "<Concise code summary here>"
-    }}
-    ###Instructions ENDS###
-    """
-
-        response = chatcompletion(prompt)
-        if not response or "summary" not in response:
-            print("Error: No summary was generated.")
+        """Re-summarizes only the files whose content changed since the last call and
+        combines the per-file summaries into self.repo_summary."""
+        repo_files = {
+            self.workspace.relative(file_path): content
+            for file_path, content in self.workspace.files().items()
+        }
+
+        index = SummaryIndex(self.repo_path)
+        changed_files = index.changed_files(repo_files)
+        print(f"[INFO] Summarizing {len(changed_files)} of {len(repo_files)} files.")
+
+        summaries = {}
+        if changed_files:
+            code_snippets = "\n".join(
+                f"File: {file_path}\nContent:\n-----------\n{code_content}\n-----------\n"
+                for file_path, code_content in sorted(changed_files.items())
+            )
+            prompt = PromptBuilder(SUMMARY_INSTRUCTIONS).add_context("CODE", code_snippets).build()
+
+            response = chatcompletion(prompt, use_cache=self.use_cache, schema=SUMMARY_SCHEMA, task="summary")
+            if not response or "files" not in response:
+                print("Error: No summary was generated.")
+            else:
+                summaries = files_by_path(response["files"], "summary")
+
+        index.update(repo_files, summaries)
+        index.save()
+
+        if not index.entries:
             return ""
-        
-        self.repo_summary = response["summary"]
 
+        self.repo_summary = index.combined_summary()
+        return self.repo_summary
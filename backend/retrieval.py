@@ -0,0 +1,167 @@
+import math
+import os
+import re
+from collections import Counter
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("TICKET_CONTEXT_TOKENS", "12000"))
+CHUNK_LINES = 40
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "if", "in", "into",
+    "is", "it", "of", "on", "or", "so", "that", "the", "this", "to", "when", "with",
+    "should", "will", "can", "user", "users", "add", "make", "new", "const", "let",
+    "var", "function", "return",
+}
+
+
+def estimate_tokens(text):
+    # roughly four characters per token for code and English
+    return len(text) // 4 + 1
+
+
+def tokenize(text):
+    """Splits text into lowercase terms, breaking identifiers on camelCase and snake_case."""
+    words = re.findall(r"[A-Za-z][A-Za-z0-9]*", text)
+    terms = []
+    for word in words:
+        parts = re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", word) or [word]
+        for part in parts + ([word] if len(parts) > 1 else []):
+            part = part.lower()
+            if len(part) > 1 and part not in STOPWORDS:
+                terms.append(part)
+    return terms
+
+
+def chunk_file(content, max_lines=CHUNK_LINES):
+    """Splits a file into (start line, end line) chunks of up to max_lines lines,
+    preferring to break on blank lines so statements stay together."""
+    lines = content.split("\n")
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end = min(start + max_lines, len(lines))
+        if end < len(lines):
+            for i in range(end, start + max_lines // 2, -1):
+                if not lines[i - 1].strip():
+                    end = i
+                    break
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+class RepoIndex:
+    """BM25 index over line chunks of the files in a repo."""
+
+    def __init__(self, files, k1=1.5, b=0.75):
+        self.files = files
+        self.k1 = k1
+        self.b = b
+        self.chunks = []
+        for file_path, content in files.items():
+            lines = content.split("\n")
+            for start, end in chunk_file(content):
+                text = "\n".join(lines[start:end])
+                # the file name is part of every chunk so "the css" or "index.html" match
+                terms = Counter(tokenize(text) + tokenize(os.path.basename(file_path)))
+                self.chunks.append({"file": file_path, "start": start, "end": end, "text": text, "terms": terms})
+
+        self.avg_length = sum(sum(c["terms"].values()) for c in self.chunks) / max(len(self.chunks), 1)
+        document_frequency = Counter()
+        for chunk in self.chunks:
+            document_frequency.update(chunk["terms"].keys())
+        n = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def score(self, chunk, query_terms):
+        length = sum(chunk["terms"].values())
+        score = 0.0
+        for term in query_terms:
+            tf = chunk["terms"].get(term, 0)
+            if not tf:
+                continue
+            score += self.idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / self.avg_length))
+        return score
+
+    def rank(self, query):
+        query_terms = set(tokenize(query))
+        scored = [(self.score(chunk, query_terms), chunk) for chunk in self.chunks]
+        return sorted(scored, key=lambda pair: pair[0], reverse=True)
+
+
+def format_file(file_path, content):
+    return f"**FILE PATH:** {file_path}\n**CONTENT START**\n{content}\n**CONTENT END**"
+
+
+def format_excerpts(file_path, content, ranges):
+    lines = content.split("\n")
+    excerpts = []
+    for start, end in sorted(ranges):
+        excerpts.append(f"**LINES {start + 1}-{end} OF {len(lines)}**\n" + "\n".join(lines[start:end]))
+    return f"**FILE PATH:** {file_path} (excerpts)\n**CONTENT START**\n" + "\n...\n".join(excerpts) + "\n**CONTENT END**"
+
+
+def select_context(files, query, token_budget=CONTEXT_TOKEN_BUDGET, pinned_files=(), whole_files=False):
+    """Picks the files and chunks most relevant to query that fit in token_budget.
+
+    files maps path -> content. Returns the formatted file blocks for the prompt.
+    If everything fits, every file is included whole. Files named in pinned_files
+    are included whole first. With whole_files=True, files are never cut into
+    excerpts (needed when the model has to return full file contents).
+    """
+    total = sum(estimate_tokens(content) for content in files.values())
+    if total <= token_budget:
+        return [format_file(file_path, content) for file_path, content in files.items()]
+
+    pinned_names = {os.path.basename(os.path.normpath(f)) for f in pinned_files}
+    selected_whole = []
+    remaining = token_budget
+    for file_path, content in files.items():
+        if os.path.basename(file_path) in pinned_names and estimate_tokens(content) <= remaining:
+            selected_whole.append(file_path)
+            remaining -= estimate_tokens(content)
+
+    ranked = RepoIndex(files).rank(query)
+    selected_ranges = {}
+
+    if whole_files:
+        file_scores = {}
+        for score, chunk in ranked:
+            file_scores[chunk["file"]] = max(file_scores.get(chunk["file"], 0), score)
+        for file_path, score in sorted(file_scores.items(), key=lambda pair: pair[1], reverse=True):
+            cost = estimate_tokens(files[file_path])
+            if score > 0 and file_path not in selected_whole and cost <= remaining:
+                selected_whole.append(file_path)
+                remaining -= cost
+    else:
+        for score, chunk in ranked:
+            if score <= 0:
+                break
+            if chunk["file"] in selected_whole:
+                continue
+            cost = estimate_tokens(chunk["text"])
+            if cost > remaining:
+                continue
+            selected_ranges.setdefault(chunk["file"], []).append((chunk["start"], chunk["end"]))
+            remaining -= cost
+
+    blocks = []
+    for file_path, content in files.items():
+        if file_path in selected_whole:
+            blocks.append(format_file(file_path, content))
+        elif file_path in selected_ranges:
+            blocks.append(format_excerpts(file_path, content, selected_ranges[file_path]))
+
+    if not blocks:
+        # nothing matched the query, so fall back to whatever fits
+        remaining = token_budget
+        for file_path, content in files.items():
+            if estimate_tokens(content) <= remaining:
+                blocks.append(format_file(file_path, content))
+                remaining -= estimate_tokens(content)
+
+    print(f"[INFO] Selected {len(blocks)} of {len(files)} files ({token_budget - remaining} of ~{total} tokens) for the prompt.")
+    return blocks
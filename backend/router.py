@@ -0,0 +1,157 @@
+"""Picks the model and reasoning effort of each LLM call and enforces token budgets.
+
+Calls name their task ("summary", "tickets", "code" or "fix"). The prompt is
+counted locally first: prompts of LARGE_PROMPT_TOKENS or more get the task's
+large-prompt effort, and a prompt over MAX_CALL_TOKENS, or one that doesn't
+fit in what is left of the session's TokenBudget, raises BudgetExceeded
+before anything is sent.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+try:
+    from . import telemetry
+except:
+    import telemetry
+
+DEFAULT_MODEL = "o3-mini"
+# prompts from this size on get the task's large-prompt effort
+LARGE_PROMPT_TOKENS = int(os.getenv("LLM_LARGE_PROMPT_TOKENS", "8000"))
+# prompt tokens allowed in a single call, well under the model's context window
+MAX_CALL_TOKENS = int(os.getenv("LLM_MAX_CALL_TOKENS", "120000"))
+# prompt and completion tokens a session may spend in total; 0 for no limit
+SESSION_TOKEN_BUDGET = int(os.getenv("LLM_SESSION_TOKEN_BUDGET", "2000000"))
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _route(task, model, effort, large_effort):
+    """LLM_ROUTE_<TASK>=model,effort,large_effort overrides the defaults; an empty
+    effort sends none, for models without reasoning."""
+    override = os.getenv(f"LLM_ROUTE_{task.upper()}")
+    if override:
+        parts = [part.strip() for part in override.split(",")]
+        model = parts[0] or model
+        effort = parts[1] if len(parts) > 1 else effort
+        large_effort = parts[2] if len(parts) > 2 else effort
+    return {"model": model, "effort": effort, "large_effort": large_effort}
+
+
+# summaries and ticket splitting are short and simple; code generation and
+# fixes are where the reasoning pays off, more so on big prompts
+ROUTES = {
+    "summary": _route("summary", DEFAULT_MODEL, "low", "low"),
+    "tickets": _route("tickets", DEFAULT_MODEL, "low", "medium"),
+    "code": _route("code", DEFAULT_MODEL, "medium", "high"),
+    "fix": _route("fix", DEFAULT_MODEL, "medium", "high"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # the encodings are downloaded on first use
+        print(f"[WARNING] No tokenizer for {model}, estimating prompt sizes: {e}")
+        return None
+
+
+def count_tokens(messages, model=DEFAULT_MODEL):
+    """Prompt tokens of the messages, with tiktoken when it is installed."""
+    encoding = _encoding(model)
+    text = "\n".join(message.get("content") or "" for message in messages)
+    if encoding is None:
+        # roughly four characters per token for code and English
+        return len(text) // 4 + 1
+    # plus a few tokens of framing per message
+    return len(encoding.encode(text, disallowed_special=())) + 4 * len(messages)
+
+
+class TokenBudget:
+    """Tokens a session may spend on the API, shared by all of its calls."""
+
+    def __init__(self, limit=SESSION_TOKEN_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def check(self, prompt_tokens, task):
+        with self._lock:
+            if self.limit and self.used + prompt_tokens > self.limit:
+                raise BudgetExceeded(
+                    f"Token budget exhausted: {self.used} of {self.limit} tokens used, "
+                    f"the next {task} call needs ~{prompt_tokens} more (LLM_SESSION_TOKEN_BUDGET)."
+                )
+
+    def charge(self, tokens):
+        with self._lock:
+            self.used += tokens
+
+    def to_dict(self):
+        with self._lock:
+            return {"limit": self.limit, "used": self.used}
+
+
+_budget = contextvars.ContextVar("token_budget", default=None)
+
+
+@contextlib.contextmanager
+def token_budget(budget):
+    """Charges the LLM calls made in the block, including on propagated threads, to budget."""
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+class Route:
+    def __init__(self, task, model, params, prompt_tokens):
+        self.task = task
+        self.model = model
+        self.params = params
+        self.prompt_tokens = prompt_tokens
+
+    def preflight(self):
+        """Raises BudgetExceeded if the call can't be made; called right before
+        sending, so cached responses are served whatever the budget."""
+        if self.prompt_tokens > MAX_CALL_TOKENS:
+            raise BudgetExceeded(
+                f"The {self.task} prompt is ~{self.prompt_tokens} tokens, "
+                f"over the per-call limit of {MAX_CALL_TOKENS} (LLM_MAX_CALL_TOKENS)."
+            )
+        budget = _budget.get()
+        if budget is not None:
+            budget.check(self.prompt_tokens, self.task)
+
+    def charge(self, usage):
+        budget = _budget.get()
+        if budget is not None and usage is not None:
+            budget.charge(usage.total_tokens or 0)
+
+
+def route(task, messages, model=None, params=None):
+    """The Route of a call: the task's model, unless one is given, and its
+    reasoning effort for the prompt size, unless params set one."""
+    config = ROUTES.get(task, ROUTES["code"])
+    model = model or config["model"]
+    prompt_tokens = count_tokens(messages, model)
+    params = dict(params or {})
+    effort = config["large_effort"] if prompt_tokens >= LARGE_PROMPT_TOKENS else config["effort"]
+    if effort and "reasoning_effort" not in params:
+        params["reasoning_effort"] = effort
+    telemetry.count(**{f"llm_calls_{task}": 1})
+    return Route(task, model, params, prompt_tokens)
@@ -0,0 +1,117 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from .telemetry import propagate
+except:
+    from telemetry import propagate
+
+MAX_PARALLEL_TICKETS = int(os.getenv("MAX_PARALLEL_TICKETS", "4"))
+
+
+def _touches(ticket):
+    return {os.path.basename(os.path.normpath(f)) for f in ticket.files}
+
+
+def _overlaps(a, b):
+    # a ticket that didn't declare its files may touch anything
+    if not a.files or not b.files:
+        return True
+    return bool(_touches(a) & _touches(b))
+
+
+def plan_waves(tickets):
+    """Groups tickets into waves that can run at the same time.
+
+    A ticket is placed after every ticket it depends on and after every earlier
+    ticket that touches one of the same files, so the original order is kept
+    wherever two tickets could step on each other.
+    """
+    wave_of = {}
+    waves = []
+
+    for index, ticket in enumerate(tickets):
+        wave = 0
+        for earlier in tickets[:index]:
+            if earlier.id in ticket.depends_on or _overlaps(earlier, ticket):
+                wave = max(wave, wave_of[earlier.id] + 1)
+        wave_of[ticket.id] = wave
+        if wave == len(waves):
+            waves.append([])
+        waves[wave].append(ticket)
+
+    return waves
+
+
+def find_conflicts(ticket, workspace):
+    """Files the ticket wants to write that changed in the workspace since it read them."""
+    conflicts = []
+    for file_path in ticket.updated_files:
+        if workspace.read(file_path) != ticket.base_files.get(file_path):
+            conflicts.append(file_path)
+    return conflicts
+
+
+def merge_ticket(ticket, workspace, repo_summary, **callbacks):
+    """Merges a ticket's updated_files into the workspace and flushes them to disk.
+
+    If another ticket of the same wave already changed one of its files, the
+    ticket is re-run against the merged tree instead of overwriting that work.
+    """
+    conflicts = find_conflicts(ticket, workspace)
+    if conflicts:
+        print(f"[INFO] Merge conflict on {conflicts} for ticket: {ticket.summary}, re-running it on the merged repo")
+        return ticket.complete(workspace, repo_summary, write=True, **callbacks)
+
+    ticket.write_updates(workspace)
+    return None
+
+
+def _stream_callbacks(ticket, on_text, on_file):
+    return {
+        "on_text": (lambda fragment: on_text(ticket, fragment)) if on_text else None,
+        "on_file": (lambda file_path: on_file(ticket, file_path)) if on_file else None,
+    }
+
+
+def run_tickets(tickets, workspace, repo_summary, on_start=None, on_complete=None, on_text=None, on_file=None, max_workers=MAX_PARALLEL_TICKETS):
+    """Completes tickets wave by wave, running independent tickets concurrently.
+
+    on_start(ticket) is called when a ticket starts, on_complete(ticket, response)
+    once its files are merged. Both are called from the calling thread, so
+    on_complete can safely use resources shared between tickets (e.g. the
+    Scrapybara instance used for debugging). on_text(ticket, fragment) and
+    on_file(ticket, file_path) stream progress while a ticket is generated and
+    may be called from worker threads.
+    """
+    for index, ticket in enumerate(tickets):
+        if ticket.id is None:
+            ticket.id = index
+
+    responses = []
+    waves = plan_waves(tickets)
+    print(f"[INFO] Running {len(tickets)} tickets in {len(waves)} waves.")
+
+    for wave in waves:
+        for ticket in wave:
+            if on_start:
+                on_start(ticket)
+
+        if len(wave) == 1:
+            results = [wave[0].complete(workspace, repo_summary, write=False, **_stream_callbacks(wave[0], on_text, on_file))]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [
+                    executor.submit(propagate(ticket.complete), workspace, repo_summary, False, **_stream_callbacks(ticket, on_text, on_file))
+                    for ticket in wave
+                ]
+                results = [future.result() for future in futures]
+
+        for ticket, response in zip(wave, results):
+            rerun_response = merge_ticket(ticket, workspace, repo_summary, **_stream_callbacks(ticket, on_text, on_file))
+            if rerun_response is not None:
+                response = rerun_response
+            responses.append(response)
+            if on_complete:
+                on_complete(ticket, response)
+
+    return responses
@@ -0,0 +1,88 @@
+"""JSON schemas of the structured LLM responses.
+
+They are sent as strict json_schema response formats, which can't have
+free-form object keys, so per-file results are arrays of objects carrying a
+"file_path". files_by_path() and edits_by_path() turn them back into the
+{path: value} mappings the rest of the pipeline uses; both also accept that
+keyed shape directly, as older cached responses have it.
+"""
+
+
+def _object(properties):
+    # strict mode requires every property to be listed as required
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+_STRING = {"type": "string"}
+
+
+def _file_list(value_key):
+    return {"type": "array", "items": _object({"file_path": _STRING, value_key: _STRING})}
+
+
+TICKET_EDITS_SCHEMA = {
+    "name": "ticket_edits",
+    "schema": _object({
+        "internal_dialogue": _STRING,
+        "edits": {"type": "array", "items": _object({"file_path": _STRING, "search": _STRING, "replace": _STRING})},
+        "new_files": _file_list("content"),
+    }),
+}
+
+TICKET_FULL_FILES_SCHEMA = {
+    "name": "ticket_full_files",
+    "schema": _object({
+        "internal_dialogue": _STRING,
+        "updated_files": _file_list("content"),
+    }),
+}
+
+SUMMARY_SCHEMA = {
+    "name": "file_summaries",
+    "schema": _object({"files": _file_list("summary")}),
+}
+
+TICKET_LIST_SCHEMA = {
+    "name": "ticket_list",
+    "schema": _object({
+        "project": _STRING,
+        "tickets": {"type": "array", "items": _object({
+            "summary": _STRING,
+            "description": _STRING,
+            "files": {"type": "array", "items": _STRING},
+            "depends_on": {"type": "array", "items": {"type": "integer"}},
+        })},
+    }),
+}
+
+
+def response_format(schema):
+    return {"type": "json_schema", "json_schema": dict(schema, strict=True)}
+
+
+def files_by_path(entries, value_key):
+    """{path: value} from [{"file_path": ..., value_key: ...}]."""
+    if isinstance(entries, dict):
+        return entries
+    files = {}
+    for entry in entries or []:
+        if isinstance(entry, dict) and isinstance(entry.get("file_path"), str) and value_key in entry:
+            files[entry["file_path"]] = entry[value_key]
+    return files
+
+
+def edits_by_path(entries):
+    """{path: [{"search", "replace"}, ...]} from [{"file_path", "search", "replace"}], in order."""
+    if isinstance(entries, dict):
+        return entries
+    edits = {}
+    for entry in entries or []:
+        if isinstance(entry, dict) and isinstance(entry.get("file_path"), str):
+            # a block missing "search" or "replace" is left for apply_edits to reject
+            edits.setdefault(entry["file_path"], []).append({key: entry[key] for key in ("search", "replace") if key in entry})
+    return edits
@@ -0,0 +1,123 @@
+import os
+import re
+import shutil
+import threading
+import time
+from collections import OrderedDict
+try:
+    from .progress import get_channel, release
+    from .router import TokenBudget
+except:
+    from progress import get_channel, release
+    from router import TokenBudget
+
+DEFAULT_PROJECT = "default"
+DEFAULT_REPO_PATH = "../frontend/static/product"
+SESSIONS_ROOT = os.getenv("SESSIONS_ROOT", "../frontend/static/sessions")
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "8"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", str(2 * 3600)))
+
+
+def session_slug(name):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_") or DEFAULT_PROJECT
+
+
+class Session:
+    """One project: its Prototyper, its own workspace on disk and its progress channel."""
+
+    def __init__(self, name, workspace):
+        self.name = name
+        self.workspace = workspace
+        self.repo_path = DEFAULT_REPO_PATH if name == DEFAULT_PROJECT else os.path.join(workspace, "product")
+        self.prototyper = None
+        self.progress = get_channel(name)
+        # LLM tokens spent on the project, across its create and iterate jobs
+        self.token_budget = TokenBudget()
+        # held while a pipeline runs so two requests can't work on the same tree
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def touch(self):
+        self.last_used = time.time()
+
+    def busy(self):
+        if self.lock.acquire(blocking=False):
+            self.lock.release()
+            return False
+        return True
+
+
+class SessionRegistry:
+    """Sessions keyed by project name, evicted least-recently-used.
+
+    At most max_sessions are kept, and sessions idle for longer than idle_seconds
+    are dropped together with their workspace. Sessions with a running pipeline
+    are never evicted.
+    """
+
+    def __init__(self, root=SESSIONS_ROOT, max_sessions=MAX_SESSIONS, idle_seconds=SESSION_IDLE_SECONDS):
+        self.root = root
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        # names with the same slug share a workspace, so they are one session
+        key = session_slug(name)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session:
+                session.touch()
+                self._sessions.move_to_end(key)
+            return session
+
+    def open(self, name):
+        """Returns the session for name, creating it (and evicting others) if needed."""
+        key = session_slug(name)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = Session(key, os.path.join(self.root, key))
+                self._sessions[key] = session
+            session.touch()
+            self._sessions.move_to_end(key)
+            self._evict_locked(keep=session)
+            return session
+
+    def evict_idle(self):
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self, keep=None):
+        now = time.time()
+        candidates = [s for s in self._sessions.values() if s is not keep and not s.busy()]
+
+        for session in candidates:
+            if now - session.last_used > self.idle_seconds:
+                self._remove(session)
+
+        # least recently used first
+        for session in candidates:
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if session.name in self._sessions:
+                self._remove(session)
+
+    def _remove(self, session):
+        del self._sessions[session.name]
+        session.progress.close()
+        # subscribers still streaming release it when they disconnect
+        release(session.progress)
+        if session.repo_path != DEFAULT_REPO_PATH and os.path.exists(session.workspace):
+            shutil.rmtree(session.workspace, ignore_errors=True)
+        print(f"[INFO] Evicted session '{session.name}'.")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "busy": sum(1 for s in self._sessions.values() if s.busy()),
+                "max_sessions": self.max_sessions,
+                "tokens_used": sum(s.token_budget.used for s in self._sessions.values()),
+            }
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots"))
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tree_id(files):
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SnapshotStore:
+    """Content-addressed snapshots of workspaces.
+
+    Each file content is stored once under objects/, keyed by its hash and
+    shared by every workspace and session. A snapshot is a tree manifest
+    (relative path -> hash) under trees/, identified by the hash of that
+    mapping. A stat index per workspace remembers each file's hash by size and
+    mtime, so snapshot() and checkout() only read and write changed files.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        for directory in ("objects", "trees", "index"):
+            os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    def _object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:])
+
+    def _tree_path(self, snapshot_id):
+        return os.path.join(self.root, "trees", f"{snapshot_id}.json")
+
+    def _index_path(self, repo_path):
+        key = hashlib.sha256(os.path.abspath(repo_path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, "index", f"{key}.json")
+
+    @staticmethod
+    def _write_atomically(path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def _load_index(self, repo_path):
+        try:
+            with open(self._index_path(repo_path), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self, repo_path, index):
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+        self._write_atomically(self._index_path(repo_path), write)
+
+    def _scan(self, repo_path, index, store=False):
+        """Returns {relative path: hash} for repo_path, hashing only files whose stat changed.
+
+        With store=True the contents of changed files are added to the object store.
+        """
+        files = {}
+        seen = set()
+        for root, _, names in os.walk(repo_path):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, repo_path).replace(os.sep, "/")
+                seen.add(relative)
+                stat = os.stat(path)
+                cached = index.get(relative)
+                if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                    digest = cached[2]
+                else:
+                    digest = file_hash(path)
+                    index[relative] = [stat.st_size, stat.st_mtime_ns, digest]
+                if store and not os.path.exists(self._object_path(digest)):
+                    self._write_atomically(self._object_path(digest), lambda tmp_path: shutil.copyfile(path, tmp_path))
+                files[relative] = digest
+        for relative in set(index) - seen:
+            del index[relative]
+        return files
+
+    def snapshot(self, repo_path):
+        """Stores the current state of repo_path and returns its snapshot id."""
+        with self._lock:
+            index = self._load_index(repo_path)
+            files = self._scan(repo_path, index, store=True)
+            self._save_index(repo_path, index)
+
+        snapshot_id = tree_id(files)
+        if not os.path.exists(self._tree_path(snapshot_id)):
+            def write(tmp_path):
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(files, f, sort_keys=True)
+            self._write_atomically(self._tree_path(snapshot_id), write)
+        return snapshot_id
+
+    def tree(self, snapshot_id):
+        with open(self._tree_path(snapshot_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def checkout(self, snapshot_id, repo_path):
+        """Makes repo_path match the snapshot, writing and deleting only the files
+        that differ. Returns (files written, files removed)."""
+        target = self.tree(snapshot_id)
+        with self._lock:
+            index = self._load_index(repo_path)
+            current = self._scan(repo_path, index) if os.path.isdir(repo_path) else {}
+
+            written = 0
+            for relative, digest in target.items():
+                if current.get(relative) == digest:
+                    continue
+                path = os.path.join(repo_path, relative)
+                self._write_atomically(path, lambda tmp_path: shutil.copyfile(self._object_path(digest), tmp_path))
+                stat = os.stat(path)
+                index[relative] = [stat.st_size, stat.st_mtime_ns, digest]
+                written += 1
+
+            removed = 0
+            for relative in set(current) - set(target):
+                path = os.path.join(repo_path, relative)
+                os.remove(path)
+                index.pop(relative, None)
+                removed += 1
+                # drop directories left empty, up to the repo root
+                directory = os.path.dirname(path)
+                while os.path.abspath(directory) != os.path.abspath(repo_path) and not os.listdir(directory):
+                    os.rmdir(directory)
+                    directory = os.path.dirname(directory)
+
+            os.makedirs(repo_path, exist_ok=True)
+            self._save_index(repo_path, index)
+        return written, removed
+
+    def stats(self):
+        objects = 0
+        size = 0
+        for root, _, names in os.walk(os.path.join(self.root, "objects")):
+            for name in names:
+                objects += 1
+                size += os.path.getsize(os.path.join(root, name))
+        return {
+            "objects": objects,
+            "object_bytes": size,
+            "snapshots": len(os.listdir(os.path.join(self.root, "trees"))),
+        }
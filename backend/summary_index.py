@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class SummaryIndex:
+    """Per-file summaries of a repo keyed by content hash.
+
+    The index lives next to the repo directory (e.g. static/.product_summaries.json
+    for static/product) so it survives the repo being recreated from the template.
+    """
+
+    def __init__(self, repo_path):
+        repo_path = os.path.normpath(repo_path)
+        self.repo_path = repo_path
+        self.index_path = os.path.join(os.path.dirname(repo_path), f".{os.path.basename(repo_path)}_summaries.json")
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def changed_files(self, files):
+        """Given {relative path: content}, returns the subset whose summary is stale."""
+        return {
+            path: content
+            for path, content in files.items()
+            if self.entries.get(path, {}).get("hash") != content_hash(content)
+        }
+
+    def update(self, files, summaries):
+        """Stores new summaries for the given files and drops files that no longer exist."""
+        for path, summary in summaries.items():
+            if path in files:
+                self.entries[path] = {"hash": content_hash(files[path]), "summary": summary}
+        for path in list(self.entries):
+            if path not in files:
+                del self.entries[path]
+
+    def combined_summary(self):
+        return "\n".join(
+            f"{path}: {entry['summary']}" for path, entry in sorted(self.entries.items())
+        )
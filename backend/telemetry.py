@@ -0,0 +1,211 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# finished traces are also written here as <job id>.json when set
+TRACE_DIR = os.getenv("TRACE_DIR")
+# durations kept per span name for the percentiles in /metrics
+METRICS_SAMPLES = int(os.getenv("METRICS_SAMPLES", "500"))
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+# the open spans of this thread of work, innermost last
+_open_spans = contextvars.ContextVar("open_spans", default=())
+# spans can be shared by threads through propagate()
+_counters_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name, parent=None, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.parent_id = parent.id if parent else None
+        self.attrs = attrs
+        self.counters = {}
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(self.duration * 1000, 1),
+            "attrs": self.attrs,
+            "counters": self.counters,
+        }
+
+
+class Trace:
+    """The spans recorded while running one job."""
+
+    def __init__(self, trace_id, **attrs):
+        self.id = trace_id
+        self.attrs = attrs
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {"trace_id": self.id, "attrs": self.attrs, "spans": [span.to_dict() for span in spans]}
+
+    def save(self, directory=TRACE_DIR):
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{self.id}.json"), "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+
+
+class Metrics:
+    """Process-wide span timings and counters, as served by /metrics."""
+
+    def __init__(self, samples=METRICS_SAMPLES):
+        self.samples = samples
+        self._timings = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, error=False):
+        with self._lock:
+            timing = self._timings.setdefault(name, {"count": 0, "errors": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=self.samples)})
+            timing["count"] += 1
+            timing["errors"] += 1 if error else 0
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            timing["recent"].append(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            timings = {}
+            for name, timing in sorted(self._timings.items()):
+                recent = sorted(timing["recent"])
+                timings[name] = {
+                    "count": timing["count"],
+                    "errors": timing["errors"],
+                    "avg_ms": timing["total"] / timing["count"] * 1000,
+                    "p50_ms": recent[len(recent) // 2] * 1000,
+                    "p95_ms": recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000,
+                    "max_ms": timing["max"] * 1000,
+                }
+            return {"spans": timings, "counters": dict(sorted(self._counters.items()))}
+
+
+metrics = Metrics()
+
+
+def current_span():
+    spans = _open_spans.get()
+    return spans[-1] if spans else None
+
+
+@contextmanager
+def tracing(trace):
+    """Records the spans opened inside the block (and in work propagated from it) into trace."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def start_span(name, **attrs):
+    """Opens a span as a child of the current one; close it with end_span()."""
+    span = Span(name, current_span(), **attrs)
+    span._token = _open_spans.set(_open_spans.get() + (span,))
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(span)
+    return span
+
+
+def end_span(span, error=None):
+    if span.end is not None:
+        return
+    span.end = time.time()
+    if error is not None:
+        span.set(error=str(error))
+    try:
+        _open_spans.reset(span._token)
+    except ValueError:
+        # ended from a different context than it was started in
+        _open_spans.set(tuple(s for s in _open_spans.get() if s is not span))
+    metrics.observe(span.name, span.duration, error is not None)
+
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a span named `name`; yields the Span for adding attributes."""
+    opened = start_span(name, **attrs)
+    try:
+        yield opened
+    except BaseException as e:
+        end_span(opened, error=e)
+        raise
+    end_span(opened)
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record(name, seconds, **attrs):
+    """Adds an already finished span that took `seconds` and ended now."""
+    finished = Span(name, current_span(), **attrs)
+    finished.end = time.time()
+    finished.start = finished.end - seconds
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(finished)
+    metrics.observe(name, seconds)
+
+
+def count(**values):
+    """Adds values (e.g. prompt_tokens=...) to every open span and to the process-wide counters."""
+    with _counters_lock:
+        for span in _open_spans.get():
+            for key, value in values.items():
+                span.counters[key] = span.counters.get(key, 0) + value
+    for key, value in values.items():
+        metrics.increment(key, value)
+
+
+def propagate(fn):
+    """Wraps fn so it runs in the current trace and span when called from another thread."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # a context can only be entered by one thread at a time, so each call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
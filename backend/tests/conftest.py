@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the backend modules import each other as top-level modules, like when app.py is run
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the API client is built at import, but the tests never reach the API
+os.environ.setdefault("OPENAI_API_KEY", "offline")
@@ -0,0 +1,32 @@
+from bundler import strip_css, strip_js
+
+
+def test_js_comments_are_dropped():
+    assert strip_js("const a = 1; // one\n/* two */ const b = 2;") == "const a = 1;\nconst b = 2;"
+
+
+def test_js_strings_keep_comment_markers_and_whitespace():
+    code = "const url = 'http://example.com/a';\nconst s = \"/* not a comment */\";\nconst t = `a  //  b`;"
+    assert strip_js(code) == code
+
+
+def test_js_regex_keeps_slashes_and_quotes():
+    code = "const re = /\\/\\/[\"']+/g;\nconst parts = path.split(/[/\\\\]/);"
+    assert strip_js(code) == code
+
+
+def test_js_division_is_not_a_regex():
+    assert strip_js("const half = total / 2; // half\nconst q = a / b / c;") == "const half = total / 2;\nconst q = a / b / c;"
+
+
+def test_js_line_breaks_are_kept_for_semicolon_insertion():
+    assert strip_js("let a = 1\n\n\n   let b = a\n") == "let a = 1\nlet b = a"
+
+
+def test_css_comments_and_whitespace_are_dropped():
+    assert strip_css("body {\n  margin: 0;\n  /* reset */\n}\n") == "body{margin: 0}"
+
+
+def test_css_strings_are_kept():
+    code = 'a::after { content: "/* ; { } */"; }\n.b { background: url(\'a  b.png\'); }'
+    assert strip_css(code) == 'a::after{content: "/* ; { } */"}.b{background: url(\'a  b.png\')}'
@@ -0,0 +1,48 @@
+import json
+
+from jsonstream import StreamingJSONParser
+
+
+def feed_in_chunks(parser, text, size=7):
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+
+
+def test_entries_are_reported_as_they_complete():
+    response = '```json\n{"internal_dialogue": "ok", "updated_files": [{"file_path": "a.js", "content": "1"}, {"file_path": "b.js", "content": "2"}]}\n```'
+    seen = []
+    parser = StreamingJSONParser(on_entry=lambda section, key, value: seen.append((section, key)))
+    feed_in_chunks(parser, response)
+    assert seen == [("updated_files", "a.js"), ("updated_files", "b.js")]
+    assert parser.done
+    assert parser.incomplete_files() == []
+
+
+def test_truncated_response_keeps_complete_entries():
+    response = json.dumps({
+        "edits": [
+            {"file_path": "a.js", "search": "x", "replace": "y"},
+            {"file_path": "b.js", "search": "p", "replace": "q"},
+        ]
+    })
+    parser = StreamingJSONParser()
+    # cut inside the second entry
+    feed_in_chunks(parser, response[:response.index('"p"')])
+    assert not parser.done
+    assert parser.entries == {"edits": [{"file_path": "a.js", "search": "x", "replace": "y"}]}
+    assert parser.incomplete_files() == ["b.js"]
+
+
+def test_truncated_section_keyed_by_path():
+    parser = StreamingJSONParser()
+    feed_in_chunks(parser, '{"updated_files": {"a.js": "done", "b.js": "half of the fi')
+    assert parser.entries == {"updated_files": {"a.js": "done"}}
+    assert parser.incomplete_files() == ["b.js"]
+
+
+def test_text_streams_across_an_escape_split_between_chunks():
+    fragments = []
+    parser = StreamingJSONParser(on_text=lambda key, fragment: fragments.append(fragment))
+    for chunk in ('{"internal_dialogue": "line one\\', 'nline two \\u00', 'e9", "edits": []}'):
+        parser.feed(chunk)
+    assert "".join(fragments) == "line one\nline two é"
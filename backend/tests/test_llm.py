@@ -0,0 +1,21 @@
+from llm import parse_json
+
+
+def test_whole_text():
+    assert parse_json('{"a": 1}') == {"a": 1}
+
+
+def test_fenced_block_with_prose_around_it():
+    assert parse_json('Here you go:\n```json\n{"a": [1, 2]}\n```\nDone.') == {"a": [1, 2]}
+
+
+def test_object_followed_by_text():
+    assert parse_json('Result: {"a": "}"} and some notes {not json}') == {"a": "}"}
+
+
+def test_truncated_object_is_none():
+    assert parse_json('```json\n{"edits": [{"file_path": "a.js", "search": "x"') is None
+
+
+def test_non_object_is_none():
+    assert parse_json("[1, 2, 3]") is None
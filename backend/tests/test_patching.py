@@ -0,0 +1,29 @@
+import pytest
+
+from patching import PatchError, apply_edits
+
+
+def test_exact_match_is_replaced():
+    content = "const a = 1;\nconst b = 2;\n"
+    assert apply_edits(content, [{"search": "const b = 2;", "replace": "const b = 3;"}]) == "const a = 1;\nconst b = 3;\n"
+
+
+def test_match_ignoring_trailing_whitespace():
+    content = "function f() {   \n  return 1;\t\n}\n"
+    edit = {"search": "function f() {\n  return 1;\n}", "replace": "function f() {\n  return 2;\n}"}
+    assert apply_edits(content, [edit]) == "function f() {\n  return 2;\n}\n"
+
+
+def test_ambiguous_search_is_rejected():
+    content = "x++;\nx++;\n"
+    with pytest.raises(PatchError, match="matches 2 places"):
+        apply_edits(content, [{"search": "x++;", "replace": "x--;"}])
+
+
+def test_missing_search_is_rejected():
+    with pytest.raises(PatchError, match="not found"):
+        apply_edits("const a = 1;\n", [{"search": "const c = 3;", "replace": ""}])
+
+
+def test_empty_search_appends():
+    assert apply_edits("const a = 1;\n", [{"search": "", "replace": "const b = 2;\n"}]) == "const a = 1;\nconst b = 2;\n"
@@ -0,0 +1,30 @@
+from scheduler import plan_waves
+from ticket import Ticket
+
+
+def ids(waves):
+    return [[ticket.id for ticket in wave] for wave in waves]
+
+
+def test_tickets_on_different_files_share_a_wave():
+    tickets = [Ticket("a", "", files=["script.js"], id=0), Ticket("b", "", files=["styles.css"], id=1)]
+    assert ids(plan_waves(tickets)) == [[0, 1]]
+
+
+def test_file_overlap_splits_waves():
+    tickets = [
+        Ticket("a", "", files=["script.js"], id=0),
+        Ticket("b", "", files=["styles.css"], id=1),
+        Ticket("c", "", files=["./script.js", "index.html"], id=2),
+    ]
+    assert ids(plan_waves(tickets)) == [[0, 1], [2]]
+
+
+def test_ticket_without_files_runs_alone():
+    tickets = [Ticket("a", "", files=["script.js"], id=0), Ticket("b", "", id=1), Ticket("c", "", files=["styles.css"], id=2)]
+    assert ids(plan_waves(tickets)) == [[0], [1], [2]]
+
+
+def test_dependency_splits_waves():
+    tickets = [Ticket("a", "", files=["script.js"], id=0), Ticket("b", "", files=["styles.css"], depends_on=[0], id=1)]
+    assert ids(plan_waves(tickets)) == [[0], [1]]
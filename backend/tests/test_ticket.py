@@ -0,0 +1,66 @@
+import json
+import os
+
+import ticket
+from ticket import Ticket
+from workspace import Workspace
+
+
+def make_workspace(tmp_path):
+    (tmp_path / "script.js").write_text("const a = 1;\nconst b = 1;\n")
+    (tmp_path / "styles.css").write_text("body { margin: 0; }\n")
+    workspace = Workspace(str(tmp_path))
+    workspace.refresh()
+    return workspace
+
+
+def test_truncated_response_is_salvaged_and_the_rest_re_requested(tmp_path, monkeypatch):
+    workspace = make_workspace(tmp_path)
+    script, styles = workspace.path("script.js"), workspace.path("styles.css")
+    response = json.dumps({
+        "internal_dialogue": "Changed both files.",
+        "edits": [
+            {"file_path": script, "search": "const a = 1;", "replace": "const a = 2;"},
+            {"file_path": styles, "search": "margin: 0;", "replace": "margin: 1px;"},
+        ],
+    })
+    # cut inside the styles.css edit
+    truncated = response[:response.index('"margin: 0;"')]
+    monkeypatch.setattr(ticket, "stream_chatcompletion", lambda *args, **kwargs: iter([truncated]))
+    re_requested = []
+
+    def full_files(prompt, **kwargs):
+        re_requested.append(prompt)
+        return json.dumps({"updated_files": [{"file_path": styles, "content": "body { margin: 1px; }\n"}]})
+
+    monkeypatch.setattr(ticket, "chatcompletion_stream", full_files)
+
+    change_both = Ticket("Change both", "", files=["script.js", "styles.css"], output_format="edits")
+    dialogue = change_both.complete(workspace, "", write=False)
+
+    assert "cut off" in dialogue
+    assert len(re_requested) == 1 and styles in re_requested[0] and script not in re_requested[0]
+    assert change_both.updated_files == {
+        os.path.normpath(script): "const a = 2;\nconst b = 1;\n",
+        os.path.normpath(styles): "body { margin: 1px; }\n",
+    }
+
+
+def test_cut_file_is_dropped_when_the_re_request_fails(tmp_path, monkeypatch):
+    workspace = make_workspace(tmp_path)
+    script = workspace.path("script.js")
+    response = json.dumps({
+        "edits": [
+            {"file_path": script, "search": "const a = 1;", "replace": "const a = 2;"},
+            {"file_path": script, "search": "const b = 1;", "replace": "const b = 2;"},
+        ],
+    })
+    # cut inside the second edit of script.js
+    truncated = response[:response.index('"const b = 1;"')]
+    monkeypatch.setattr(ticket, "stream_chatcompletion", lambda *args, **kwargs: iter([truncated]))
+    monkeypatch.setattr(ticket, "chatcompletion_stream", lambda *args, **kwargs: None)
+
+    change_script = Ticket("Change script", "", files=["script.js"], output_format="edits")
+    change_script.complete(workspace, "", write=False)
+
+    assert change_script.updated_files == {}
@@ -1,115 +1,238 @@
-import re
 import os
 import requests
-import json
+import time
 try:
-    from .llm import chatcompletion_stream
+    from .llm import chatcompletion_stream, stream_chatcompletion, parse_json
+    from .jsonstream import StreamingJSONParser
+    from .schemas import TICKET_EDITS_SCHEMA, TICKET_FULL_FILES_SCHEMA, files_by_path, edits_by_path
+    from .patching import apply_file_changes
+    from .retrieval import select_context
+    from .prompts import PromptBuilder
+    from .telemetry import traced, current_span, count
 except:
-    from llm import chatcompletion_stream
+    from llm import chatcompletion_stream, stream_chatcompletion, parse_json
+    from jsonstream import StreamingJSONParser
+    from schemas import TICKET_EDITS_SCHEMA, TICKET_FULL_FILES_SCHEMA, files_by_path, edits_by_path
+    from patching import apply_file_changes
+    from retrieval import select_context
+    from prompts import PromptBuilder
+    from telemetry import traced, current_span, count
 
-class Ticket:
-    def __init__(self, summary, description):
-        self.summary = summary
-        self.description = description
+# "edits": the model returns search/replace blocks or unified diffs per file,
+# "full": the model returns the full content of every changed file
+OUTPUT_FORMAT = os.getenv("TICKET_OUTPUT_FORMAT", "edits")
 
-    def __repr__(self):
-        return f"Ticket(summary='{self.summary}', description='{self.description}')"
+TICKET_INSTRUCTIONS = """You are an expert software engineer specializing in modifying and generating Three.js code.
+You will modify the given files based on a Jira ticket, given after the files.
 
-    def extract_json_response(self, response_text):
-        match = re.search(r"```json\n(.*?)```", response_text, re.DOTALL)
-        if match:
-            json_str = match.group(1).strip()
-            try:
-                return json.loads(json_str)  
-            except json.JSONDecodeError:
-                print("Error: AI returned malformed JSON. Returning raw response.")
-        
-        try:
-            return json.loads(response_text.strip())
-        except json.JSONDecodeError:
-            print("Error: AI returned non-JSON response.")
-            return {"internal_dialogue": "AI response was not formatted correctly.", "updated_files": {}}
+### INSTRUCTIONS:
+1. Modify the provided files to satisfy the requirements of the Jira ticket.
+"""
 
+FULL_FILES_INSTRUCTIONS = """2. Return your response in **valid JSON format** with the following structure:
 
-    def complete(self, repo_path, repo_summary):
-        if not os.path.exists(repo_path):
-            print(f"Error: Repository path '{repo_path}' does not exist.")
-            return {"internal_dialogue": "Invalid repository path.", "updated_files": {}}
+```json
+{{
+    "internal_dialogue": "Your thought process on what you changed and why.",
+    "updated_files": [
+        {{"file_path": "file path", "content": "updated file content as a string"}}
+    ]
+}}
+```
+Ensure only the updated code is included in "updated_files", and nothing extra. """
 
-        files_formatted = []
-        file_paths = []
+EDITS_INSTRUCTIONS = """2. Large files may only be shown as excerpts of the relevant lines. Do not rewrite whole files. Describe each change to an existing file as search/replace edit blocks: "search" is a short snippet copied exactly from the current file (include just enough lines to be unique) and "replace" is the text that replaces it. Edits of a file are applied in order.
+3. Put the full content of any newly created file in "new_files".
+4. Return your response in **valid JSON format** with the following structure:
 
-        for root, _, files in os.walk(repo_path):
-            for file in files:
-                file_path = os.path.join(root, file)
+```json
+{{
+    "internal_dialogue": "Your thought process on what you changed and why.",
+    "edits": [
+        {{"file_path": "file path", "search": "exact existing code", "replace": "new code"}}
+    ],
+    "new_files": [
+        {{"file_path": "file path", "content": "content of a new file as a string"}}
+    ]
+}}
+```
+Ensure only the changed files are included, and nothing extra. """
 
-                if not file.endswith((".html", ".js", ".css", ".py", ".ts", ".cpp", ".java")):
-                    continue
+class Ticket:
+    def __init__(self, summary, description, files=None, depends_on=None, id=None, use_cache=True, output_format=OUTPUT_FORMAT):
+        self.id = id
+        self.summary = summary
+        self.description = description
+        # files this ticket expects to create or modify, relative to the repo
+        self.files = files or []
+        # ids of earlier tickets this ticket builds on
+        self.depends_on = depends_on or []
+        self.use_cache = use_cache
+        self.output_format = output_format
+        # filled in by complete(): file contents the prompt was built from and
+        # the model's output, so the scheduler can merge and detect conflicts
+        self.base_files = {}
+        self.updated_files = {}
 
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        file_content = f.read()
+    def __repr__(self):
+        return f"Ticket(summary='{self.summary}', description='{self.description}')"
 
-                    files_formatted.append(f"**FILE PATH:** {file_path}\n**CONTENT START**\n{file_content}\n**CONTENT END**")
-                    file_paths.append(file_path)
+    def extract_json_response(self, response_text):
+        """The JSON object of a response, or None if it is malformed or cut off."""
+        parsed = parse_json(response_text)
+        if parsed is None:
+            print(f"Error: AI returned malformed JSON for ticket '{self.summary}'.")
+        return parsed
+
+
+    @traced("ticket.complete")
+    def complete(self, workspace, repo_summary, write=True, on_text=None, on_file=None):
+        """Runs the ticket against the Workspace. With write=False the updated files
+        are only stored on self.updated_files and left for the caller to merge.
+
+        While the response streams in, on_text(fragment) receives the model's
+        internal dialogue as it is generated and on_file(file_path) is called as
+        soon as the changes for a file are complete.
+        """
+        self.base_files = {}
+        self.updated_files = {}
+
+        if not os.path.exists(workspace.repo_path):
+            print(f"Error: Repository path '{workspace.repo_path}' does not exist.")
+            return {"internal_dialogue": "Invalid repository path.", "updated_files": {}}
 
-                except FileNotFoundError:
-                    print(f"Warning: File '{file_path}' not found. Skipping.")
-                except Exception as e:
-                    print(f"Error reading '{file_path}': {e}")
+        self.base_files = workspace.files()
 
-        if not files_formatted:
+        if not self.base_files:
             print("No valid files to process.")
             return {"internal_dialogue": "No valid files were found.", "updated_files": {}}
 
-        joined_files = '\n'.join(files_formatted)
-        prompt = f"""You are an expert software engineer specializing in modifying and generating Three.js code.
-You will modify the given files based on a Jira ticket.
-
-**TASK DETAILS**
-- Ticket Summary: {self.summary}
-- Ticket Description: {self.description}
-
-***REPO SUMMARY***
-{repo_summary}
-
-**FILES TO MODIFY**
-{joined_files}
-
-### INSTRUCTIONS:
-1. Modify the provided files to satisfy the requirements of the Jira ticket.
-2. Return your response in **valid JSON format** with the following structure:
-
-```json
-{{
-    "internal_dialogue": "Your thought process on what you changed and why.",
-    "updated_files": {{
-        "file_path": "updated file content as a string"
-    }}
-}}
-Ensure only the updated code is included in "updated_files", and nothing extra. """
-        
-        response = chatcompletion_stream(prompt)
+        # only the files and chunks relevant to this ticket go into the prompt
+        files_formatted = select_context(
+            self.base_files,
+            f"{self.summary}\n{self.description}",
+            pinned_files=self.files,
+            whole_files=self.output_format != "edits",
+        )
+
+        notified = set()
+
+        def on_entry(section, file_path, value):
+            # a file with several edit blocks is announced once
+            if on_file and file_path and file_path not in notified:
+                notified.add(file_path)
+                on_file(os.path.normpath(file_path))
+
+        parser = StreamingJSONParser(
+            on_entry=on_entry,
+            on_text=(lambda key, fragment: on_text(fragment)) if on_text else None,
+        )
+        span = current_span()
+        span.set(ticket=self.id, summary=self.summary)
+        started = time.time()
+        response = ""
+        for delta in stream_chatcompletion(self.build_prompt(repo_summary, files_formatted, self.output_format), use_cache=self.use_cache, schema=self.schema(self.output_format)):
+            if not response:
+                span.set(time_to_first_token_ms=round((time.time() - started) * 1000, 1))
+            response += delta
+            parser.feed(delta)
+        response = response.strip()
 
         if not response:
             print(f"Error: No response generated for ticket '{self.summary}'.")
             return {"internal_dialogue": "No AI response.", "updated_files": {}}
     
-        # Extract structured JSON response
         parsed_response = self.extract_json_response(response)
+        missing_files = []
+        if parsed_response is None:
+            # keep every file entry that arrived whole and only ask again for the rest
+            parsed_response = dict(parser.entries)
+            missing_files = [os.path.normpath(path) for path in parser.incomplete_files()]
+            if not parsed_response and not missing_files:
+                missing_files = [workspace.path(path) for path in self.files]
+            parsed_response["internal_dialogue"] = "The response was cut off; recovered the complete file changes and re-requested the rest."
+            count(salvaged_responses=1)
+            print(f"[INFO] Salvaged {sum(len(entries) for entries in parser.entries.values())} entries of a malformed response for ticket '{self.summary}', re-requesting {missing_files}")
+
+        updated_files = {
+            os.path.normpath(file_path): content
+            for key in ("updated_files", "new_files")
+            for file_path, content in files_by_path(parsed_response.get(key), "content").items()
+            if isinstance(content, str)
+        }
+
+        patched_files, failed_files = apply_file_changes(
+            self.base_files,
+            edits=edits_by_path(parsed_response.get("edits")),
+            patches=parsed_response.get("patches"),
+        )
+        updated_files.update(patched_files)
+
+        if failed_files:
+            print(f"[INFO] Falling back to full file content for {failed_files} on ticket: {self.summary}")
+        retry_files = list(dict.fromkeys(failed_files + missing_files))
+        if retry_files:
+            full_files = self.request_full_files(repo_summary, retry_files)
+            updated_files.update(full_files)
+            # the edits that arrived before a cut would leave the file half-changed
+            for file_path in missing_files:
+                if file_path not in full_files:
+                    updated_files.pop(file_path, None)
+
+        self.updated_files = updated_files
+
+        if write:
+            self.write_updates(workspace)
 
-        # Write updated files to disk
-        updated_files = parsed_response.get("updated_files", {})
-        for file_path, updated_content in updated_files.items():
-            try:
-                os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                with open(file_path, "w", encoding="utf-8") as file:
-                    file.write(updated_content)
-                print(f"Successfully updated {file_path} for ticket: {self.summary}")
-
-            except Exception as e:
-                print(f"Error writing to file {file_path}: {e}")
-        
         internal_dialogue = parsed_response.get("internal_dialogue", "No internal dialogue provided.")
 
         return internal_dialogue
+
+    def build_prompt(self, repo_summary, files_formatted, output_format):
+        instructions = EDITS_INSTRUCTIONS if output_format == "edits" else FULL_FILES_INSTRUCTIONS
+        return (
+            PromptBuilder(TICKET_INSTRUCTIONS + instructions.format())
+            .add_context("REPO SUMMARY", repo_summary)
+            .add_files("FILES TO MODIFY", files_formatted)
+            .add_task("TASK DETAILS", f"- Ticket Summary: {self.summary}\n- Ticket Description: {self.description}")
+            .build()
+        )
+
+    @staticmethod
+    def schema(output_format):
+        return TICKET_EDITS_SCHEMA if output_format == "edits" else TICKET_FULL_FILES_SCHEMA
+
+    def request_full_files(self, repo_summary, file_paths):
+        """Asks for the full content of the given files, used when their patches don't
+        apply or their part of the response was lost. Files that don't exist yet are
+        asked for as new, empty files."""
+        files_formatted = [
+            f"**FILE PATH:** {file_path}\n**CONTENT START**\n{self.base_files.get(file_path, '')}\n**CONTENT END**"
+            for file_path in file_paths
+        ]
+        if not files_formatted:
+            return {}
+
+        response = chatcompletion_stream(self.build_prompt(repo_summary, files_formatted, "full"), use_cache=self.use_cache, schema=self.schema("full"))
+        if not response:
+            print(f"Error: No full-file response generated for ticket '{self.summary}'.")
+            return {}
+
+        parsed = self.extract_json_response(response) or {}
+        return {
+            os.path.normpath(file_path): content
+            for file_path, content in files_by_path(parsed.get("updated_files"), "content").items()
+            if isinstance(content, str)
+        }
+
+    def write_updates(self, workspace):
+        """Writes self.updated_files to the workspace and flushes them to disk, all or nothing."""
+        if not self.updated_files:
+            return
+        try:
+            workspace.write_many(self.updated_files)
+            workspace.flush()
+            for file_path in self.updated_files:
+                print(f"Successfully updated {file_path} for ticket: {self.summary}")
+        except Exception as e:
+            print(f"Error writing updated files for ticket {self.summary}: {e}")
@@ -0,0 +1,145 @@
+import io
+import json
+import os
+import shutil
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+IMAGE_SIZE = 64
+# thresholds on the mean absolute pixel difference (0-1) and dHash Hamming distance
+UNCHANGED_DIFF = float(os.getenv("VISUAL_UNCHANGED_DIFF", "0.01"))
+UNCHANGED_HASH_DISTANCE = int(os.getenv("VISUAL_UNCHANGED_HASH_DISTANCE", "3"))
+REGRESSION_DIFF = float(os.getenv("VISUAL_REGRESSION_DIFF", "0.45"))
+BLANK_STD = 0.01
+
+# name -> (camera position, look-at target); "default" is the scene as loaded
+VIEWPOINTS = {
+    "default": None,
+    "front": ([0, 1.6, 8], [0, 0, 0]),
+    "side": ([12, 3, 0], [0, 0, 0]),
+    "top": ([0, 25, 0.01], [0, 0, 0]),
+}
+
+SET_VIEW_JS = """([position, target]) => {
+    if (typeof camera === 'undefined') return false;
+    camera.position.set(...position);
+    if (typeof controls !== 'undefined' && controls.target) {
+        controls.target.set(...target);
+        controls.update();
+    }
+    camera.lookAt(...target);
+    if (typeof renderer !== 'undefined' && typeof scene !== 'undefined') renderer.render(scene, camera);
+    return true;
+}"""
+
+WAIT_FRAMES_JS = "() => new Promise((resolve) => requestAnimationFrame(() => requestAnimationFrame(resolve)))"
+
+
+def available():
+    return np is not None
+
+
+def capture_viewpoints(page):
+    """Takes a screenshot from each canonical viewpoint of a loaded page.
+
+    The scene is expected to expose `camera` (and optionally `controls`,
+    `renderer`, `scene`) as globals, like the template does; viewpoints other
+    than "default" are skipped when it doesn't.
+    """
+    screenshots = {}
+    for name, view in VIEWPOINTS.items():
+        if view is not None and not page.evaluate(SET_VIEW_JS, list(view)):
+            continue
+        page.evaluate(WAIT_FRAMES_JS)
+        screenshots[name] = page.screenshot()
+    return screenshots
+
+
+def downsample(png, size=IMAGE_SIZE):
+    image = Image.open(io.BytesIO(png)).convert("L").resize((size, size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def dhash(png):
+    """64-bit difference hash: compares each pixel to its right neighbour on a 9x8 thumbnail."""
+    pixels = np.asarray(Image.open(io.BytesIO(png)).convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def fingerprint(screenshots):
+    """Turns {viewpoint: png} into {viewpoint: {"hash", "image"}}, or None if unavailable."""
+    if not screenshots or not available():
+        return None
+    return {
+        name: {"hash": dhash(png), "image": downsample(png)}
+        for name, png in screenshots.items()
+    }
+
+
+def compare(current, baseline):
+    """Compares two fingerprints view by view.
+
+    "unchanged" means every shared view is near-identical. "regression" names
+    a view that went blank, which is never intended. "drastic" names a view
+    that changed beyond REGRESSION_DIFF, which may well be what a ticket asked
+    for, so it is for the evaluator to judge.
+    """
+    views = {}
+    regression = None
+    drastic = None
+    for name in current.keys() & baseline.keys():
+        diff = float(np.mean(np.abs(current[name]["image"] - baseline[name]["image"])))
+        distance = bin(current[name]["hash"] ^ baseline[name]["hash"]).count("1")
+        views[name] = {"diff": diff, "hash_distance": distance}
+
+        became_blank = np.std(current[name]["image"]) < BLANK_STD <= np.std(baseline[name]["image"])
+        if became_blank:
+            regression = regression or f"the '{name}' view renders as a blank screen"
+        elif diff > REGRESSION_DIFF:
+            drastic = drastic or f"the '{name}' view changed drastically (mean pixel difference {diff:.2f})"
+
+    unchanged = bool(views) and all(
+        view["diff"] <= UNCHANGED_DIFF and view["hash_distance"] <= UNCHANGED_HASH_DISTANCE
+        for view in views.values()
+    )
+    return {"unchanged": unchanged, "regression": regression, "drastic": drastic, "views": views}
+
+
+class VisualStore:
+    """Fingerprints of accepted renders by snapshot id, stored next to the repo
+    directory (e.g. static/.product_visual for static/product)."""
+
+    def __init__(self, repo_path):
+        repo_path = os.path.normpath(repo_path)
+        self.root = os.path.join(os.path.dirname(repo_path), f".{os.path.basename(repo_path)}_visual")
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def save(self, name, fingerprints):
+        if not fingerprints:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        np.savez_compressed(
+            os.path.join(self.root, f"{name}.npz"),
+            **{view: data["image"] for view, data in fingerprints.items()},
+        )
+        with open(os.path.join(self.root, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump({view: data["hash"] for view, data in fingerprints.items()}, f)
+
+    def load(self, name):
+        if not available():
+            return None
+        try:
+            with open(os.path.join(self.root, f"{name}.json"), "r", encoding="utf-8") as f:
+                hashes = json.load(f)
+            images = np.load(os.path.join(self.root, f"{name}.npz"))
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            return None
+        return {view: {"hash": hashes[view], "image": images[view]} for view in hashes if view in images}
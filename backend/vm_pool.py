@@ -0,0 +1,351 @@
+import base64
+import hashlib
+import io
+import os
+import re
+import tarfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+try:
+    from . import telemetry
+    from .vm_sync import REMOTE_WORKSPACE, forget
+except:
+    import telemetry
+    from vm_sync import REMOTE_WORKSPACE, forget
+
+POOL_SIZE = int(os.getenv("VM_POOL_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("VM_POOL_MAX_SIZE", "6"))
+POOL_IDLE_SECONDS = int(os.getenv("VM_POOL_IDLE_SECONDS", "600"))
+INSTANCE_TIMEOUT_HOURS = float(os.getenv("VM_INSTANCE_TIMEOUT_HOURS", "1"))
+LEASE_TIMEOUT_SECONDS = int(os.getenv("VM_LEASE_TIMEOUT_SECONDS", "300"))
+# "scrapybara" or "fake" for running offline
+VM_BACKEND = os.getenv("VM_BACKEND", "scrapybara")
+
+
+class FakeInstance:
+    """Stand-in for a Scrapybara Ubuntu instance that keeps files in memory."""
+
+    class _Files:
+        def __init__(self, instance):
+            self.instance = instance
+
+        def write(self, path, content):
+            self.instance.files[path] = content
+
+    def __init__(self, start_latency=0.0, command_latency=0.0):
+        self.id = f"fake-{uuid.uuid4().hex[:8]}"
+        self.files = {}
+        # base64 staged by vm_sync for transfers that span several commands
+        self._staged = {}
+        self.commands = []
+        self.stopped = False
+        self.command_latency = command_latency
+        self.file = FakeInstance._Files(self)
+        time.sleep(start_latency)
+
+    def bash(self, command=None, **kwargs):
+        if self.stopped:
+            raise RuntimeError(f"Instance {self.id} is stopped")
+        time.sleep(self.command_latency)
+        self.commands.append(command)
+        if command and "sha256sum" in command:
+            prefix = f"{REMOTE_WORKSPACE}/"
+            return {"output": "".join(
+                f"{hashlib.sha256(content.encode('utf-8')).hexdigest()}  ./{path[len(prefix):]}\n"
+                for path, content in self.files.items() if path.startswith(prefix)
+            )}
+        if command and ("SYNC_EOF" in command or "echo synced-" in command):
+            return self._sync(command)
+        if command and command.startswith("echo "):
+            return {"output": command[5:].strip("'\"") + "\n"}
+        if command and command.startswith(f"rm -rf {REMOTE_WORKSPACE}"):
+            self.files = {}
+        return {"output": ""}
+
+    def _sync(self, command):
+        """Applies a vm_sync transfer to self.files."""
+        staged = re.match(r"cat >> (\S+) <<'SYNC_EOF'\n(.*)\nSYNC_EOF$", command, re.DOTALL)
+        if staged:
+            self._staged[staged.group(1)] = self._staged.get(staged.group(1), "") + staged.group(2)
+            return {"output": ""}
+        for path in re.findall(r"rm -f -- ([^&]+)", command)[:1]:
+            for relative in path.split():
+                self.files.pop(f"{REMOTE_WORKSPACE}/{relative.strip(chr(39))}", None)
+        inline = re.search(r"\n(.*)\nSYNC_EOF$", command, re.DOTALL)
+        from_file = re.search(r"base64 -d (/tmp/\S+)", command)
+        payload = inline.group(1) if inline else self._staged.pop(from_file.group(1), "") if from_file else ""
+        if payload:
+            with tarfile.open(fileobj=io.BytesIO(base64.b64decode(payload)), mode="r:gz") as tar:
+                for member in tar.getmembers():
+                    self.files[f"{REMOTE_WORKSPACE}/{member.name}"] = tar.extractfile(member).read().decode("utf-8", "replace")
+        token = re.search(r"echo (synced-\w+)", command)
+        return {"output": (token.group(1) + "\n") if token else ""}
+
+    def stop(self):
+        self.stopped = True
+
+
+class FakeScrapybara:
+    """Stand-in for scrapybara.Scrapybara with configurable latencies."""
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, start_latency=0.0, command_latency=0.0, act_latency=0.0, act_text="***RATING START*** 8/10 ***RATING END***"):
+        self.start_latency = start_latency
+        self.command_latency = command_latency
+        self.act_latency = act_latency
+        self.act_text = act_text
+        self.started = 0
+
+    def start_ubuntu(self, timeout_hours=0.2):
+        self.started += 1
+        return FakeInstance(self.start_latency, self.command_latency)
+
+    def act(self, **kwargs):
+        time.sleep(self.act_latency)
+        return FakeScrapybara._Response(self.act_text)
+
+
+class PooledInstance:
+    def __init__(self, instance):
+        self.instance = instance
+        self.started_at = time.time()
+        self.last_used = time.time()
+
+
+class InstancePool:
+    """Keeps `size` Ubuntu instances warm and leases them out one at a time.
+
+    Up to max_size instances exist at once; lease() blocks when all are in use.
+    Leased instances are health-checked, and their workspace is wiped when they
+    come back. Idle instances beyond `size` are stopped after idle_seconds, and
+    every instance is replaced before its Scrapybara timeout runs out.
+    """
+
+    def __init__(self, client=None, size=POOL_SIZE, max_size=POOL_MAX_SIZE, idle_seconds=POOL_IDLE_SECONDS, timeout_hours=INSTANCE_TIMEOUT_HOURS):
+        self.client = client
+        self.size = size
+        self.max_size = max(max_size, size)
+        self.idle_seconds = idle_seconds
+        self.timeout_hours = timeout_hours
+        # leave five minutes of headroom before the instance times out
+        self.max_age = max(timeout_hours * 3600 - 300, timeout_hours * 1800)
+        self._idle = []
+        self._leased = {}
+        self._starting = 0
+        self._condition = threading.Condition()
+        self._reaper = None
+        self._closed = False
+        self.started = 0
+        self.stopped = 0
+        self.leases = 0
+        self.lease_wait_seconds = 0.0
+
+    def _total(self):
+        return len(self._idle) + len(self._leased) + self._starting
+
+    def _start_instance(self):
+        # the caller has counted this instance in self._starting and moves it to
+        # idle or leased under the lock, so the pool never overshoots max_size
+        try:
+            with telemetry.span("vm.start"):
+                return PooledInstance(self.client.start_ubuntu(timeout_hours=self.timeout_hours))
+        except Exception as e:
+            print(f"[ERROR] Failed to start instance: {e}")
+            return None
+
+    def _warm_one(self):
+        pooled = self._start_instance()
+        with self._condition:
+            self._starting -= 1
+            if pooled is not None:
+                self.started += 1
+                self._idle.append(pooled)
+            self._condition.notify_all()
+
+    def refill(self):
+        """Starts instances in the background until `size` are idle or starting."""
+        with self._condition:
+            if self._closed:
+                return
+            missing = min(self.size - len(self._idle) - self._starting, self.max_size - self._total())
+            self._starting += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            threading.Thread(target=self._warm_one, daemon=True).start()
+
+    def start(self):
+        """Pre-warms the pool and starts the idle reaper."""
+        self.refill()
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True)
+            self._reaper.start()
+
+    def _expired(self, pooled):
+        return time.time() - pooled.started_at > self.max_age
+
+    def healthy(self, pooled):
+        try:
+            result = pooled.instance.bash(command="echo ok")
+            return "ok" in (result or {}).get("output", "")
+        except Exception as e:
+            print(f"[WARNING] Instance health check failed: {e}")
+            return False
+
+    def acquire(self, timeout=LEASE_TIMEOUT_SECONDS):
+        started = time.time()
+        deadline = started + timeout
+        while True:
+            pooled = None
+            start_new = False
+            with self._condition:
+                while pooled is None and not start_new:
+                    if self._closed:
+                        raise RuntimeError("Instance pool is shut down")
+                    while self._idle:
+                        candidate = self._idle.pop()
+                        if self._expired(candidate):
+                            self._stop(candidate)
+                            continue
+                        pooled = candidate
+                        # counted as leased while it is health-checked
+                        self._leased[id(pooled.instance)] = pooled
+                        break
+                    if pooled is None:
+                        if self._total() < self.max_size:
+                            self._starting += 1
+                            start_new = True
+                        else:
+                            remaining = deadline - time.time()
+                            if remaining <= 0:
+                                raise TimeoutError(f"No instance available after {timeout}s")
+                            self._condition.wait(remaining)
+
+            if start_new:
+                pooled = self._start_instance()
+                with self._condition:
+                    self._starting -= 1
+                    if pooled is None:
+                        self._condition.notify_all()
+                        raise RuntimeError("Failed to start a new instance")
+                    self.started += 1
+                    self._leased[id(pooled.instance)] = pooled
+            elif not self.healthy(pooled):
+                with self._condition:
+                    self._leased.pop(id(pooled.instance), None)
+                    self._stop(pooled)
+                    self._condition.notify_all()
+                continue
+
+            with self._condition:
+                self.leases += 1
+                self.lease_wait_seconds += time.time() - started
+            telemetry.record("vm.lease_wait", time.time() - started)
+            self.refill()
+            return pooled.instance
+
+    def release(self, instance):
+        with self._condition:
+            # stays counted as leased until its workspace is reset
+            pooled = self._leased.get(id(instance))
+        if pooled is None:
+            return
+
+        # the next lease starts from an empty workspace (or a stopped instance)
+        forget(instance)
+        try:
+            instance.bash(command=f"rm -rf {REMOTE_WORKSPACE} && mkdir -p {REMOTE_WORKSPACE}")
+            reusable = not self._expired(pooled)
+        except Exception as e:
+            print(f"[WARNING] Failed to reset instance workspace: {e}")
+            reusable = False
+
+        with self._condition:
+            self._leased.pop(id(instance), None)
+            if reusable and not self._closed:
+                pooled.last_used = time.time()
+                self._idle.append(pooled)
+            else:
+                self._stop(pooled)
+            self._condition.notify_all()
+        self.refill()
+
+    @contextmanager
+    def lease(self, timeout=LEASE_TIMEOUT_SECONDS):
+        """Yields (client, instance) and gives the instance back afterwards."""
+        instance = self.acquire(timeout)
+        try:
+            yield self.client, instance
+        finally:
+            self.release(instance)
+
+    def _stop(self, pooled):
+        try:
+            pooled.instance.stop()
+        except Exception as e:
+            print(f"[WARNING] Failed to stop instance: {e}")
+        self.stopped += 1
+
+    def reap(self):
+        """Stops idle instances past idle_seconds (keeping `size` warm) and expired ones."""
+        now = time.time()
+        with self._condition:
+            keep = []
+            for pooled in sorted(self._idle, key=lambda p: p.last_used, reverse=True):
+                idle_too_long = now - pooled.last_used > self.idle_seconds and len(keep) >= self.size
+                if idle_too_long or self._expired(pooled):
+                    self._stop(pooled)
+                else:
+                    keep.append(pooled)
+            self._idle = keep
+        self.refill()
+
+    def _reap_loop(self):
+        while not self._closed:
+            time.sleep(30)
+            self.reap()
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            for pooled in self._idle + list(self._leased.values()):
+                self._stop(pooled)
+            self._idle = []
+            self._leased = {}
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "idle": len(self._idle),
+                "leased": len(self._leased),
+                "starting": self._starting,
+                "size": self.size,
+                "max_size": self.max_size,
+                "started": self.started,
+                "stopped": self.stopped,
+                "leases": self.leases,
+                "avg_lease_wait_seconds": self.lease_wait_seconds / self.leases if self.leases else 0.0,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide pool, created (and pre-warmed) on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            if VM_BACKEND == "fake":
+                client = FakeScrapybara()
+            else:
+                import scrapybara
+                client = scrapybara.Scrapybara()
+            _pool = InstancePool(client)
+            _pool.start()
+        return _pool
@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import io
+import os
+import shlex
+import tarfile
+import threading
+import uuid
+try:
+    from . import telemetry
+except:
+    import telemetry
+
+# where a product lives on a leased instance; wiped when the instance goes back to the pool
+REMOTE_WORKSPACE = "~/prototyp3d"
+# base64 sent per bash call, under Linux's 128 KB limit on a single argument;
+# larger transfers are appended to a temp file in several calls
+SYNC_CHUNK_BYTES = int(os.getenv("VM_SYNC_CHUNK_BYTES", str(96 * 1024)))
+
+# instance id -> {relative path: hash} of what we last uploaded there
+_manifests = {}
+# instances whose files may have been changed by someone else since
+_stale = set()
+_lock = threading.Lock()
+
+
+def _instance_key(instance):
+    return getattr(instance, "id", None) or id(instance)
+
+
+def forget(instance):
+    """Drops what we know about the instance's workspace, e.g. after it was wiped."""
+    with _lock:
+        _manifests.pop(_instance_key(instance), None)
+        _stale.discard(_instance_key(instance))
+
+
+def mark_stale(instance):
+    """The next sync() re-reads the remote hashes first, e.g. after an agent had
+    edit access to the instance."""
+    with _lock:
+        _stale.add(_instance_key(instance))
+
+
+def _remote_hashes(instance, remote_root):
+    output = _run(instance, f"mkdir -p {remote_root} && cd {remote_root} && find . -type f -exec sha256sum {{}} +")
+    hashes = {}
+    for line in output.splitlines():
+        digest, _, path = line.partition("  ")
+        if len(digest) == 64 and path.startswith("./"):
+            hashes[path[2:]] = digest
+    return hashes
+
+
+def _local_files(workspace):
+    """{relative path: bytes} of every file in the workspace, dirty ones included."""
+    files = {}
+    for path in workspace.paths():
+        content = workspace.read(path)
+        if content is not None:
+            data = content.encode("utf-8")
+        else:
+            # binary assets aren't held in memory
+            with open(path, "rb") as f:
+                data = f.read()
+        files[workspace.relative(path).replace(os.sep, "/")] = data
+    return files
+
+
+def _archive(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for relative, data in sorted(files.items()):
+            info = tarfile.TarInfo(relative)
+            info.size = len(data)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _run(instance, command):
+    result = instance.bash(command=command) or {}
+    return result.get("output") or ""
+
+
+def sync(instance, workspace, remote_root=REMOTE_WORKSPACE):
+    """Makes remote_root on the instance match the workspace.
+
+    Only files whose hash differs from the last sync to this instance are sent,
+    as one base64 tar.gz; files deleted locally are deleted remotely. Returns
+    {"uploaded", "removed", "unchanged", "bytes"}.
+    """
+    key = _instance_key(instance)
+    files = _local_files(workspace)
+    hashes = {relative: hashlib.sha256(data).hexdigest() for relative, data in files.items()}
+    with _lock:
+        remote = dict(_manifests.get(key, {}))
+        stale = key in _stale
+    if stale:
+        remote = _remote_hashes(instance, remote_root)
+        with _lock:
+            _manifests[key] = remote
+            _stale.discard(key)
+
+    changed = {relative: files[relative] for relative, digest in hashes.items() if remote.get(relative) != digest}
+    removed = sorted(set(remote) - set(hashes))
+    stats = {"uploaded": len(changed), "removed": len(removed), "unchanged": len(hashes) - len(changed), "bytes": 0}
+    if not changed and not removed:
+        return stats
+
+    with telemetry.span("vm.sync", files=len(changed)):
+        token = uuid.uuid4().hex
+        steps = [f"mkdir -p {remote_root}", f"cd {remote_root}"]
+        if removed:
+            steps.append("rm -f -- " + " ".join(shlex.quote(relative) for relative in removed))
+        payload = _archive(changed) if changed else ""
+        stats["bytes"] = len(payload)
+        chunks = [payload[i:i + SYNC_CHUNK_BYTES] for i in range(0, len(payload), SYNC_CHUNK_BYTES)]
+        heredoc = None
+        try:
+            if len(chunks) > 1:
+                # too big for one command: stage it in a temp file first
+                staging = f"/tmp/sync-{token}.b64"
+                for chunk in chunks:
+                    _run(instance, f"cat >> {staging} <<'SYNC_EOF'\n{chunk}\nSYNC_EOF")
+                steps.append(f"base64 -d {staging} | tar -xzf - && rm -f {staging}")
+            elif chunks:
+                steps.append("base64 -d <<'SYNC_EOF' | tar -xzf -")
+                heredoc = chunks[0]
+            command = " && ".join(steps) + f" && echo synced-{token}"
+            if heredoc:
+                command += f"\n{heredoc}\nSYNC_EOF"
+            output = _run(instance, command)
+        except Exception:
+            # the remote state is unknown now, send everything next time
+            forget(instance)
+            raise
+        if f"synced-{token}" not in output:
+            forget(instance)
+            raise RuntimeError(f"Sync to {remote_root} failed: {output.strip()[-500:]}")
+
+    with _lock:
+        _manifests[key] = hashes
+    telemetry.count(vm_sync_files=len(changed), vm_sync_bytes=stats["bytes"])
+    return stats
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import threading
+try:
+    from .patching import write_files_atomically
+except:
+    from patching import write_files_atomically
+
+# files the pipeline reads and edits; anything else in the tree is only tracked
+SOURCE_EXTENSIONS = (".html", ".js", ".css", ".py", ".ts", ".cpp", ".java", ".cs")
+
+
+class WorkspaceFile:
+    def __init__(self, content, size, mtime_ns):
+        self.content = content
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.hash = hashlib.sha256(content.encode("utf-8")).hexdigest() if content is not None else None
+        self.dirty = False
+
+
+class Workspace:
+    """The files of one repo, held in memory and shared by every pipeline stage.
+
+    refresh() walks the tree and only reads files whose size or mtime changed
+    since the last refresh, e.g. after edits in the dev console or a rollback.
+    Stages read through files()/read() and write through write(), which only
+    marks the file dirty; flush() writes all dirty files in one atomic batch.
+    Paths are os.path.join(repo_path, relative path), normalized.
+    """
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._files = {}
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+
+    def path(self, relative):
+        return os.path.normpath(os.path.join(self.repo_path, relative))
+
+    def relative(self, path):
+        return os.path.relpath(path, self.repo_path)
+
+    def refresh(self):
+        """Syncs with the disk; dirty files keep their in-memory content. Returns the paths whose content changed."""
+        changed = []
+        with self._lock:
+            seen = set()
+            for root, _, names in os.walk(self.repo_path):
+                for name in names:
+                    path = os.path.normpath(os.path.join(root, name))
+                    seen.add(path)
+                    entry = self._files.get(path)
+                    if entry is not None and entry.dirty:
+                        continue
+                    stat = os.stat(path)
+                    if entry is not None and entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+                        continue
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            content = f.read()
+                    except UnicodeDecodeError:
+                        # binary assets are tracked but not served
+                        content = None
+                    self.reads += 1
+                    updated = WorkspaceFile(content, stat.st_size, stat.st_mtime_ns)
+                    self._files[path] = updated
+                    # a touched but unchanged file doesn't count as changed
+                    if entry is None or entry.hash != updated.hash or content is None:
+                        changed.append(path)
+            for path in set(self._files) - seen:
+                if not self._files[path].dirty:
+                    del self._files[path]
+        return changed
+
+    def paths(self):
+        with self._lock:
+            return sorted(self._files)
+
+    def files(self, extensions=SOURCE_EXTENSIONS):
+        """{path: content} of the text files with one of the extensions."""
+        with self._lock:
+            return {
+                path: entry.content
+                for path, entry in self._files.items()
+                if entry.content is not None and (extensions is None or path.endswith(extensions))
+            }
+
+    def read(self, path):
+        with self._lock:
+            entry = self._files.get(os.path.normpath(path))
+            return entry.content if entry else None
+
+    def find(self, extension):
+        """The shallowest path with the given extension (the first in sorted order on ties), or None."""
+        matches = [path for path in self.paths() if path.lower().endswith(extension)]
+        return min(matches, key=lambda path: (path.count(os.sep), path), default=None)
+
+    def write(self, path, content):
+        self.write_many({path: content})
+
+    def write_many(self, files):
+        with self._lock:
+            for path, content in files.items():
+                path = os.path.normpath(path)
+                entry = self._files.get(path)
+                if entry is not None and entry.content == content:
+                    continue
+                entry = WorkspaceFile(content, None, None)
+                entry.dirty = True
+                self._files[path] = entry
+
+    def dirty(self):
+        with self._lock:
+            return sorted(path for path, entry in self._files.items() if entry.dirty)
+
+    def flush(self):
+        """Writes every dirty file to disk, all or nothing. Returns the paths written."""
+        with self._lock:
+            dirty = {path: entry.content for path, entry in self._files.items() if entry.dirty}
+            if not dirty:
+                return []
+            try:
+                write_files_atomically(dirty)
+            except Exception:
+                # forget the unwritten content so the next refresh() reloads what is on disk
+                for path in dirty:
+                    del self._files[path]
+                raise
+            for path in dirty:
+                stat = os.stat(path)
+                entry = self._files[path]
+                entry.size = stat.st_size
+                entry.mtime_ns = stat.st_mtime_ns
+                entry.dirty = False
+            self.writes += len(dirty)
+            return sorted(dirty)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "dirty": sum(1 for entry in self._files.values() if entry.dirty),
+                "reads": self.reads,
+                "writes": self.writes,
+            }
@@ -6,6 +6,8 @@ import Preview from '@/components/Preview';
 import Chat from '@/components/Chat';
 import JSZip from 'jszip';
 
+const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:5001';
+
 export default function DevConsole() {
   const [files, setFiles] = useState({});
   const [currentFile, setCurrentFile] = useState('index.html');
@@ -26,7 +28,7 @@ export default function DevConsole() {
   useEffect(() => {
     async function loadFiles() {
       try {
-        const response = await fetch('/api/load');
+        const response = await fetch(`/api/load?project=${encodeURIComponent(projectName)}`);
         if (!response.ok) throw new Error('Failed to load files');
         const loadedFiles = await response.json();
 
@@ -44,7 +46,7 @@ export default function DevConsole() {
 
     const pollInterval = setInterval(async () => {
       try {
-        const response = await fetch('/api/load');
+        const response = await fetch(`/api/load?project=${encodeURIComponent(projectName)}`);
         if (!response.ok) throw new Error('Failed to load files');
         const latestFiles = await response.json();
 
@@ -66,7 +68,7 @@ export default function DevConsole() {
     }, 5000);
 
     return () => clearInterval(pollInterval);
-  }, []);
+  }, [projectName]);
 
   useEffect(() => {
     if (chatContainerRef.current) {
@@ -78,7 +80,7 @@ export default function DevConsole() {
     try {
       if (typeof window === 'undefined') return;
 
-      const response = await fetch('/api/save', {
+      const response = await fetch(`/api/save?project=${encodeURIComponent(projectName)}`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -97,7 +99,7 @@ export default function DevConsole() {
     } catch (error) {
       console.error('Error saving files:', error);
     }
-  }, [files]);
+  }, [files, projectName]);
 
   const handleSendMessage = async () => {
     const response = await fetch('/prototype', {
@@ -140,6 +142,16 @@ export default function DevConsole() {
         previewRef.current.innerHTML = '';
         previewRef.current.appendChild(iframe);
 
+        // the backend serves the bundled build, rebuilt from the saved files
+        await saveFiles();
+        const previewUrl = `${BACKEND_URL}/prototype/preview/${encodeURIComponent(projectName || 'default')}/`;
+        const preview = await fetch(previewUrl, { method: 'HEAD' }).catch(() => null);
+        if (preview && preview.ok) {
+          iframe.src = `${previewUrl}?t=${Date.now()}`;
+          return;
+        }
+
+        // no generated prototype for this project yet, render the raw sources
         const baseUrl = '/static/product/';
 
         let htmlContent = files['index.html']
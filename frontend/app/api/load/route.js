@@ -1,10 +1,11 @@
 import { readFile } from 'fs/promises';
 import { join } from 'path';
 import { NextResponse } from 'next/server';
+import { projectDir } from '../projectDir';
 
-export async function GET() {
+export async function GET(request) {
   try {
-    const templateDir = join(process.cwd(), 'static/product/');
+    const templateDir = projectDir(request);
 
     const fs = require('fs');
     fs.accessSync(templateDir, fs.constants.F_OK);
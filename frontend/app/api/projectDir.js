@@ -0,0 +1,13 @@
+import { join } from 'path';
+
+// Mirrors backend/sessions.py: the unnamed project lives in static/product,
+// named projects get their own workspace under static/sessions.
+export function projectDir(request) {
+  const project = new URL(request.url).searchParams.get('project');
+  const slug = (project || '').replace(/[^A-Za-z0-9_-]+/g, '_').replace(/^_+|_+$/g, '');
+
+  if (!slug || slug === 'default') {
+    return join(process.cwd(), 'static/product/');
+  }
+  return join(process.cwd(), 'static/sessions', slug, 'product/');
+}
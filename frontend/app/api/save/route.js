@@ -2,11 +2,12 @@
 import { writeFile } from 'fs/promises';
 import { join } from 'path';
 import { NextResponse } from 'next/server';
+import { projectDir } from '../projectDir';
 
 export async function POST(request) {
   try {
     const files = await request.json();
-    const templateDir = join(process.cwd(), 'static/product/');
+    const templateDir = projectDir(request);
     console.log(templateDir);
     
     await Promise.all(
@@ -36,17 +36,26 @@ const Chat = ({ projectName }) => {
   const startSSE = () => {
     if (eventSourceRef.current) return;
 
-    const source = new EventSource(`${BACKEND_URL}/prototype/progress`);
+    const source = new EventSource(`${BACKEND_URL}/prototype/progress?project=${encodeURIComponent(projectName || 'default')}`);
 
     source.onmessage = (event) => {
       const data = JSON.parse(event.data);
-      setChatMessages(prev => [
-        ...prev,
-        {
-          role: 'assistant',
-          content: data.message,
+      setChatMessages(prev => {
+        // streamed ticket output is appended to the message it continues
+        const last = prev[prev.length - 1];
+        if (data.type === 'ticket_progress' && last?.streamType === 'ticket_progress' && last.ticket === data.ticket) {
+          return [...prev.slice(0, -1), { ...last, content: last.content + data.message }];
         }
-      ]);
+        return [
+          ...prev,
+          {
+            role: 'assistant',
+            content: data.message,
+            streamType: data.type,
+            ticket: data.ticket,
+          }
+        ];
+      });
 
       if (chatContainerRef.current) {
         chatContainerRef.current.scrollTop = chatContainerRef.current.scrollHeight;
@@ -68,6 +77,18 @@ const Chat = ({ projectName }) => {
     }
   };
 
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`${BACKEND_URL}/jobs/${jobId}/result`, {
+        headers: { 'Accept': 'application/json' }
+      });
+      if (response.status !== 202) {
+        return response.json();
+      }
+      await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+  };
+
   const handleSendMessage = async () => {
     if (!inputMessage.trim()) return;
 
@@ -79,8 +100,6 @@ const Chat = ({ projectName }) => {
     setIsLoading(true);
 
     try {
-      startSSE();
-
       const endpoint = hasCreatedPrototype ? 'iterate' : 'create';
       const response = await fetch(`${BACKEND_URL}/prototype/${endpoint}`, {
         method: 'POST',
@@ -102,7 +121,13 @@ const Chat = ({ projectName }) => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
+      // the project's progress channel exists once the job was accepted;
+      // it replays what was sent before we subscribed
+      startSSE();
+
+      // the backend runs the pipeline as a job, wait for its result
+      const { job_id } = await response.json();
+      const data = await waitForJob(job_id);
 
       if (data.error) {
         setChatMessages(prev => [...prev, {